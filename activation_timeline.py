@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Banner Activation Timeline - Naebak Project
+
+This module keeps the set of banners that are live right now. Every banner's
+upcoming start, end and schedule-window transitions are kept in a min-heap; a
+background thread sleeps until the earliest one, re-evaluates only the banners
+whose transition is due and swaps in a new live set. The serving path reads that
+set and never does date arithmetic.
+"""
+
+import hashlib
+import heapq
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# The activation rules of one banner. schedules holds CompiledSchedule objects;
+# when it is empty the banner is not restricted to schedule windows.
+BannerWindow = namedtuple('BannerWindow', ['banner_id', 'enabled', 'start_date', 'end_date', 'schedules'])
+
+
+def is_live(window: BannerWindow, now: datetime) -> bool:
+    """
+    Evaluates a banner's activation rules at an instant.
+
+    Args:
+        window (BannerWindow): The banner's rules.
+        now (datetime): The naive UTC instant.
+
+    Returns:
+        bool: Whether the banner should be served.
+    """
+    if not window.enabled:
+        return False
+    if window.start_date and now < window.start_date:
+        return False
+    if window.end_date and now > window.end_date:
+        return False
+    if window.schedules:
+        return any(schedule.is_active_at(now) for schedule in window.schedules)
+    return True
+
+
+def next_change(window: BannerWindow, now: datetime) -> Optional[datetime]:
+    """
+    Returns the next instant at which a banner's rules may change its state.
+
+    Args:
+        window (BannerWindow): The banner's rules.
+        now (datetime): The naive UTC instant.
+
+    Returns:
+        Optional[datetime]: The next candidate transition, or None if there is none.
+    """
+    if not window.enabled:
+        return None
+    if window.end_date and now > window.end_date:
+        return None
+
+    candidates = []
+    if window.start_date and now < window.start_date:
+        candidates.append(window.start_date)
+    if window.end_date:
+        # end_date itself is still live, so the banner goes dark just after it
+        candidates.append(window.end_date + timedelta(microseconds=1))
+    for schedule in window.schedules:
+        transition = schedule.next_transition(now)
+        if transition is not None:
+            candidates.append(transition)
+    return min(candidates) if candidates else None
+
+
+class ActivationTimeline:
+    """
+    Min-heap timeline of banner activation transitions and the resulting live set.
+
+    The live set is an immutable frozenset replaced on every change, so readers
+    need no lock. Each heap entry carries the banner's version, so entries made
+    stale by an update or removal are skipped instead of searched for.
+
+    The background thread computes its sleep from the wall clock on every
+    iteration and processes every transition that is due when it wakes, so a
+    late wake-up or clock adjustment is corrected on the next pass. A full
+    reload every resync_interval seconds picks up changes made by other
+    processes.
+
+    Attributes:
+        loader (Optional[Callable]): Returns BannerWindow objects, all of them when
+            called with None or only those for the given banner IDs.
+        resync_interval (float): Seconds between full reloads.
+        max_sleep (float): The longest the thread sleeps without re-checking.
+        transitions (int): The number of transitions processed.
+        max_lag (float): The largest delay, in seconds, between a transition and its processing.
+        version (int): Incremented whenever the live set changes.
+        live_digest (str): A hash of the live set, equal across processes that
+            see the same live banners.
+    """
+
+    def __init__(self, loader: Optional[Callable] = None, resync_interval: float = 300,
+                 max_sleep: float = 30, clock: Callable[[], datetime] = datetime.utcnow):
+        """
+        Initialize the timeline.
+
+        Args:
+            loader (Optional[Callable]): Loads BannerWindow objects from storage.
+            resync_interval (float): Seconds between full reloads.
+            max_sleep (float): The longest sleep between checks, in seconds.
+            clock (Callable[[], datetime]): Returns the current naive UTC time.
+        """
+        self.loader = loader
+        self.resync_interval = resync_interval
+        self.max_sleep = max_sleep
+        self.clock = clock
+        self._windows: Dict[int, BannerWindow] = {}
+        self._versions: Dict[int, int] = {}
+        self._heap: List[tuple] = []
+        self._live: FrozenSet[int] = frozenset()
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_resync = None
+        self.transitions = 0
+        self.max_lag = 0.0
+        self.version = 0
+        self.live_digest = self._digest(self._live)
+
+    @property
+    def running(self) -> bool:
+        """Whether the background thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def live_ids(self) -> FrozenSet[int]:
+        """The IDs of the banners that are live now."""
+        return self._live
+
+    def is_live(self, banner_id: int) -> bool:
+        """Whether a banner is in the live set."""
+        return banner_id in self._live
+
+    def rebuild(self, windows: Iterable[BannerWindow]):
+        """
+        Replaces all banners and recomputes the live set.
+
+        Args:
+            windows (Iterable[BannerWindow]): The rules of every banner.
+        """
+        now = self.clock()
+        with self._lock:
+            self._windows = {}
+            self._versions = {}
+            self._heap = []
+            live = set()
+            for window in windows:
+                self._store(window, now)
+                if is_live(window, now):
+                    live.add(window.banner_id)
+            heapq.heapify(self._heap)
+            self._replace_live(frozenset(live))
+            self._last_resync = now
+        self._wake.set()
+
+    def upsert(self, window: BannerWindow):
+        """
+        Adds or updates one banner.
+
+        Args:
+            window (BannerWindow): The banner's rules.
+        """
+        now = self.clock()
+        with self._lock:
+            self._store(window, now, push=True)
+            self._set_live(window.banner_id, is_live(window, now))
+        self._wake.set()
+
+    def remove(self, banner_id: int):
+        """
+        Removes a banner from the timeline and the live set.
+
+        Args:
+            banner_id (int): The banner ID.
+        """
+        with self._lock:
+            self._windows.pop(banner_id, None)
+            self._versions[banner_id] = self._versions.get(banner_id, 0) + 1
+            self._set_live(banner_id, False)
+
+    def mark_dirty(self, banner_id: int):
+        """
+        Schedules a banner to be reloaded by the background thread.
+
+        Args:
+            banner_id (int): The banner ID.
+        """
+        with self._lock:
+            self._dirty.add(banner_id)
+        self._wake.set()
+
+    def advance(self, now: Optional[datetime] = None) -> int:
+        """
+        Processes every transition that is due.
+
+        Args:
+            now (Optional[datetime]): The naive UTC instant. Defaults to the clock.
+
+        Returns:
+            int: The number of banners re-evaluated.
+        """
+        now = now or self.clock()
+        processed = 0
+        with self._lock:
+            live = None
+            while self._heap and self._heap[0][0] <= now:
+                when, banner_id, version = heapq.heappop(self._heap)
+                if self._versions.get(banner_id) != version:
+                    continue
+                window = self._windows[banner_id]
+                if live is None:
+                    live = set(self._live)
+                if is_live(window, now):
+                    live.add(banner_id)
+                else:
+                    live.discard(banner_id)
+                self._push(window, now)
+                self.max_lag = max(self.max_lag, (now - when).total_seconds())
+                processed += 1
+            if live is not None:
+                self._replace_live(frozenset(live))
+            self.transitions += processed
+        return processed
+
+    def next_wakeup(self) -> Optional[datetime]:
+        """The time of the earliest pending transition."""
+        with self._lock:
+            while self._heap and self._versions.get(self._heap[0][1]) != self._heap[0][2]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def reload(self, banner_ids: Optional[Iterable[int]] = None):
+        """
+        Reloads banners from the loader.
+
+        Args:
+            banner_ids (Optional[Iterable[int]]): The banners to reload, or None for all.
+        """
+        if self.loader is None:
+            return
+        if banner_ids is None:
+            self.rebuild(self.loader(None))
+            return
+
+        banner_ids = set(banner_ids)
+        found = set()
+        for window in self.loader(banner_ids):
+            found.add(window.banner_id)
+            self.upsert(window)
+        for banner_id in banner_ids - found:
+            self.remove(banner_id)
+
+    def start(self):
+        """Loads all banners and starts the background thread."""
+        if self.running:
+            return
+        self.reload()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='activation-timeline', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread."""
+        self._stop.set()
+        self._wake.set()
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        Returns timeline counters for monitoring.
+
+        Returns:
+            Dict[str, object]: Banner, live and pending transition counts and lag.
+        """
+        next_wakeup = self.next_wakeup()
+        return {
+            'banners': len(self._windows),
+            'live': len(self._live),
+            'live_version': self.version,
+            'pending_transitions': len(self._heap),
+            'next_transition': next_wakeup.isoformat() if next_wakeup else None,
+            'transitions': self.transitions,
+            'max_lag_seconds': round(self.max_lag, 3)
+        }
+
+    def _store(self, window: BannerWindow, now: datetime, push: bool = False):
+        banner_id = window.banner_id
+        self._windows[banner_id] = window
+        self._versions[banner_id] = self._versions.get(banner_id, 0) + 1
+        when = next_change(window, now)
+        if when is not None:
+            entry = (when, banner_id, self._versions[banner_id])
+            if push:
+                heapq.heappush(self._heap, entry)
+            else:
+                self._heap.append(entry)
+
+    def _push(self, window: BannerWindow, now: datetime):
+        when = next_change(window, now)
+        if when is not None:
+            heapq.heappush(self._heap, (when, window.banner_id, self._versions[window.banner_id]))
+
+    def _set_live(self, banner_id: int, live: bool):
+        if live and banner_id not in self._live:
+            self._replace_live(self._live | {banner_id})
+        elif not live and banner_id in self._live:
+            self._replace_live(self._live - {banner_id})
+
+    def _replace_live(self, live: FrozenSet[int]):
+        if live != self._live:
+            self.live_digest = self._digest(live)
+            self._live = live
+            self.version += 1
+
+    @staticmethod
+    def _digest(live: FrozenSet[int]) -> str:
+        return hashlib.blake2b(','.join(map(str, sorted(live))).encode(), digest_size=8).hexdigest()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                with self._lock:
+                    dirty, self._dirty = self._dirty, set()
+                if dirty:
+                    self.reload(dirty)
+
+                now = self.clock()
+                if self._last_resync and (now - self._last_resync).total_seconds() >= self.resync_interval:
+                    self.reload()
+                self.advance()
+            except Exception as e:
+                logger.error(f"Error advancing activation timeline: {str(e)}")
+
+            # Sleep until the next transition, measured against the wall clock
+            # each pass so oversleeping or clock changes are corrected
+            timeout = self.max_sleep
+            next_wakeup = self.next_wakeup()
+            if next_wakeup is not None:
+                timeout = min(timeout, max((next_wakeup - self.clock()).total_seconds(), 0))
+            self._wake.wait(timeout)
@@ -14,6 +14,7 @@ from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from werkzeug.utils import secure_filename
+from sqlalchemy import create_engine
 from datetime import datetime, timedelta
 import os
 import logging
@@ -21,6 +22,13 @@ from functools import wraps
 
 from config import get_config
 from models import BannerService, BannerData, BannerStats
+from event_pipeline import BannerEventPipeline, make_engine_writer
+from image_jobs import ImageJobQueue
+from image_store import ContentStore, is_content_addressed
+from image_validation import UploadTooLarge
+from json_provider import dumps_bytes, init_json, json_response
+from conditional import conditional, is_not_modified, make_etag, not_modified
+from placement_cache import compute_etag
 import constants
 
 # Create Flask application
@@ -28,6 +36,9 @@ app = Flask(__name__)
 config = get_config()
 app.config.from_object(config)
 
+# Serialize JSON responses with orjson
+init_json(app)
+
 # Setup CORS
 CORS(app, origins=app.config['CORS_ALLOWED_ORIGINS'])
 
@@ -45,12 +56,63 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Database engine for analytics events and statistics
+engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+
 # Create banner service instance
-banner_service = BannerService(app.config)
+banner_service = BannerService(app.config, engine=engine)
+
+# Create the asynchronous click event pipeline
+click_pipeline = BannerEventPipeline(
+    writer=make_engine_writer(engine),
+    max_queue_size=app.config['EVENT_QUEUE_SIZE'],
+    batch_size=app.config['EVENT_BATCH_SIZE'],
+    flush_interval=app.config['EVENT_FLUSH_INTERVAL'],
+    ip_salt=app.config['SECRET_KEY']
+)
+click_pipeline.start()
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Create the content-addressed image store
+image_store = ContentStore(app.config['UPLOAD_FOLDER'])
+
+# Create the background image processing queue
+image_jobs = ImageJobQueue(
+    staging_folder=app.config['UPLOAD_STAGING_FOLDER'],
+    output_folder=app.config['UPLOAD_FOLDER'],
+    max_workers=app.config['IMAGE_WORKERS'],
+    settings={
+        'IMAGE_OPTIMIZATION': app.config['IMAGE_OPTIMIZATION'],
+        'AUTO_RESIZE': app.config['AUTO_RESIZE'],
+        'QUALITY_COMPRESSION': app.config['QUALITY_COMPRESSION']
+    }
+)
+
+# Static reference data is serialized once; its endpoints only send the bytes
+STATIC_RESPONSES = {}
+for _name, _data in (('types', constants.BANNER_TYPES),
+                     ('positions', constants.BANNER_POSITIONS),
+                     ('categories', constants.BANNER_CATEGORIES)):
+    _body = dumps_bytes(_data)
+    STATIC_RESPONSES[_name] = (_body, compute_etag(_body))
+
+def static_response(name):
+    """
+    Send a pre-rendered static JSON response, or a 304 if the client's copy is current.
+    
+    Args:
+        name (str): The key in STATIC_RESPONSES.
+    
+    Returns:
+        The JSON response with a strong ETag, or an empty 304 response.
+    """
+    body, etag = STATIC_RESPONSES[name]
+    if is_not_modified(etag):
+        return not_modified(etag)
+    return json_response(body, headers={'ETag': etag})
+
 def require_auth(f):
     """
     Decorator to require authentication for protected endpoints.
@@ -104,6 +166,13 @@ def get_banners():
         category (str, optional): Filter by banner category (e.g., 'informational', 'promotional').
         governorate (str, optional): Filter by target governorate.
         status (str, optional): Filter by banner status (default: 'active').
+        width (int, optional): Rendered width in device pixels, used to pick the image rendition.
+    
+    Supports conditional GET: the ETag is derived from the banner fields that go
+    into the response, so an unchanged result is answered with 304 before it is
+    encoded, and any edit changes the tag. No Last-Modified is sent, as banners
+    carry no reliable update time and one leaving the result set would not
+    advance it.
     
     Returns:
         JSON response containing:
@@ -117,6 +186,8 @@ def get_banners():
         category = request.args.get('category')
         governorate = request.args.get('governorate')
         status = request.args.get('status', 'active')
+        width = request.args.get('width', type=int)
+        accept_webp = 'image/webp' in request.headers.get('Accept', '')
         
         # Get banners using the service
         banners = banner_service.get_active_banners(
@@ -125,10 +196,23 @@ def get_banners():
             governorate=governorate
         )
         
-        # Convert to dictionaries for JSON response
-        banners_data = [banner.to_dict() for banner in banners]
+        # Convert to dictionaries for JSON response, serving the smallest adequate rendition
+        banners_data = []
+        for banner in banners:
+            banner_dict = banner.to_dict()
+            rendition = banner.pick_rendition(width, accept_webp)
+            if rendition:
+                banner_dict['image_url'] = rendition['url']
+            banners_data.append(banner_dict)
         
-        return jsonify({
+        # Validator from the response content, checked before JSON encoding
+        etag = make_etag(banners_data, position, category, governorate, status)
+        if is_not_modified(etag):
+            response = not_modified(etag)
+            response.vary.add('Accept')
+            return response
+        
+        response = json_response(dumps_bytes({
             "banners": banners_data,
             "total": len(banners_data),
             "filters": {
@@ -137,7 +221,9 @@ def get_banners():
                 "governorate": governorate,
                 "status": status
             }
-        }), 200
+        }))
+        response.vary.add('Accept')
+        return conditional(response, etag)
         
     except Exception as e:
         logger.error(f"Error retrieving banners: {str(e)}")
@@ -184,8 +270,11 @@ def create_banner():
     """
     Create a new banner with image upload.
     
-    This endpoint handles the creation of new banners, including image upload,
-    validation, and processing. It requires authentication and has strict rate limiting
+    This endpoint handles the creation of new banners, including image upload
+    and validation. The upload is stored under its content digest and processed on
+    a worker process, so the request returns 202 with a job ID that can be polled
+    for completion. Re-uploads of an already processed image skip processing and
+    return 201 immediately. It requires authentication and has strict rate limiting
     to prevent abuse.
     
     Form Data:
@@ -201,7 +290,7 @@ def create_banner():
         governorate (str, optional): Target governorate.
     
     Returns:
-        JSON response with the created banner data and image information.
+        JSON response with the created banner data and the image processing job.
     """
     try:
         # Check for image file
@@ -234,30 +323,79 @@ def create_banner():
         if validation_errors:
             return jsonify({"errors": validation_errors}), 400
         
-        # Process the image
-        image_info = banner_service.process_image(file, banner_data.banner_type)
+        extension = os.path.splitext(secure_filename(file.filename))[1].lower()
         
-        # Save the file
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        # Update image URL
-        banner_data.image_url = f"/uploads/banners/{filename}"
+        # Store the upload under its digest, hashing it while it streams to disk
+        try:
+            image_hash, _ = image_store.put_stream(file.stream, extension)
+        except UploadTooLarge:
+            return jsonify({"error": constants.VALIDATION_MESSAGES['FILE_TOO_LARGE']}), 413
+        banner_data.image_hash = image_hash
         
         # In a real application, this would save to database
         banner_data.id = 123  # Sample ID
         
+        def publish(image_result):
+            # Publish the banner once its image has been processed
+            banner_data.image_url = f"/uploads/banners/{image_result['filename']}"
+            banner_data.renditions = [
+                dict(rendition, url=f"/uploads/banners/{rendition['filename']}")
+                for rendition in image_result['renditions']
+            ]
+            banner_service.index_banner(banner_data)
+        
+        # Re-uploads of an already processed image need no processing
+        image_result = image_store.load_manifest(image_hash, banner_data.banner_type)
+        if image_result:
+            publish(image_result)
+            return jsonify({
+                "message": "تم إنشاء البنر بنجاح",
+                "banner": banner_data.to_dict(),
+                "image_info": image_result
+            }), 201
+        
+        def on_image_ready(job):
+            image_store.save_manifest(image_hash, banner_data.banner_type, job['result'])
+            publish(job['result'])
+        
+        # Process the stored upload on a worker process
+        job_id = image_jobs.submit_path(
+            image_store.path(image_hash, extension),
+            banner_data.banner_type,
+            on_complete=on_image_ready
+        )
+        
         return jsonify({
-            "message": "تم إنشاء البنر بنجاح",
+            "message": "تم استلام البنر وجاري معالجة الصورة",
             "banner": banner_data.to_dict(),
-            "image_info": image_info.to_dict()
-        }), 201
+            "job_id": job_id,
+            "status_url": f"/api/banners/jobs/{job_id}"
+        }), 202
         
     except Exception as e:
         logger.error(f"Error creating banner: {str(e)}")
         return jsonify({"error": "خطأ في إنشاء البنر"}), 500
 
+@app.route('/api/banners/jobs/<job_id>', methods=['GET'])
+@limiter.limit("120 per minute")
+def get_image_job(job_id):
+    """
+    Retrieve the status of a banner image processing job.
+    
+    Clients poll this endpoint after creating a banner until the job is
+    completed (the image information is then included) or failed.
+    
+    Args:
+        job_id (str): The job ID returned by the create banner endpoint.
+    
+    Returns:
+        JSON response with the job status, or 404 if the job is unknown.
+    """
+    job = image_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "المهمة غير موجودة"}), 404
+    return jsonify(job), 200
+
 @app.route('/api/banners/<int:banner_id>/click', methods=['POST'])
 @limiter.limit("100 per minute")
 def track_banner_click(banner_id):
@@ -266,6 +404,8 @@ def track_banner_click(banner_id):
     
     This endpoint is called when a user clicks on a banner. It records
     the click event along with metadata for analytics and optimization.
+    The event is queued for the background writer, so the response does not
+    wait for the database.
     
     Args:
         banner_id (int): The ID of the banner that was clicked.
@@ -274,21 +414,21 @@ def track_banner_click(banner_id):
         JSON response confirming the click was recorded.
     """
     try:
-        # Record the click
-        click_data = {
-            "banner_id": banner_id,
-            "timestamp": datetime.now().isoformat(),
-            "user_agent": request.headers.get('User-Agent', ''),
-            "ip_address": request.remote_addr,
-            "referrer": request.headers.get('Referer', '')
-        }
+        # Queue the click for the background writer
+        queued = click_pipeline.enqueue_click(
+            banner_id,
+            user_agent=request.headers.get('User-Agent', ''),
+            ip_address=request.remote_addr,
+            referrer=request.headers.get('Referer', '')
+        )
         
-        # In a real application, this would save to database
-        logger.info(f"Recorded click on banner {banner_id}")
+        if not queued:
+            logger.debug(f"Click event queue full, dropped click on banner {banner_id}")
         
         return jsonify({
             "message": "تم تسجيل النقرة بنجاح",
-            "banner_id": banner_id
+            "banner_id": banner_id,
+            "queued": queued
         }), 200
         
     except Exception as e:
@@ -330,9 +470,10 @@ def get_banner_types():
     to populate banner type selection dropdowns.
     
     Returns:
-        JSON response with available banner types.
+        Pre-rendered JSON response with available banner types, with a content-hash ETag
+        for conditional GET.
     """
-    return jsonify(constants.BANNER_TYPES), 200
+    return static_response('types')
 
 @app.route('/api/banners/positions', methods=['GET'])
 def get_banner_positions():
@@ -344,9 +485,10 @@ def get_banner_positions():
     to configure banner placement.
     
     Returns:
-        JSON response with available banner positions.
+        Pre-rendered JSON response with available banner positions, with a content-hash ETag
+        for conditional GET.
     """
-    return jsonify(constants.BANNER_POSITIONS), 200
+    return static_response('positions')
 
 @app.route('/api/banners/categories', methods=['GET'])
 def get_banner_categories():
@@ -357,25 +499,33 @@ def get_banner_categories():
     content classification and filtering purposes.
     
     Returns:
-        JSON response with available banner categories.
+        Pre-rendered JSON response with available banner categories, with a content-hash ETag
+        for conditional GET.
     """
-    return jsonify(constants.BANNER_CATEGORIES), 200
+    return static_response('categories')
 
-@app.route('/uploads/banners/<filename>')
+@app.route('/uploads/banners/<path:filename>')
 def uploaded_file(filename):
     """
     Serve uploaded banner image files.
     
     This endpoint serves the uploaded banner images to the frontend.
-    It handles the static file serving for banner images.
+    Files from the content-addressed store never change, so they are
+    served with a one-year immutable Cache-Control header.
     
     Args:
-        filename (str): The name of the image file to serve.
+        filename (str): The path of the image file to serve.
     
     Returns:
         The requested image file.
     """
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    if not is_content_addressed(filename):
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/api/banners/recommendations', methods=['GET'])
 @limiter.limit("20 per minute")
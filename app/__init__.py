@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+حزمة تطبيق خدمة البنرات - مشروع نائبك
+
+تجعل هذه الحزمة app.models و app.services قابلة للاستيراد من جذر المستودع.
+"""
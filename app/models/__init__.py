@@ -11,7 +11,8 @@ from .models import (
     UserBanner,
     PageBanner,
     BannerPermission,
-    BannerSettings
+    BannerSettings,
+    BANNER_LISTING_ORDER
 )
 
 __all__ = [
@@ -24,5 +25,6 @@ __all__ = [
     'UserBanner',
     'PageBanner',
     'BannerPermission',
-    'BannerSettings'
+    'BannerSettings',
+    'BANNER_LISTING_ORDER'
 ]
@@ -3,11 +3,23 @@
 Flask + SQLite Models
 """
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime, timedelta
 import json
 
+from banner_serializer import (
+    banner_to_dict, is_within_dates, parse_metadata, position_to_dict, type_to_dict
+)
+from schedule_compiler import schedule_cache
+from serving_indexes import banner_serving_indexes
+
 db = SQLAlchemy()
 
+# القيم التي تحل محل NULL في ترتيب قائمة البنرات (priority و created_at يقبلان NULL)،
+# وتُستخدم نفسها في الفهرس وفي ترقيم الصفحات بالمؤشر كي لا تُسقط المقارنات الصفوف الفارغة
+LISTING_NULL_PRIORITY = 1
+LISTING_NULL_CREATED_AT = datetime(1970, 1, 1)
+
 
 class BannerType(db.Model):
     """أنواع البانرات"""
@@ -31,19 +43,7 @@ class BannerType(db.Model):
         return f'<BannerType {self.name}>'
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'name_en': self.name_en,
-            'description': self.description,
-            'icon': self.icon,
-            'color': self.color,
-            'priority': self.priority,
-            'is_active': self.is_active,
-            'banners_count': len(self.banners),
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+        return type_to_dict(self, len(self.banners))
 
 
 class BannerPosition(db.Model):
@@ -68,19 +68,7 @@ class BannerPosition(db.Model):
         return f'<BannerPosition {self.name}>'
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'name_en': self.name_en,
-            'description': self.description,
-            'css_class': self.css_class,
-            'max_banners': self.max_banners,
-            'display_order': self.display_order,
-            'is_active': self.is_active,
-            'active_banners_count': len([b for b in self.banners if b.is_active]),
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+        return position_to_dict(self, len([b for b in self.banners if b.is_active]))
 
 
 class Banner(db.Model):
@@ -120,7 +108,7 @@ class Banner(db.Model):
     # البيانات الإضافية
     custom_css = db.Column(db.Text)
     custom_js = db.Column(db.Text)
-    metadata = db.Column(db.Text)  # JSON data
+    metadata_json = db.Column('metadata', db.Text)  # JSON data
     
     # التتبع
     view_count = db.Column(db.Integer, default=0)
@@ -135,87 +123,61 @@ class Banner(db.Model):
     schedules = db.relationship('BannerSchedule', backref='banner', lazy=True, cascade='all, delete-orphan')
     stats = db.relationship('BannerStats', backref='banner', lazy=True, cascade='all, delete-orphan')
     
+    # فهرس مركب بترتيب القائمة نفسه لترقيم الصفحات بالمؤشر، وفهارس استعلامات العرض
+    __table_args__ = (
+        db.Index('ix_banners_listing', db.func.coalesce(priority, LISTING_NULL_PRIORITY).asc(),
+                 db.func.coalesce(created_at, LISTING_NULL_CREATED_AT).desc(), id.desc()),
+        *banner_serving_indexes(),
+    )
+    
     def __repr__(self):
         return f'<Banner {self.title}>'
     
     def is_active_now(self):
-        """التحقق من نشاط البانر الآن"""
-        now = datetime.utcnow()
-        
-        # التحقق من الحالة الأساسية
-        if not self.is_active or not self.is_published:
-            return False
-        
-        # التحقق من التاريخ
-        if self.start_date and now < self.start_date:
-            return False
-        
-        if self.end_date and now > self.end_date:
-            return False
+        """التحقق من نشاط البانر الآن (من المجموعة الحية للخط الزمني إن كان يعمل)"""
+        from app.services.activation import activation_timeline
+        if activation_timeline.running:
+            return activation_timeline.is_live(self.id)
         
-        return True
+        # التحقق من الحالة الأساسية والتاريخ
+        return is_within_dates(self, datetime.utcnow())
     
     def get_metadata(self):
         """الحصول على البيانات الإضافية"""
-        if self.metadata:
-            try:
-                return json.loads(self.metadata)
-            except:
-                return {}
-        return {}
+        return parse_metadata(self.metadata_json)
     
     def set_metadata(self, data):
         """تعيين البيانات الإضافية"""
-        self.metadata = json.dumps(data, ensure_ascii=False)
+        self.metadata_json = json.dumps(data, ensure_ascii=False)
     
     def increment_view_count(self):
-        """زيادة عدد المشاهدات"""
-        self.view_count += 1
-        db.session.commit()
+        """زيادة عدد المشاهدات (تُجمَّع وتُكتب دفعة واحدة)"""
+        from app.services.view_counter import impression_counter
+        impression_counter.record_view(self.id)
     
     def increment_click_count(self):
-        """زيادة عدد النقرات"""
-        self.click_count += 1
-        db.session.commit()
+        """زيادة عدد النقرات (تُجمَّع وتُكتب دفعة واحدة)"""
+        from app.services.view_counter import impression_counter
+        impression_counter.record_click(self.id)
     
     def to_dict(self, include_stats=False):
-        data = {
-            'id': self.id,
-            'title': self.title,
-            'title_en': self.title_en,
-            'content': self.content,
-            'content_en': self.content_en,
-            'image_url': self.image_url,
-            'link_url': self.link_url,
-            'link_text': self.link_text,
-            'link_target': self.link_target,
-            'type': self.banner_type.to_dict() if self.banner_type else None,
-            'position': self.banner_position.to_dict() if self.banner_position else None,
-            'priority': self.priority,
-            'start_date': self.start_date.isoformat() if self.start_date else None,
-            'end_date': self.end_date.isoformat() if self.end_date else None,
-            'is_active': self.is_active,
-            'is_published': self.is_published,
-            'is_active_now': self.is_active_now(),
-            'show_close_button': self.show_close_button,
-            'auto_hide_after': self.auto_hide_after,
-            'animation_type': self.animation_type,
-            'custom_css': self.custom_css,
-            'custom_js': self.custom_js,
-            'metadata': self.get_metadata(),
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'published_at': self.published_at.isoformat() if self.published_at else None
-        }
-        
-        if include_stats:
-            data.update({
-                'view_count': self.view_count,
-                'click_count': self.click_count,
-                'ctr': round((self.click_count / max(self.view_count, 1)) * 100, 2)  # Click Through Rate
-            })
-        
-        return data
+        """تحويل بانر واحد؛ للقوائم استخدم serialize_banners لتجنب استعلام لكل صف"""
+        return banner_to_dict(
+            self,
+            self.banner_type.to_dict() if self.banner_type else None,
+            self.banner_position.to_dict() if self.banner_position else None,
+            self.is_active_now(),
+            self.get_metadata(),
+            include_stats
+        )
+
+
+# ترتيب قائمة البنرات (عمود، تنازلي، بديل NULL) المطابق لفهرس ix_banners_listing
+BANNER_LISTING_ORDER = [
+    (Banner.priority, False, LISTING_NULL_PRIORITY),
+    (Banner.created_at, True, LISTING_NULL_CREATED_AT),
+    (Banner.id, True),
+]
 
 
 class BannerSchedule(db.Model):
@@ -255,31 +217,26 @@ class BannerSchedule(db.Model):
         """تعيين قائمة الأيام"""
         self.days_of_week = ','.join(map(str, days))
     
-    def is_scheduled_now(self):
-        """التحقق من الجدولة الآن"""
-        if not self.is_active:
-            return False
-        
-        now = datetime.now()
-        
-        # التحقق من اليوم
-        if self.days_of_week:
-            current_day = now.weekday()  # 0=الاثنين, 6=الأحد
-            # تحويل للنظام المستخدم (0=الأحد)
-            current_day = (current_day + 1) % 7
-            if current_day not in self.get_days_list():
-                return False
-        
-        # التحقق من الوقت
-        current_time = now.time()
-        if self.start_time and current_time < self.start_time:
-            return False
-        if self.end_time and current_time > self.end_time:
-            return False
-        
-        return True
+    def compiled(self):
+        """الجدولة المترجمة (قناع أيام + فترات بالدقائق) من الذاكرة المؤقتة"""
+        signature = (self.days_of_week, self.start_time, self.end_time, self.timezone,
+                     bool(self.is_active), self.updated_at)
+        return schedule_cache.get(
+            self.id, signature, self.days_of_week, self.start_time, self.end_time,
+            self.timezone, bool(self.is_active)
+        )
+    
+    def is_scheduled_now(self, now=None):
+        """التحقق من الجدولة الآن (بتوقيت المنطقة الزمنية للجدولة)"""
+        return self.compiled().is_active_at(now)
+    
+    def next_transition(self, now=None):
+        """موعد التغير التالي في ظهور البانر (UTC)"""
+        return self.compiled().next_transition(now)
     
     def to_dict(self):
+        compiled = self.compiled()
+        next_transition = compiled.next_transition()
         return {
             'id': self.id,
             'banner_id': self.banner_id,
@@ -288,12 +245,20 @@ class BannerSchedule(db.Model):
             'end_time': self.end_time.strftime('%H:%M') if self.end_time else None,
             'timezone': self.timezone,
             'is_active': self.is_active,
-            'is_scheduled_now': self.is_scheduled_now(),
+            'is_scheduled_now': compiled.is_active_at(),
+            'next_transition': next_transition.isoformat() if next_transition else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 
+@event.listens_for(BannerSchedule, 'after_update')
+@event.listens_for(BannerSchedule, 'after_delete')
+def _invalidate_compiled_schedule(mapper, connection, target):
+    """إزالة الجدولة المترجمة من الذاكرة المؤقتة عند تعديلها أو حذفها"""
+    schedule_cache.invalidate(target.id)
+
+
 class BannerStats(db.Model):
     """إحصائيات البانرات"""
     __tablename__ = 'banner_stats'
@@ -308,6 +273,13 @@ class BannerStats(db.Model):
     unique_views = db.Column(db.Integer, default=0)
     unique_clicks = db.Column(db.Integer, default=0)
     
+    # سجلات HyperLogLog لتقدير الزوار الفريدين ودمجها عبر الأيام
+    views_sketch = db.Column(db.LargeBinary)
+    clicks_sketch = db.Column(db.LargeBinary)
+    
+    # وقت آخر مشاهدة في اليوم (updated_at هو وقت آخر تجميع)
+    last_viewed_at = db.Column(db.DateTime)
+    
     # معدلات الأداء
     ctr = db.Column(db.Float, default=0.0)  # Click Through Rate
     avg_view_duration = db.Column(db.Float, default=0.0)  # بالثواني
@@ -320,9 +292,9 @@ class BannerStats(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # فهرس مركب للأداء
+    # فهرس مركب فريد: صف واحد لكل بانر في كل يوم
     __table_args__ = (
-        db.Index('idx_banner_date', 'banner_id', 'date'),
+        db.Index('idx_banner_date', 'banner_id', 'date', unique=True),
     )
     
     def __repr__(self):
@@ -345,6 +317,7 @@ class BannerStats(db.Model):
             'unique_views': self.unique_views,
             'unique_clicks': self.unique_clicks,
             'ctr': self.ctr,
+            'last_viewed_at': self.last_viewed_at.isoformat() if self.last_viewed_at else None,
             'avg_view_duration': self.avg_view_duration,
             'bounce_rate': self.bounce_rate,
             'conversion_rate': self.conversion_rate,
@@ -401,7 +374,7 @@ class UserBanner(db.Model):
     
     # البيانات الإضافية
     custom_css = db.Column(db.Text)
-    metadata = db.Column(db.Text)  # JSON data
+    metadata_json = db.Column('metadata', db.Text)  # JSON data
     
     # الطوابع الزمنية
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -417,16 +390,16 @@ class UserBanner(db.Model):
     
     def get_metadata(self):
         """الحصول على البيانات الإضافية"""
-        if self.metadata:
+        if self.metadata_json:
             try:
-                return json.loads(self.metadata)
+                return json.loads(self.metadata_json)
             except:
                 return {}
         return {}
     
     def set_metadata(self, data):
         """تعيين البيانات الإضافية"""
-        self.metadata = json.dumps(data, ensure_ascii=False)
+        self.metadata_json = json.dumps(data, ensure_ascii=False)
     
     def can_be_edited_by(self, user_id, is_admin=False):
         """التحقق من إمكانية التعديل"""
@@ -535,7 +508,7 @@ class PageBanner(db.Model):
     # البيانات الإضافية
     custom_css = db.Column(db.Text)
     custom_js = db.Column(db.Text)
-    metadata = db.Column(db.Text)  # JSON data
+    metadata_json = db.Column('metadata', db.Text)  # JSON data
     
     # الطوابع الزمنية
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -547,16 +520,16 @@ class PageBanner(db.Model):
     
     def get_metadata(self):
         """الحصول على البيانات الإضافية"""
-        if self.metadata:
+        if self.metadata_json:
             try:
-                return json.loads(self.metadata)
+                return json.loads(self.metadata_json)
             except:
                 return {}
         return {}
     
     def set_metadata(self, data):
         """تعيين البيانات الإضافية"""
-        self.metadata = json.dumps(data, ensure_ascii=False)
+        self.metadata_json = json.dumps(data, ensure_ascii=False)
     
     def publish(self, admin_id):
         """نشر البانر"""
@@ -0,0 +1,27 @@
+"""
+خدمات البانرات - مشروع نائبك
+"""
+from .view_counter import ImpressionCounter, impression_counter
+from .stats_rollup import StatsRollup, stats_rollup
+from .range_analytics import RangeAnalytics
+from .activation import activation_timeline
+from .expiry_sweeper import ExpirySweeper, expiry_sweeper
+from .serialization import serialize_banners
+from .response_cache import placement_cache
+from .warmup import cache_warmer
+from .dashboard_stats import service_stats
+
+__all__ = [
+    'ImpressionCounter',
+    'impression_counter',
+    'StatsRollup',
+    'stats_rollup',
+    'RangeAnalytics',
+    'activation_timeline',
+    'ExpirySweeper',
+    'expiry_sweeper',
+    'serialize_banners',
+    'placement_cache',
+    'cache_warmer',
+    'service_stats'
+]
@@ -0,0 +1,136 @@
+"""
+خط زمني لتفعيل البانرات - مشروع نائبك
+Activation timeline wiring for the Flask app
+"""
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from activation_timeline import ActivationTimeline, BannerWindow
+from invalidation import TOPIC_BANNERS, TOPIC_POSITIONS, invalidation_bus
+from placement_cache import banner_ids_in
+from schedule_compiler import schedule_cache
+from app.services.response_cache import placement_cache
+
+_DIRTY_KEY = 'activation_dirty_banners'
+_DIRTY_POSITIONS_KEY = 'activation_dirty_positions'
+
+
+def load_banner_windows(engine, banner_ids=None):
+    """تحميل قواعد التفعيل للبانرات وجداولها باستعلامين"""
+    from app.models import Banner, BannerSchedule
+
+    banners, schedules = Banner.__table__, BannerSchedule.__table__
+    banners_query = select(
+        banners.c.id, banners.c.is_active, banners.c.is_published,
+        banners.c.start_date, banners.c.end_date
+    )
+    schedules_query = select(schedules).where(schedules.c.is_active == True)
+    if banner_ids is not None:
+        banners_query = banners_query.where(banners.c.id.in_(banner_ids))
+        schedules_query = schedules_query.where(schedules.c.banner_id.in_(banner_ids))
+
+    with engine.connect() as conn:
+        banner_rows = conn.execute(banners_query).all()
+        schedule_rows = conn.execute(schedules_query).all()
+
+    compiled = {}
+    for row in schedule_rows:
+        signature = (row.days_of_week, row.start_time, row.end_time, row.timezone,
+                     bool(row.is_active), row.updated_at)
+        compiled.setdefault(row.banner_id, []).append(schedule_cache.get(
+            row.id, signature, row.days_of_week, row.start_time, row.end_time, row.timezone, True
+        ))
+
+    return [
+        BannerWindow(
+            banner_id=row.id,
+            enabled=bool(row.is_active and row.is_published),
+            start_date=row.start_date,
+            end_date=row.end_date,
+            schedules=tuple(compiled.get(row.id, ()))
+        )
+        for row in banner_rows
+    ]
+
+
+def _mark_session_dirty(target, banner_id, position_ids=()):
+    """تسجيل البانر المعدل ومواضعه في الجلسة لنشرها بعد الحفظ"""
+    session = object_session(target)
+    if session is not None and banner_id is not None:
+        session.info.setdefault(_DIRTY_KEY, set()).add(banner_id)
+        session.info.setdefault(_DIRTY_POSITIONS_KEY, set()).update(
+            position_id for position_id in position_ids if position_id is not None
+        )
+
+
+def _track_banner(mapper, connection, target):
+    # الموضع الحالي والسابق عند نقل البانر بين المواضع
+    history = inspect(target).attrs.position_id.history
+    _mark_session_dirty(target, target.id, [target.position_id, *history.deleted])
+
+
+def _track_schedule(mapper, connection, target):
+    _mark_session_dirty(target, target.banner_id)
+
+
+def _after_commit(session):
+    position_ids = session.info.pop(_DIRTY_POSITIONS_KEY, None)
+    banner_ids = session.info.pop(_DIRTY_KEY, None)
+    if position_ids:
+        invalidation_bus.publish(TOPIC_POSITIONS, position_ids)
+    if banner_ids:
+        invalidation_bus.publish(TOPIC_BANNERS, banner_ids)
+
+
+def _after_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
+    session.info.pop(_DIRTY_POSITIONS_KEY, None)
+
+
+def _on_banners_invalidated(topic, banner_ids):
+    """إعادة تحميل البانرات المعدلة عبر ORM أو عبارات جماعية"""
+    if not banner_ids:
+        activation_timeline.reload()
+        return
+    for banner_id in banner_ids:
+        activation_timeline.mark_dirty(banner_id)
+
+
+def _on_remote_invalidated(tags):
+    """متابعة إلغاءات العمال الآخرين الواردة عبر Redis حتى لا تنتظر المجموعة الحية إعادة المزامنة"""
+    if not tags:
+        activation_timeline.reload()
+        return
+    for banner_id in banner_ids_in(tags):
+        activation_timeline.mark_dirty(banner_id)
+
+
+def init_app(app):
+    """ربط الخط الزمني بقاعدة بيانات التطبيق وتشغيله"""
+    from app.models import db, Banner, BannerSchedule
+
+    settings = app.config.get('BANNER_SETTINGS', {})
+    activation_timeline.resync_interval = settings.get(
+        'ACTIVATION_RESYNC_SECONDS', activation_timeline.resync_interval
+    )
+
+    with app.app_context():
+        engine = db.engine
+    activation_timeline.loader = lambda banner_ids: load_banner_windows(engine, banner_ids)
+
+    # نشر البانرات المعدلة على ناقل الإلغاء بعد نجاح الحفظ فقط
+    if not event.contains(Session, 'after_commit', _after_commit):
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(Banner, name, _track_banner)
+            event.listen(BannerSchedule, name, _track_schedule)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+    invalidation_bus.subscribe(TOPIC_BANNERS, _on_banners_invalidated)
+    placement_cache.subscribe(_on_remote_invalidated)
+
+    app.extensions['activation_timeline'] = activation_timeline
+    activation_timeline.start()
+
+
+# نسخة مشتركة على مستوى العملية
+activation_timeline = ActivationTimeline()
@@ -0,0 +1,107 @@
+"""
+إحصائيات لوحة الخدمة - مشروع نائبك
+Cached single-query-per-table service statistics
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from aggregate_stats import AggregateCache, conditional_counts, count_rows
+from invalidation import TOPIC_BANNERS, TOPIC_PAGES, invalidation_bus
+
+_DIRTY_KEY = 'service_stats_dirty'
+
+
+def load_service_stats(engine):
+    """حساب الإحصائيات بثلاثة استعلامات: البانرات (مع عدد الأنواع والمواضع) وبانرات المستخدمين والصفحات"""
+    from app.models.models import Banner, BannerType, BannerPosition, UserBanner, PageBanner
+
+    banners = Banner.__table__
+    user_banners = UserBanner.__table__
+    page_banners = PageBanner.__table__
+
+    banners_query = conditional_counts(banners, {
+        'active': banners.c.is_active == True,
+        'published': banners.c.is_published == True
+    }, extra={
+        'types': count_rows(BannerType.__table__),
+        'positions': count_rows(BannerPosition.__table__)
+    })
+    user_banners_query = conditional_counts(user_banners, {
+        'active': user_banners.c.is_active == True,
+        'approved': user_banners.c.is_approved == True
+    })
+    page_banners_query = conditional_counts(page_banners, {
+        'active': page_banners.c.is_active == True,
+        'published': page_banners.c.is_published == True
+    })
+
+    with engine.connect() as conn:
+        banner_row = conn.execute(banners_query).one()
+        user_row = conn.execute(user_banners_query).one()
+        page_row = conn.execute(page_banners_query).one()
+
+    return {
+        'banners': {
+            'total': banner_row.total,
+            'active': banner_row.active,
+            'published': banner_row.published
+        },
+        'user_banners': {
+            'total': user_row.total,
+            'active': user_row.active,
+            'approved': user_row.approved
+        },
+        'page_banners': {
+            'total': page_row.total,
+            'active': page_row.active,
+            'published': page_row.published
+        },
+        'types': banner_row.types,
+        'positions': banner_row.positions
+    }
+
+
+def get_service_stats():
+    """الإحصائيات من الذاكرة المؤقتة، أو حسابها إن انتهت صلاحيتها أو ألغتها كتابة"""
+    from app.models import db
+    return service_stats.get(lambda: load_service_stats(db.engine))
+
+
+def _track_write(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[_DIRTY_KEY] = True
+
+
+def _after_commit(session):
+    if session.info.pop(_DIRTY_KEY, False):
+        service_stats.invalidate()
+
+
+def _after_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
+
+
+def init_app(app):
+    """ربط الذاكرة المؤقتة بعمليات الكتابة على الجداول المحسوبة وبناقل الإلغاء"""
+    from app.models.models import Banner, BannerType, BannerPosition, UserBanner, PageBanner
+
+    settings = app.config.get('PERFORMANCE_SETTINGS', {})
+    service_stats.ttl = settings.get('SERVICE_STATS_TTL', service_stats.ttl)
+
+    if not event.contains(Session, 'after_commit', _after_commit):
+        for model in (Banner, BannerType, BannerPosition, UserBanner, PageBanner):
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, name, _track_write)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+
+    # التحديثات الجماعية (مثل منظف الانتهاء) لا تمر بأحداث ORM
+    invalidation_bus.subscribe(TOPIC_BANNERS, service_stats.invalidate)
+    invalidation_bus.subscribe(TOPIC_PAGES, service_stats.invalidate)
+
+    app.extensions['service_stats'] = service_stats
+
+
+# نسخة مشتركة على مستوى العملية؛ المدة القصيرة تحد من تأخر كتابات العمال الآخرين
+service_stats = AggregateCache(ttl=30)
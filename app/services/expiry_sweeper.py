@@ -0,0 +1,157 @@
+"""
+إنهاء صلاحية البانرات تلقائياً - مشروع نائبك
+Bulk auto-expiry sweeper for banners
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from invalidation import TOPIC_BANNERS, TOPIC_POSITIONS, invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+
+class ExpirySweeper:
+    """
+    إيقاف البانرات المنتهية على دفعات بعبارات UPDATE جماعية
+
+    كل دفعة تحدد حتى batch_size بانر منتهي (تاريخ النهاية مضى، أو لا تاريخ
+    نهاية ومضت DEFAULT_BANNER_DURATION_DAYS منذ البداية) وتوقفها بعبارة واحدة
+    دون تحميل الصفوف عبر ORM، ثم تُبلّغ ناقل الإلغاء بالبانرات ومواضعها المتأثرة.
+    """
+
+    def __init__(self, interval=60, batch_size=500, default_duration_days=None, engine=None):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.default_duration_days = default_duration_days
+        self._engine = engine
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.sweeps = 0
+        self.total_expired = 0
+        self.last_sweep_at = None
+        self.last_duration_ms = 0.0
+        self.last_expired = 0
+
+    @property
+    def table(self):
+        from app.models import Banner
+        return Banner.__table__
+
+    def init_app(self, app, engine=None):
+        """ربط المنظف بقاعدة بيانات التطبيق وتشغيله إذا كان AUTO_EXPIRE_BANNERS مفعلاً"""
+        from app.models import db
+
+        settings = app.config.get('BANNER_SETTINGS', {})
+        self.interval = settings.get('EXPIRY_SWEEP_INTERVAL_SECONDS', self.interval)
+        self.batch_size = settings.get('EXPIRY_SWEEP_BATCH_SIZE', self.batch_size)
+        self.default_duration_days = settings.get('DEFAULT_BANNER_DURATION_DAYS', self.default_duration_days)
+
+        if engine is None:
+            with app.app_context():
+                engine = db.engine
+        self._engine = engine
+
+        app.extensions['expiry_sweeper'] = self
+        if settings.get('AUTO_EXPIRE_BANNERS', True):
+            self.start()
+
+    def start(self):
+        """تشغيل خيط التنظيف الدوري"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def expired_condition(self, now):
+        """شرط البانرات النشطة التي انتهت صلاحيتها
+
+        كل فرع يبدأ بـ is_active ليكون مدى مستقلاً على فهرس ix_banners_window
+        """
+        table = self.table
+        active = table.c.is_active == True
+        expired = and_(active, table.c.end_date.isnot(None), table.c.end_date < now)
+        if self.default_duration_days:
+            cutoff = now - timedelta(days=self.default_duration_days)
+            expired = or_(expired, and_(
+                active,
+                table.c.end_date.is_(None),
+                table.c.start_date.isnot(None),
+                table.c.start_date < cutoff
+            ))
+        return expired
+
+    def sweep(self, now=None):
+        """إيقاف جميع البانرات المنتهية على دفعات وإرجاع عددها"""
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        expired = 0
+
+        with self._lock:
+            while True:
+                rows = self._expire_batch(now)
+                if rows:
+                    expired += len(rows)
+                    invalidation_bus.publish(TOPIC_POSITIONS, {row.position_id for row in rows})
+                    invalidation_bus.publish(TOPIC_BANNERS, [row.id for row in rows])
+                if len(rows) < self.batch_size:
+                    break
+
+        self.sweeps += 1
+        self.total_expired += expired
+        self.last_sweep_at = now
+        self.last_expired = expired
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        if expired:
+            logger.info(f"تم إيقاف {expired} بانر منتهي خلال {self.last_duration_ms}ms")
+        return expired
+
+    def _expire_batch(self, now):
+        """إيقاف دفعة واحدة وإرجاع صفوفها (المعرف والموضع)"""
+        table = self.table
+        candidates = select(table.c.id).where(self.expired_condition(now)).limit(self.batch_size)
+        values = {'is_active': False, 'updated_at': now}
+
+        with self._engine.begin() as conn:
+            if conn.dialect.update_returning and conn.dialect.name != 'mysql':
+                stmt = update(table).where(
+                    table.c.id.in_(candidates.scalar_subquery())
+                ).values(**values).returning(table.c.id, table.c.position_id)
+                return conn.execute(stmt).all()
+
+            # قواعد بيانات بدون RETURNING: تحديد الصفوف ثم تحديثها في نفس المعاملة
+            rows = conn.execute(
+                select(table.c.id, table.c.position_id).where(self.expired_condition(now)).limit(self.batch_size)
+            ).all()
+            if rows:
+                conn.execute(update(table).where(table.c.id.in_([row.id for row in rows])).values(**values))
+            return rows
+
+    def metrics(self):
+        return {
+            'sweeps': self.sweeps,
+            'total_expired': self.total_expired,
+            'last_sweep_at': self.last_sweep_at.isoformat() if self.last_sweep_at else None,
+            'last_expired': self.last_expired,
+            'last_duration_ms': self.last_duration_ms
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"خطأ في إيقاف البانرات المنتهية: {str(e)}")
+            self._stop.wait(self.interval)
+
+
+# نسخة مشتركة على مستوى العملية
+expiry_sweeper = ExpirySweeper()
@@ -0,0 +1,153 @@
+"""
+تحليلات البانرات لنطاق زمني - مشروع نائبك
+Vectorized range analytics over BannerStats
+"""
+from datetime import timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+
+def _ratio(numerator, denominator):
+    """قسمة آمنة تعيد صفراً عند انعدام المقام"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def moving_average(series, window):
+    """متوسط متحرك خلفي لكل صف (يستخدم الأيام المتاحة في بداية النطاق)"""
+    n_days = series.shape[1]
+    padded = np.concatenate([np.zeros((series.shape[0], 1)), np.cumsum(series, axis=1)], axis=1)
+    ends = np.arange(1, n_days + 1)
+    starts = np.maximum(ends - window, 0)
+    return (padded[:, ends] - padded[:, starts]) / (ends - starts)
+
+
+def day_over_day(series):
+    """الفرق اليومي لكل صف (صفر لليوم الأول)"""
+    return np.diff(series, axis=1, prepend=series[:, :1])
+
+
+class RangeAnalytics:
+    """
+    تحليلات مجمعة لعدة بانرات في استدعاء واحد
+
+    تُحمَّل صفوف BannerStats للنطاق باستعلام واحد إلى مصفوفات NumPy
+    (بانر × يوم) وتُحسب المجاميع ومعدلات النقر والمتوسطات المتحركة
+    والفروق اليومية وملخصات المواضع بعمليات متجهة.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def load(self, start_date, end_date, banner_ids=None):
+        """تحميل الصفوف إلى أعمدة: (banner_ids, position_ids, day_offsets, views, clicks)"""
+        from app.models import Banner, BannerStats
+
+        stats, banners = BannerStats.__table__, Banner.__table__
+        query = select(
+            stats.c.banner_id, banners.c.position_id, stats.c.date, stats.c.views, stats.c.clicks
+        ).join(
+            banners, banners.c.id == stats.c.banner_id
+        ).where(
+            stats.c.date >= start_date,
+            stats.c.date <= end_date
+        )
+        if banner_ids:
+            query = query.where(stats.c.banner_id.in_(banner_ids))
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).all()
+
+        if not rows:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, empty, empty, empty
+
+        ids, positions, dates, views, clicks = zip(*rows)
+        offsets = (
+            np.array(dates, dtype='datetime64[D]') - np.datetime64(start_date, 'D')
+        ).astype(np.int64)
+        return (
+            np.array(ids, dtype=np.int64),
+            np.array(positions, dtype=np.int64),
+            offsets,
+            np.array([v or 0 for v in views], dtype=np.int64),
+            np.array([c or 0 for c in clicks], dtype=np.int64)
+        )
+
+    def query(self, start_date, end_date, banner_ids=None, window=7):
+        """ملخص لكل بانر ولكل موضع ضمن النطاق"""
+        n_days = (end_date - start_date).days + 1
+        ids, positions, offsets, views, clicks = self.load(start_date, end_date, banner_ids)
+        dates = [(start_date + timedelta(days=i)).isoformat() for i in range(n_days)]
+
+        unique_ids, banner_index = np.unique(ids, return_inverse=True)
+        n_banners = len(unique_ids)
+
+        # مصفوفات كثيفة (بانر × يوم)
+        daily_views = np.zeros((n_banners, n_days), dtype=np.float64)
+        daily_clicks = np.zeros((n_banners, n_days), dtype=np.float64)
+        np.add.at(daily_views, (banner_index, offsets), views)
+        np.add.at(daily_clicks, (banner_index, offsets), clicks)
+
+        total_views = daily_views.sum(axis=1)
+        total_clicks = daily_clicks.sum(axis=1)
+        ctr = np.round(_ratio(total_clicks * 100, total_views), 2)
+        daily_ctr = np.round(_ratio(daily_clicks * 100, daily_views), 2)
+        views_ma = np.round(moving_average(daily_views, window), 2)
+        clicks_ma = np.round(moving_average(daily_clicks, window), 2)
+        views_delta = day_over_day(daily_views)
+        clicks_delta = day_over_day(daily_clicks)
+
+        # موضع كل بانر (أول ظهور له في الصفوف)
+        _, first_rows = np.unique(banner_index, return_index=True)
+        banner_positions = positions[first_rows] if n_banners else positions
+        unique_positions, position_index = np.unique(banner_positions, return_inverse=True)
+        position_views = np.zeros(len(unique_positions))
+        position_clicks = np.zeros(len(unique_positions))
+        np.add.at(position_views, position_index, total_views)
+        np.add.at(position_clicks, position_index, total_clicks)
+        position_counts = np.bincount(position_index, minlength=len(unique_positions))
+        position_ctr = np.round(_ratio(position_clicks * 100, position_views), 2)
+
+        return {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'window': window,
+            'dates': dates,
+            'banners': [
+                {
+                    'banner_id': int(unique_ids[i]),
+                    'position_id': int(banner_positions[i]),
+                    'total_views': int(total_views[i]),
+                    'total_clicks': int(total_clicks[i]),
+                    'ctr': float(ctr[i]),
+                    'daily': {
+                        'views': daily_views[i].astype(np.int64).tolist(),
+                        'clicks': daily_clicks[i].astype(np.int64).tolist(),
+                        'ctr': daily_ctr[i].tolist(),
+                        'views_moving_avg': views_ma[i].tolist(),
+                        'clicks_moving_avg': clicks_ma[i].tolist(),
+                        'views_day_over_day': views_delta[i].astype(np.int64).tolist(),
+                        'clicks_day_over_day': clicks_delta[i].astype(np.int64).tolist()
+                    }
+                }
+                for i in range(n_banners)
+            ],
+            'positions': [
+                {
+                    'position_id': int(unique_positions[i]),
+                    'banners': int(position_counts[i]),
+                    'total_views': int(position_views[i]),
+                    'total_clicks': int(position_clicks[i]),
+                    'ctr': float(position_ctr[i])
+                }
+                for i in range(len(unique_positions))
+            ],
+            'totals': {
+                'views': int(total_views.sum()),
+                'clicks': int(total_clicks.sum()),
+                'ctr': float(np.round(_ratio(total_clicks.sum() * 100, total_views.sum()), 2))
+            }
+        }
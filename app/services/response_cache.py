@@ -0,0 +1,121 @@
+"""
+ذاكرة مؤقتة لاستجابات مواضع البانرات - مشروع نائبك
+Pre-rendered placement response cache for the Flask app
+"""
+from flask import request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from invalidation import TOPIC_BANNERS, TOPIC_PAGES, TOPIC_POSITIONS, invalidation_bus
+from conditional import is_not_modified, not_modified
+from json_provider import json_response
+from memory_redis import InMemoryRedis
+from placement_cache import TAG_BANNERS, banner_tag, make_key, page_tag, position_tag
+from two_tier_cache import RedisTier, TwoTierCache
+
+SUPPORTED_LOCALES = ['ar', 'en']
+
+_DIRTY_PAGES_KEY = 'placement_dirty_pages'
+
+
+def request_key(endpoint, filters=None, version=None):
+    """مفتاح الاستجابة من المسار والمرشحات المطبّعة ولغة الطلب"""
+    locale = request.accept_languages.best_match(SUPPORTED_LOCALES, SUPPORTED_LOCALES[0])
+    return make_key(endpoint, filters, locale, version)
+
+
+def cached_response(entry):
+    """إرجاع الاستجابة المخزنة كما هي مع ETag، أو 304 بلا محتوى إن كانت نسخة العميل حديثة"""
+    if is_not_modified(entry.etag, entry.last_modified):
+        response = not_modified(entry.etag, entry.last_modified)
+    else:
+        response = json_response(entry.body, headers={'ETag': entry.etag})
+        if entry.last_modified is not None:
+            response.last_modified = entry.last_modified
+    response.vary.add('Accept-Language')
+    return response
+
+
+def _on_banners_invalidated(topic, banner_ids):
+    if not banner_ids:
+        placement_cache.clear()
+        return
+    placement_cache.invalidate([TAG_BANNERS, *(banner_tag(banner_id) for banner_id in banner_ids)])
+
+
+def _on_positions_invalidated(topic, position_ids):
+    placement_cache.invalidate(position_tag(position_id) for position_id in position_ids)
+
+
+def _on_pages_invalidated(topic, page_keys):
+    if not page_keys:
+        placement_cache.clear()
+        return
+    placement_cache.invalidate(page_tag(page_key) for page_key in page_keys)
+
+
+def _track_page(mapper, connection, target):
+    """تسجيل مفتاح الصفحة الحالي والسابق لنشره بعد الحفظ"""
+    session = object_session(target)
+    if session is not None:
+        history = inspect(target).attrs.page_key.history
+        session.info.setdefault(_DIRTY_PAGES_KEY, set()).update(
+            page_key for page_key in [target.page_key, *history.deleted] if page_key
+        )
+
+
+def _after_commit(session):
+    page_keys = session.info.pop(_DIRTY_PAGES_KEY, None)
+    if page_keys:
+        invalidation_bus.publish(TOPIC_PAGES, page_keys)
+
+
+def _after_rollback(session):
+    session.info.pop(_DIRTY_PAGES_KEY, None)
+
+
+def _make_remote(app, backend, ttl):
+    """الطبقة المشتركة: Redis في الإنتاج أو بديل داخل العملية للاختبارات"""
+    if backend == 'redis':
+        import redis
+        client = redis.Redis.from_url(app.config.get('CACHE_REDIS_URL') or app.config['REDIS_URL'])
+    elif backend == 'memory':
+        client = InMemoryRedis()
+    else:
+        return None
+    return RedisTier(client, ttl=ttl)
+
+
+def init_app(app):
+    """تهيئة طبقتي الذاكرة المؤقتة والاشتراك في أحداث تعديل البانرات والصفحات"""
+    from app.models import PageBanner
+
+    settings = app.config.get('PERFORMANCE_SETTINGS', {})
+    local = placement_cache.local
+    local.ttl = settings.get('PLACEMENT_CACHE_TTL', local.ttl)
+    local.max_entries = settings.get('PLACEMENT_CACHE_MAX_ENTRIES', local.max_entries)
+    local.max_bytes = settings.get('PLACEMENT_CACHE_MAX_BYTES', local.max_bytes)
+    local.stale_ttl = settings.get('PLACEMENT_CACHE_STALE_TTL', local.stale_ttl)
+    placement_cache.local_ttl = settings.get('PLACEMENT_CACHE_LOCAL_TTL', placement_cache.local_ttl)
+    placement_cache.build_timeout = settings.get('PLACEMENT_CACHE_BUILD_TIMEOUT', placement_cache.build_timeout)
+
+    # Redis خلف ذاكرة العامل، مع قناة pub/sub لإبلاغ بقية العمال بالإلغاء
+    if placement_cache.remote is None:
+        placement_cache.remote = _make_remote(app, settings.get('PLACEMENT_CACHE_BACKEND', 'local'), local.ttl)
+    placement_cache.start()
+
+    if not event.contains(Session, 'after_commit', _after_commit):
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(PageBanner, name, _track_page)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+
+    invalidation_bus.subscribe(TOPIC_BANNERS, _on_banners_invalidated)
+    invalidation_bus.subscribe(TOPIC_POSITIONS, _on_positions_invalidated)
+    invalidation_bus.subscribe(TOPIC_PAGES, _on_pages_invalidated)
+
+    app.extensions['placement_cache'] = placement_cache
+
+
+# نسخة مشتركة على مستوى العملية (طبقة محلية فقط حتى تهيئة التطبيق)
+placement_cache = TwoTierCache()
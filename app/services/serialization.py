@@ -0,0 +1,35 @@
+"""
+تحويل البانرات إلى JSON دفعة واحدة - مشروع نائبك
+Batch banner serialization for the Flask app
+"""
+from banner_serializer import BannerSerializer
+
+from .activation import activation_timeline
+
+_serializer = None
+
+
+def get_serializer():
+    """المحول المشترك مربوطاً بجداول النماذج"""
+    global _serializer
+    if _serializer is None:
+        from app.models import Banner, BannerType, BannerPosition
+        _serializer = BannerSerializer(
+            Banner.__table__, BannerType.__table__, BannerPosition.__table__
+        )
+    return _serializer
+
+
+def serialize_banners(banners, include_stats=False):
+    """
+    تحويل قائمة بانرات باستعلامين على الأكثر مهما كان عددها
+
+    الأنواع والمواضع تُحمّل مع عدد بانراتها في استعلام واحد لكل منهما بدلاً من
+    تحميل العلاقات الكسول لكل صف، وحالة النشاط تُقرأ من المجموعة الحية للخط الزمني.
+    """
+    from app.models import db
+
+    live_ids = activation_timeline.live_ids if activation_timeline.running else None
+    return get_serializer().serialize(
+        db.session, banners, include_stats=include_stats, live_ids=live_ids
+    )
@@ -0,0 +1,349 @@
+"""
+تجميع الإحصائيات اليومية للبانرات - مشروع نائبك
+Daily BannerStats rollup from raw banner events
+"""
+import logging
+import threading
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import Column, Date, DateTime, Integer, String, Table, and_, case, func, or_, select, update
+
+from event_pipeline import banner_events, metadata
+from hyperloglog import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+# موضع التجميع: معرّف آخر حدث خام أضيف إلى BannerStats
+rollup_state = Table(
+    'stats_rollup_state', metadata,
+    Column('name', String(50), primary_key=True),
+    Column('last_event_id', Integer, nullable=False),
+    Column('updated_at', DateTime),
+)
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def _upsert_statement(conn, table, rows, columns):
+    """إدراج أو تحديث صفوف الإحصائيات حسب (banner_id, date)"""
+    dialect = conn.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+
+    stmt = insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=['banner_id', 'date'],
+        set_={column: stmt.excluded[column] for column in columns}
+    )
+
+
+class StatsRollup:
+    """
+    تجميع أحداث المشاهدة والنقر الخام في صفوف BannerStats اليومية
+
+    التجميع الدوري تزايدي: معرّف آخر حدث تم تجميعه محفوظ في stats_rollup_state،
+    وكل تشغيل يضيف الأحداث الأحدث منه فقط إلى العدادات وسجلات HyperLogLog
+    المخزنة، فتكلفته تتناسب مع الأحداث الجديدة لا مع حجم اليوم. صف الحالة
+    يبقى مقفلاً حتى نهاية المعاملة، فإن شغّل عدة عمال المهمة معاً جمّعها
+    أحدهم ووجد الباقون أن لا جديد.
+
+    إعادة التجميع الكامل لنطاق تاريخي (backfill) تحسب الأيام من الأحداث حتى
+    الموضع المحفوظ فقط، فلا تُحسب الأحداث مرتين عند التجميع التزايدي التالي.
+    """
+
+    STATE_NAME = 'banner_stats'
+
+    UPDATE_COLUMNS = (
+        'views', 'clicks', 'unique_views', 'unique_clicks',
+        'views_sketch', 'clicks_sketch', 'ctr', 'last_viewed_at', 'updated_at'
+    )
+
+    def __init__(self, interval=300, settle_seconds=60, engine=None):
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self._engine = engine
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run_at = None
+        self.last_run_rows = 0
+        self.last_event_id = None
+
+    @property
+    def table(self):
+        from app.models import BannerStats
+        return BannerStats.__table__
+
+    def init_app(self, app, engine=None):
+        """ربط التجميع بقاعدة بيانات التطبيق وتشغيله دورياً"""
+        from app.models import db
+
+        settings = app.config.get('BANNER_SETTINGS', {})
+        self.interval = settings.get('STATS_ROLLUP_INTERVAL_SECONDS', self.interval)
+        self.settle_seconds = settings.get('STATS_ROLLUP_SETTLE_SECONDS', self.settle_seconds)
+
+        if engine is None:
+            with app.app_context():
+                engine = db.engine
+        self._engine = engine
+        banner_events.create(engine, checkfirst=True)
+        rollup_state.create(engine, checkfirst=True)
+
+        app.extensions['stats_rollup'] = self
+        # يمكن نقل التجميع إلى عملية واحدة (flask rollup-stats عبر cron) بإيقافه في العمال
+        if settings.get('ENABLE_BANNER_ANALYTICS', True) and settings.get('STATS_ROLLUP_IN_PROCESS', True):
+            self.start()
+
+    def start(self):
+        """تشغيل خيط التجميع الدوري"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stats-rollup', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def rollup_day(self, day):
+        """إعادة تجميع يوم واحد كاملاً من الأحداث حتى الموضع المحفوظ"""
+        with self._engine.begin() as conn:
+            last_event_id, _ = self._claim(conn)
+            return self._rollup_day(conn, day, last_event_id)
+
+    def rollup_recent(self):
+        """إضافة الأحداث الجديدة منذ آخر تشغيل إلى الصفوف اليومية"""
+        events = banner_events.c
+        now = datetime.utcnow()
+        with self._engine.begin() as conn:
+            last_event_id, created = self._claim(conn)
+            if created:
+                # أول تشغيل تزايدي: إكمال اليومين الأخيرين حتى الموضع الابتدائي
+                today = now.date()
+                rows = sum(self._rollup_day(conn, day, last_event_id) for day in (today - timedelta(days=1), today))
+            else:
+                # الأحداث تُكتب خلال ثوانٍ من وقوعها، فما قبل هذا الحد اكتملت كتابته
+                # ولن يظهر بعد التشغيل حدث بمعرّف أصغر من الموضع الجديد
+                cutoff = now - timedelta(seconds=self.settle_seconds)
+                upper = conn.execute(select(func.max(events.id)).where(
+                    events.id > last_event_id, events.occurred_at < cutoff
+                )).scalar()
+                rows = 0
+                if upper is not None:
+                    rows = self._fold(conn, (events.id > last_event_id, events.id <= upper), replace=False)
+                    conn.execute(update(rollup_state).where(
+                        rollup_state.c.name == self.STATE_NAME
+                    ).values(last_event_id=upper))
+                    last_event_id = upper
+
+        self.last_event_id = last_event_id
+        self.last_run_at = datetime.utcnow()
+        self.last_run_rows = rows
+        return rows
+
+    def _claim(self, conn):
+        """قفل صف الحالة حتى نهاية المعاملة وإرجاع (الموضع، هل أُنشئ الآن)"""
+        state = rollup_state.c
+        now = datetime.utcnow()
+        claimed = conn.execute(update(rollup_state).where(
+            state.name == self.STATE_NAME
+        ).values(updated_at=now)).rowcount
+        if claimed:
+            last_event_id = conn.execute(
+                select(state.last_event_id).where(state.name == self.STATE_NAME)
+            ).scalar_one()
+            return last_event_id, False
+
+        # لا موضع بعد: البدء من آخر حدث مكتوب
+        last_event_id = conn.execute(select(func.coalesce(func.max(banner_events.c.id), 0))).scalar_one()
+        conn.execute(rollup_state.insert().values(
+            name=self.STATE_NAME, last_event_id=last_event_id, updated_at=now
+        ))
+        return last_event_id, True
+
+    def _rollup_day(self, conn, day, last_event_id):
+        start, end = _day_bounds(day)
+        events = banner_events.c
+        return self._fold(conn, (
+            events.occurred_at >= start, events.occurred_at < end, events.id <= last_event_id
+        ), replace=True)
+
+    def _fold(self, conn, conditions, replace):
+        """تجميع الأحداث المطابقة لكل (بانر، يوم) ودمجها مع الصفوف المخزنة
+
+        replace يستبدل العدادات المخزنة بدلاً من الإضافة إليها (إعادة التجميع الكامل)
+        """
+        events = banner_events.c
+        day = func.date(events.occurred_at, type_=Date).label('day')
+
+        counts_query = select(
+            events.banner_id, day,
+            func.sum(case((events.event_type == 'view', 1), else_=0)).label('views'),
+            func.sum(case((events.event_type == 'click', 1), else_=0)).label('clicks'),
+            func.max(case((events.event_type == 'view', events.occurred_at))).label('last_viewed_at')
+        ).where(*conditions).group_by(events.banner_id, day)
+
+        visitors_query = select(
+            events.banner_id, day, events.event_type, events.ip_hash
+        ).distinct().where(*conditions, events.ip_hash.isnot(None))
+
+        counts = {(row.banner_id, row.day): row for row in conn.execute(counts_query)}
+        if not counts:
+            return 0
+
+        stored = self._load_stored(conn, counts)
+        sketches = {}
+        for key, row in stored.items():
+            if row.views_sketch:
+                sketches[key + ('view',)] = HyperLogLog.from_bytes(row.views_sketch)
+            if row.clicks_sketch:
+                sketches[key + ('click',)] = HyperLogLog.from_bytes(row.clicks_sketch)
+        for row in conn.execute(visitors_query):
+            sketch = sketches.setdefault((row.banner_id, row.day, row.event_type), HyperLogLog())
+            sketch.add(row.ip_hash)
+
+        now = datetime.utcnow()
+        rows = []
+        for (banner_id, date), row in counts.items():
+            previous = None if replace else stored.get((banner_id, date))
+            views = (row.views or 0) + (previous.views or 0 if previous else 0)
+            clicks = (row.clicks or 0) + (previous.clicks or 0 if previous else 0)
+            last_viewed_at = max(
+                (value for value in (row.last_viewed_at, previous and previous.last_viewed_at) if value),
+                default=None
+            )
+            views_sketch = sketches.get((banner_id, date, 'view'), HyperLogLog())
+            clicks_sketch = sketches.get((banner_id, date, 'click'), HyperLogLog())
+            rows.append({
+                'banner_id': banner_id,
+                'date': date,
+                'views': views,
+                'clicks': clicks,
+                'unique_views': views_sketch.count(),
+                'unique_clicks': clicks_sketch.count(),
+                'views_sketch': views_sketch.to_bytes(),
+                'clicks_sketch': clicks_sketch.to_bytes(),
+                'ctr': round(clicks / views * 100, 2) if views else 0.0,
+                'last_viewed_at': last_viewed_at,
+                'created_at': now,
+                'updated_at': now
+            })
+        self._write(conn, rows)
+        return len(rows)
+
+    def _load_stored(self, conn, keys):
+        """تحميل الصفوف المخزنة لأزواج (بانر، يوم) لدمجها مع الأحداث الجديدة"""
+        table = self.table
+        query = select(
+            table.c.banner_id, table.c.date, table.c.views, table.c.clicks,
+            table.c.views_sketch, table.c.clicks_sketch, table.c.last_viewed_at
+        ).where(
+            table.c.banner_id.in_({banner_id for banner_id, _ in keys}),
+            table.c.date.in_({date for _, date in keys})
+        )
+        return {
+            (row.banner_id, row.date): row
+            for row in conn.execute(query)
+            if (row.banner_id, row.date) in keys
+        }
+
+    def unique_visitors(self, banner_id, start_date=None, end_date=None, event_type='view'):
+        """تقدير الزوار الفريدين لنطاق من الأيام بدمج السجلات اليومية"""
+        table = self.table
+        column = table.c.views_sketch if event_type == 'view' else table.c.clicks_sketch
+        query = select(column).where(table.c.banner_id == banner_id)
+        if start_date:
+            query = query.where(table.c.date >= start_date)
+        if end_date:
+            query = query.where(table.c.date <= end_date)
+
+        with self._engine.connect() as conn:
+            return HyperLogLog.merged(conn.execute(query).scalars()).count()
+
+    def backfill(self, start_date, end_date):
+        """إعادة تجميع نطاق من الأيام"""
+        total = 0
+        day = start_date
+        while day <= end_date:
+            total += self.rollup_day(day)
+            day += timedelta(days=1)
+        logger.info(f"تم تجميع {total} صف إحصائيات من {start_date} إلى {end_date}")
+        return total
+
+    def daily_stats(self, banner_id, start_date=None, end_date=None):
+        """قراءة الصفوف اليومية المجمعة لبانر"""
+        table = self.table
+        query = select(table).where(table.c.banner_id == banner_id).order_by(table.c.date)
+        if start_date:
+            query = query.where(table.c.date >= start_date)
+        if end_date:
+            query = query.where(table.c.date <= end_date)
+
+        with self._engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(query)]
+
+    def summarize(self, banner_id, start_date=None, end_date=None):
+        """ملخص إحصائيات بانر من الصفوف المجمعة"""
+        table = self.table
+        query = select(
+            func.coalesce(func.sum(table.c.views), 0).label('views'),
+            func.coalesce(func.sum(table.c.clicks), 0).label('clicks'),
+            func.max(table.c.date).label('last_date'),
+            func.max(table.c.last_viewed_at).label('last_viewed_at')
+        ).where(table.c.banner_id == banner_id)
+        if start_date:
+            query = query.where(table.c.date >= start_date)
+        if end_date:
+            query = query.where(table.c.date <= end_date)
+
+        with self._engine.connect() as conn:
+            row = conn.execute(query).one()
+
+        return {
+            'banner_id': banner_id,
+            'views': row.views,
+            'clicks': row.clicks,
+            'unique_views': self.unique_visitors(banner_id, start_date, end_date, 'view'),
+            'unique_clicks': self.unique_visitors(banner_id, start_date, end_date, 'click'),
+            'ctr': round(row.clicks / row.views * 100, 2) if row.views else 0.0,
+            'last_date': row.last_date,
+            'last_viewed_at': row.last_viewed_at
+        }
+
+    def metrics(self):
+        return {
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_run_rows': self.last_run_rows,
+            'last_event_id': self.last_event_id
+        }
+
+    def _write(self, conn, rows):
+        table = self.table
+        stmt = _upsert_statement(conn, table, rows, self.UPDATE_COLUMNS)
+        if stmt is not None:
+            conn.execute(stmt)
+            return
+
+        # قواعد بيانات أخرى: حذف الصفوف ثم إدراجها من جديد
+        conn.execute(table.delete().where(or_(*(
+            and_(table.c.banner_id == row['banner_id'], table.c.date == row['date'])
+            for row in rows
+        ))))
+        conn.execute(table.insert(), rows)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.rollup_recent()
+            except Exception as e:
+                logger.error(f"خطأ في تجميع الإحصائيات: {str(e)}")
+
+
+# نسخة مشتركة على مستوى العملية
+stats_rollup = StatsRollup()
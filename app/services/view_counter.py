@@ -0,0 +1,159 @@
+"""
+عداد المشاهدات والنقرات المجمّع - مشروع نائبك
+Buffered impression/click counter
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# تحديث واحد لكل بانر بالفرق المجمّع بدلاً من commit لكل مشاهدة
+FLUSH_STATEMENT = text(
+    'UPDATE banners '
+    'SET view_count = COALESCE(view_count, 0) + :views, '
+    'click_count = COALESCE(click_count, 0) + :clicks '
+    'WHERE id = :banner_id'
+)
+
+
+class ImpressionCounter:
+    """
+    تجميع المشاهدات والنقرات في الذاكرة وكتابتها في معاملة واحدة
+
+    يتم التفريغ كل flush_interval ثانية أو عند وصول عدد الأحداث المعلقة
+    إلى flush_size، وعند إيقاف العملية.
+    """
+
+    def __init__(self, flush_interval=5.0, flush_size=500, engine=None):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._engine = engine
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(lambda: [0, 0])  # banner_id -> [views, clicks]
+        self._pending_events = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushed_batches = 0
+        self.flushed_events = 0
+        self.failed_flushes = 0
+
+    def init_app(self, app):
+        """ربط العداد بقاعدة بيانات التطبيق وتشغيل خيط التفريغ"""
+        from app.models import db
+
+        settings = app.config.get('PERFORMANCE_SETTINGS', {})
+        self.flush_interval = settings.get('VIEW_COUNTER_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_size = settings.get('VIEW_COUNTER_FLUSH_SIZE', self.flush_size)
+
+        with app.app_context():
+            self._engine = db.engine
+
+        app.extensions['impression_counter'] = self
+        self.start()
+
+    def start(self):
+        """تشغيل خيط التفريغ الدوري"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='impression-counter', daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """إيقاف الخيط وتفريغ ما تبقى قبل الخروج"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def record_view(self, banner_id, count=1):
+        """تسجيل مشاهدة"""
+        self._record(banner_id, count, 0)
+
+    def record_click(self, banner_id, count=1):
+        """تسجيل نقرة"""
+        self._record(banner_id, 0, count)
+
+    @property
+    def pending_size(self):
+        """عدد الأحداث المعلقة التي لم تُكتب بعد"""
+        return self._pending_events
+
+    def metrics(self):
+        """مقاييس العداد"""
+        return {
+            'pending_events': self._pending_events,
+            'pending_banners': len(self._pending),
+            'flushed_batches': self.flushed_batches,
+            'flushed_events': self.flushed_events,
+            'failed_flushes': self.failed_flushes
+        }
+
+    def flush(self):
+        """كتابة الفروق المجمعة في معاملة واحدة"""
+        if self._engine is None:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, events = self._pending, self._pending_events
+                self._pending = defaultdict(lambda: [0, 0])
+                self._pending_events = 0
+
+            rows = [
+                {'banner_id': banner_id, 'views': views, 'clicks': clicks}
+                for banner_id, (views, clicks) in pending.items()
+            ]
+            try:
+                with self._engine.begin() as conn:
+                    conn.execute(FLUSH_STATEMENT, rows)
+            except Exception as e:
+                logger.error(f"خطأ في تفريغ عداد المشاهدات: {str(e)}")
+                self.failed_flushes += 1
+                self._restore(pending, events)
+                return 0
+
+            self.flushed_batches += 1
+            self.flushed_events += events
+            return events
+
+    def _record(self, banner_id, views, clicks):
+        with self._lock:
+            delta = self._pending[banner_id]
+            delta[0] += views
+            delta[1] += clicks
+            self._pending_events += views + clicks
+            full = self._pending_events >= self.flush_size
+        if full:
+            self._wake.set()
+
+    def _restore(self, pending, events):
+        """إعادة الفروق إلى المخزن المؤقت عند فشل الكتابة"""
+        with self._lock:
+            for banner_id, (views, clicks) in pending.items():
+                delta = self._pending[banner_id]
+                delta[0] += views
+                delta[1] += clicks
+            self._pending_events += events
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+# نسخة مشتركة على مستوى العملية
+impression_counter = ImpressionCounter()
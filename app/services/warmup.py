@@ -0,0 +1,47 @@
+"""
+تسخين الذاكرة المؤقتة عند بدء التشغيل - مشروع نائبك
+Placement cache warm-up for the Flask app
+"""
+from urllib.parse import quote
+
+from flask import request
+
+from cache_warmup import CacheWarmer, is_warmup_request
+from app.services.response_cache import SUPPORTED_LOCALES
+
+
+def warmup_paths():
+    """مسارات البانرات الحالية لكل موضع ولكل صفحة منشورة"""
+    from app.models import db
+    from app.models.models import BannerPosition, PageBanner
+
+    position_ids = db.session.query(BannerPosition.id).filter(
+        BannerPosition.is_active == True
+    ).order_by(BannerPosition.id)
+    page_keys = db.session.query(PageBanner.page_key).filter(
+        PageBanner.is_active == True,
+        PageBanner.is_published == True
+    ).order_by(PageBanner.page_key)
+
+    paths = ['/api/v1/banners/current']
+    paths.extend(f'/api/v1/banners/current?position={position_id}' for (position_id,) in position_ids)
+    paths.extend(f'/api/v1/banners/page/{quote(page_key, safe="")}' for (page_key,) in page_keys)
+    return paths
+
+
+def init_app(app):
+    """تسخين الاستجابات في الخلفية؛ فحص الجاهزية ينتظر انتهاءه"""
+    settings = app.config.get('PERFORMANCE_SETTINGS', {})
+
+    # طلبات التسخين لا تُحسب ضمن حدود المعدل
+    app.limiter.request_filter(lambda: is_warmup_request(request.environ))
+    app.extensions['cache_warmer'] = cache_warmer
+
+    if settings.get('CACHE_WARMUP_ON_STARTUP', True):
+        cache_warmer.start(app, warmup_paths)
+    else:
+        cache_warmer.mark_ready()
+
+
+# نسخة مشتركة على مستوى العملية
+cache_warmer = CacheWarmer(locales=SUPPORTED_LOCALES)
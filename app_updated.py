@@ -10,13 +10,35 @@ from flask_caching import Cache
 from flask_compress import Compress
 import os
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import sqlite3
+import click
 
 # استيراد التكوين والنماذج
 from config_updated import get_config, SERVICE_INFO, API_SETTINGS
 from app.models import db
 from app.utils.load_data import load_all_data
+from app.services.view_counter import impression_counter
+from app.services.stats_rollup import stats_rollup
+from app.services.range_analytics import RangeAnalytics
+from app.services import activation
+from app.services.activation import activation_timeline
+from app.services.expiry_sweeper import expiry_sweeper
+from app.services.serialization import serialize_banners
+from app.services import response_cache
+from app.services.response_cache import cached_response, placement_cache, request_key
+from app.services import warmup
+from app.services import dashboard_stats
+from app.services.dashboard_stats import service_stats
+from app.services.warmup import cache_warmer, warmup_paths
+from cache_warmup import is_warmup_request
+from invalidation import invalidation_bus
+from placement_cache import TAG_BANNERS, banner_tag, page_tag, position_tag
+from json_provider import dumps_bytes, init_json
+from keyset import InvalidCursor, decode_cursor, encode_cursor, seek_after, sort_key
+from keyset import order_by as keyset_order_by
+from serving_indexes import ensure_indexes
+from event_pipeline import BannerEventPipeline, make_engine_writer
 
 # إعداد السجلات
 logging.basicConfig(
@@ -37,6 +59,9 @@ def create_app(config_name=None):
         config_class = get_config()
         app.config.from_object(config_class)
     
+    # ترميز JSON سريع عبر orjson
+    init_json(app)
+    
     # إنشاء مجلدات الرفع
     os.makedirs(app.config.get('UPLOAD_FOLDER', 'uploads/banners'), exist_ok=True)
     os.makedirs('logs', exist_ok=True)
@@ -70,6 +95,10 @@ def create_app(config_name=None):
             db.create_all()
             logger.info("تم إنشاء جداول قاعدة البيانات")
             
+            # فهارس العرض لقواعد البيانات المنشأة قبل إضافتها
+            from app.models.models import Banner
+            ensure_indexes(db.engine, Banner.__table__)
+            
             # تحميل البيانات الأساسية إذا كانت قاعدة البيانات فارغة
             from app.models.models import BannerType
             if BannerType.query.count() == 0:
@@ -79,13 +108,84 @@ def create_app(config_name=None):
         except Exception as e:
             logger.error(f"خطأ في إنشاء قاعدة البيانات: {str(e)}")
     
-    # تسجيل المسارات
+    # عداد المشاهدات المجمّع
+    impression_counter.init_app(app)
+    
+    # خط أحداث المشاهدات والنقرات والتجميع اليومي
+    init_event_pipeline(app)
+    stats_rollup.init_app(app)
+    
+    # الخط الزمني لتفعيل البانرات المجدولة وإنهاء صلاحيتها
+    activation.init_app(app)
+    response_cache.init_app(app)
+    expiry_sweeper.init_app(app)
+    dashboard_stats.init_app(app)
+    
+    # تسجيل المسارات والأوامر
     register_routes(app)
+    register_commands(app)
+    
+    # تحميل استجابات المواضع والصفحات قبل أن يُعلن فحص الجاهزية الاستعداد
+    warmup.init_app(app)
     
     logger.info(f"تم تشغيل {SERVICE_INFO['name']} v{SERVICE_INFO['version']}")
     return app
 
 
+def init_event_pipeline(app):
+    """تهيئة خط أحداث البانرات الخلفي"""
+    settings = app.config.get('PERFORMANCE_SETTINGS', {})
+    with app.app_context():
+        writer = make_engine_writer(db.engine)
+    
+    pipeline = BannerEventPipeline(
+        writer=writer,
+        max_queue_size=settings.get('EVENT_QUEUE_SIZE', 10000),
+        batch_size=settings.get('EVENT_BATCH_SIZE', 500),
+        flush_interval=settings.get('EVENT_FLUSH_INTERVAL', 1.0),
+        ip_salt=app.config['SECRET_KEY']
+    )
+    pipeline.start()
+    app.event_pipeline = pipeline
+
+
+def register_commands(app):
+    """تسجيل أوامر سطر الأوامر"""
+    
+    @app.cli.command('rollup-stats')
+    @click.option('--start', 'start_date', type=click.DateTime(formats=['%Y-%m-%d']))
+    @click.option('--end', 'end_date', type=click.DateTime(formats=['%Y-%m-%d']))
+    def rollup_stats(start_date, end_date):
+        """تجميع الأحداث الجديدة، أو إعادة تجميع نطاق من الأيام مع --start و--end"""
+        if start_date and end_date:
+            rows = stats_rollup.backfill(start_date.date(), end_date.date())
+        elif start_date or end_date:
+            raise click.UsageError('--start و--end يُستخدمان معاً')
+        else:
+            rows = stats_rollup.rollup_recent()
+        click.echo(f"تم تجميع {rows} صف إحصائيات")
+    
+    @app.cli.command('expire-banners')
+    def expire_banners():
+        """إيقاف البانرات المنتهية الصلاحية الآن"""
+        expired = expiry_sweeper.sweep()
+        click.echo(f"تم إيقاف {expired} بانر منتهي خلال {expiry_sweeper.last_duration_ms}ms")
+    
+    @app.cli.command('create-indexes')
+    def create_indexes():
+        """إنشاء فهارس جدول البانرات الناقصة في قاعدة بيانات قائمة"""
+        from app.models.models import Banner
+        created = ensure_indexes(db.engine, Banner.__table__)
+        click.echo(f"تم إنشاء {len(created)} فهرس: {', '.join(created) or '-'}")
+    
+    @app.cli.command('warm-cache')
+    def warm_cache():
+        """تسخين استجابات المواضع والصفحات وعرض زمن كل مفتاح"""
+        for result in cache_warmer.warm(app, warmup_paths()):
+            click.echo(f"{result['status']} {result['duration_ms']:>8.2f}ms  {result['path']} [{result['locale']}]")
+        click.echo(f"تم تسخين {len(cache_warmer.results)} استجابة خلال {cache_warmer.duration_ms}ms")
+
+
 def register_routes(app):
     """تسجيل المسارات الأساسية"""
     
@@ -152,12 +252,15 @@ def register_routes(app):
             types_count = BannerType.query.count()
             positions_count = BannerPosition.query.count()
             
-            if types_count > 0 and positions_count > 0:
-                status = 'ready'
-                message = 'Service is ready to handle requests'
-            else:
+            if types_count == 0 or positions_count == 0:
                 status = 'not_ready'
                 message = 'Initial data not loaded'
+            elif not cache_warmer.ready:
+                status = 'not_ready'
+                message = 'Cache warm-up in progress'
+            else:
+                status = 'ready'
+                message = 'Service is ready to handle requests'
             
             return jsonify({
                 'service': SERVICE_INFO['name'],
@@ -167,7 +270,8 @@ def register_routes(app):
                 'data_status': {
                     'banner_types': types_count,
                     'banner_positions': positions_count
-                }
+                },
+                'cache_warmup': cache_warmer.metrics()
             }), 200 if status == 'ready' else 503
             
         except Exception as e:
@@ -178,33 +282,80 @@ def register_routes(app):
                 'timestamp': datetime.utcnow().isoformat()
             }), 503
     
+    @app.route('/api/v1/metrics')
+    def get_metrics():
+        """مقاييس المكونات الداخلية للخدمة"""
+        return jsonify({
+            'success': True,
+            'data': {
+                'impression_counter': impression_counter.metrics(),
+                'event_pipeline': app.event_pipeline.metrics(),
+                'stats_rollup': stats_rollup.metrics(),
+                'activation_timeline': activation_timeline.metrics(),
+                'expiry_sweeper': expiry_sweeper.metrics(),
+                'invalidation': invalidation_bus.metrics(),
+                'placement_cache': placement_cache.metrics(),
+                'cache_warmup': cache_warmer.metrics(),
+                'service_stats': service_stats.metrics()
+            },
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    
     @app.route('/api/v1/banners/current')
     @app.limiter.limit("50 per minute")
-    @app.cache.cached(timeout=300)  # 5 دقائق
     def get_current_banners():
         """الحصول على البانرات النشطة حالياً"""
         try:
             from app.models.models import Banner
             
-            # البحث عن البانرات النشطة
-            current_banners = Banner.query.filter(
-                Banner.is_active == True,
-                Banner.is_published == True
-            ).order_by(Banner.priority.asc()).limit(5).all()
+            position = request.args.get('position', type=int)
             
-            # تحويل إلى JSON
-            banners_data = []
-            for banner in current_banners:
-                if banner.is_active_now():
-                    banner.increment_view_count()
-                    banners_data.append(banner.to_dict())
+            # المفتاح يتضمن بصمة المجموعة الحية فيتغير عند بدء أو انتهاء أي بانر
+            key = request_key('banners.current', {'position': position}, activation_timeline.live_digest)
             
-            return jsonify({
-                'success': True,
-                'data': banners_data,
-                'count': len(banners_data),
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            def build():
+                # البانرات الحية من الخط الزمني (الحالة والتواريخ والجدولة محسوبة مسبقاً)
+                # مع إعادة التحقق من الحالة، فالمجموعة الحية في العمال الآخرين قد تتأخر عن التعديل
+                live_ids = activation_timeline.live_ids
+                query = Banner.query.filter(
+                    Banner.id.in_(live_ids),
+                    Banner.is_active == True,
+                    Banner.is_published == True
+                )
+                if position:
+                    # المساواة على بادئة ix_banners_serving والقراءة بترتيب الأولوية دون فرز
+                    query = query.filter(Banner.position_id == position)
+                current_banners = query.order_by(Banner.priority.asc()).limit(5).all() if live_ids else []
+                
+                # تحويل إلى JSON دفعة واحدة وتخزين البايتات الجاهزة
+                banners_data = serialize_banners(current_banners)
+                tags = [position_tag(position) if position else TAG_BANNERS]
+                tags.extend(banner_tag(banner.id) for banner in current_banners)
+                return {
+                    'body': dumps_bytes({
+                        'success': True,
+                        'data': banners_data,
+                        'count': len(banners_data),
+                        'timestamp': datetime.utcnow()
+                    }),
+                    'tags': tags,
+                    'banner_ids': [banner.id for banner in current_banners]
+                }
+            
+            # طلب واحد يعيد البناء عند انتهاء الصلاحية والبقية ينتظرونه أو يأخذون النسخة السابقة
+            entry = placement_cache.get_or_build(key, build)
+            
+            # المشاهدات تُسجل لكل طلب حتى عند خدمته من الذاكرة المؤقتة، عدا طلبات التسخين
+            for banner_id in ([] if is_warmup_request(request.environ) else entry.banner_ids):
+                impression_counter.record_view(banner_id)
+                app.event_pipeline.enqueue_view(
+                    banner_id,
+                    user_agent=request.headers.get('User-Agent', ''),
+                    ip_address=request.remote_addr,
+                    referrer=request.headers.get('Referer', '')
+                )
+            
+            return cached_response(entry)
             
         except Exception as e:
             logger.error(f"خطأ في جلب البانرات الحالية: {str(e)}")
@@ -217,9 +368,9 @@ def register_routes(app):
     @app.route('/api/v1/banners')
     @app.limiter.limit("30 per minute")
     def get_all_banners():
-        """الحصول على جميع البانرات"""
+        """الحصول على جميع البانرات (بأرقام الصفحات، أو بالمؤشر عند تمرير cursor)"""
         try:
-            from app.models.models import Banner
+            from app.models.models import BANNER_LISTING_ORDER, Banner
             
             # معاملات البحث
             page = request.args.get('page', 1, type=int)
@@ -227,6 +378,21 @@ def register_routes(app):
             is_active = request.args.get('is_active', type=bool)
             banner_type = request.args.get('type', type=int)
             
+            # وجود cursor (ولو فارغاً للصفحة الأولى) يفعّل الترقيم بالمؤشر
+            keyset_mode = 'cursor' in request.args
+            cursor = request.args.get('cursor', '')
+            include_total = request.args.get('include_total', 'false').lower() == 'true'
+            
+            key = request_key('banners.list', {
+                'page': None if keyset_mode else page, 'per_page': per_page,
+                'is_active': is_active, 'type': banner_type,
+                'mode': 'keyset' if keyset_mode else None, 'cursor': cursor,
+                'include_total': include_total if keyset_mode else None
+            }, activation_timeline.live_digest)
+            entry = placement_cache.get(key)
+            if entry is not None:
+                return cached_response(entry)
+            
             # بناء الاستعلام
             query = Banner.query
             
@@ -236,32 +402,136 @@ def register_routes(app):
             if banner_type:
                 query = query.filter(Banner.type_id == banner_type)
             
-            # ترتيب وتقسيم الصفحات
-            banners = query.order_by(
-                Banner.priority.asc(),
-                Banner.created_at.desc()
-            ).paginate(
-                page=page,
-                per_page=per_page,
-                error_out=False
-            )
-            
-            return jsonify({
-                'success': True,
-                'data': [banner.to_dict() for banner in banners.items],
-                'pagination': {
+            if keyset_mode:
+                # البحث بعد آخر صف في الصفحة السابقة بدل تخطي الصفوف بـ OFFSET،
+                # فتكلفة الصفحات العميقة كالأولى عبر الفهرس ix_banners_listing
+                secret = app.config['SECRET_KEY']
+                # القيم الفارغة تُقارن بعد استبدالها كي لا تتخطى الصفحات صفوفاً بـ NULL
+                order = BANNER_LISTING_ORDER
+                page_query = query
+                if cursor:
+                    page_query = query.filter(seek_after(order, decode_cursor(cursor, secret, len(order))))
+                rows = page_query.order_by(*keyset_order_by(order)).limit(per_page + 1).all()
+                items = rows[:per_page]
+                has_next = len(rows) > per_page
+                pagination = {
+                    'per_page': per_page,
+                    'has_next': has_next,
+                    'next_cursor': encode_cursor(sort_key(items[-1], order), secret) if has_next else None
+                }
+                # العدد الكلي اختياري لأنه يتطلب COUNT(*) على كامل النتائج
+                if include_total:
+                    pagination['total'] = query.order_by(None).count()
+            else:
+                # ترتيب وتقسيم الصفحات
+                banners = query.order_by(*keyset_order_by(BANNER_LISTING_ORDER)).paginate(
+                    page=page,
+                    per_page=per_page,
+                    error_out=False
+                )
+                items = banners.items
+                pagination = {
                     'page': page,
                     'per_page': per_page,
                     'total': banners.total,
                     'pages': banners.pages,
                     'has_next': banners.has_next,
                     'has_prev': banners.has_prev
+                }
+            
+            entry = placement_cache.put(key, dumps_bytes({
+                'success': True,
+                'data': serialize_banners(items),
+                'pagination': pagination,
+                'timestamp': datetime.utcnow()
+            }), tags=[TAG_BANNERS])
+            return cached_response(entry)
+            
+        except InvalidCursor as e:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid cursor',
+                'message': str(e)
+            }), 400
+        except Exception as e:
+            logger.error(f"خطأ في جلب البانرات: {str(e)}")
+            return jsonify({
+                'success': False,
+                'error': 'Internal server error',
+                'message': str(e)
+            }), 500
+    
+    @app.route('/api/v1/banners/<int:banner_id>/stats')
+    @app.limiter.limit("30 per minute")
+    def get_banner_stats(banner_id):
+        """إحصائيات بانر من الصفوف اليومية المجمعة"""
+        try:
+            start_date = request.args.get('start', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date())
+            end_date = request.args.get('end', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date())
+            
+            daily = stats_rollup.daily_stats(banner_id, start_date, end_date)
+            summary = stats_rollup.summarize(banner_id, start_date, end_date)
+            
+            return jsonify({
+                'success': True,
+                'data': {
+                    'summary': {
+                        **summary,
+                        'last_date': summary['last_date'].isoformat() if summary['last_date'] else None
+                    },
+                    'daily': [
+                        {
+                            'date': row['date'].isoformat(),
+                            'views': row['views'],
+                            'clicks': row['clicks'],
+                            'unique_views': row['unique_views'],
+                            'unique_clicks': row['unique_clicks'],
+                            'ctr': row['ctr']
+                        }
+                        for row in daily
+                    ]
                 },
                 'timestamp': datetime.utcnow().isoformat()
             })
             
         except Exception as e:
-            logger.error(f"خطأ في جلب البانرات: {str(e)}")
+            logger.error(f"خطأ في جلب إحصائيات البانر: {str(e)}")
+            return jsonify({
+                'success': False,
+                'error': 'Internal server error',
+                'message': str(e)
+            }), 500
+    
+    @app.route('/api/v1/analytics')
+    @app.limiter.limit("20 per minute")
+    def get_range_analytics():
+        """تحليلات عدة بانرات ومواضعها لنطاق زمني في استدعاء واحد"""
+        try:
+            parse_date = lambda v: datetime.strptime(v, '%Y-%m-%d').date()
+            end_date = request.args.get('end', type=parse_date) or datetime.utcnow().date()
+            start_date = request.args.get('start', type=parse_date) or end_date - timedelta(days=29)
+            window = max(request.args.get('window', 7, type=int), 1)
+            banner_ids = [
+                int(v) for v in request.args.get('banner_ids', '').split(',') if v.strip().isdigit()
+            ]
+            
+            if start_date > end_date or (end_date - start_date).days > 366:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid date range',
+                    'message': 'start must be before end and the range at most one year'
+                }), 400
+            
+            analytics = RangeAnalytics(db.engine)
+            
+            return jsonify({
+                'success': True,
+                'data': analytics.query(start_date, end_date, banner_ids or None, window),
+                'timestamp': datetime.utcnow().isoformat()
+            })
+            
+        except Exception as e:
+            logger.error(f"خطأ في جلب التحليلات: {str(e)}")
             return jsonify({
                 'success': False,
                 'error': 'Internal server error',
@@ -306,30 +576,40 @@ def register_routes(app):
     
     @app.route('/api/v1/banners/page/<page_key>')
     @app.limiter.limit("30 per minute")
-    @app.cache.cached(timeout=600)  # 10 دقائق
     def get_page_banner(page_key):
         """الحصول على بانر صفحة معينة"""
         try:
             from app.models.models import PageBanner
             
-            page_banner = PageBanner.query.filter_by(
-                page_key=page_key,
-                is_active=True,
-                is_published=True
-            ).first()
+            key = request_key('banners.page', {'page_key': page_key})
+            
+            def build():
+                page_banner = PageBanner.query.filter_by(
+                    page_key=page_key,
+                    is_active=True,
+                    is_published=True
+                ).first()
+                if not page_banner:
+                    return None
+                return {
+                    'body': dumps_bytes({
+                        'success': True,
+                        'data': page_banner.to_dict(),
+                        'timestamp': datetime.utcnow()
+                    }),
+                    'tags': [page_tag(page_key)],
+                    'last_modified': page_banner.updated_at
+                }
             
-            if not page_banner:
+            entry = placement_cache.get_or_build(key, build)
+            if entry is None:
                 return jsonify({
                     'success': False,
                     'error': 'Page banner not found',
                     'message': f'No banner found for page {page_key}'
                 }), 404
             
-            return jsonify({
-                'success': True,
-                'data': page_banner.to_dict(),
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            return cached_response(entry)
             
         except Exception as e:
             logger.error(f"خطأ في جلب بانر الصفحة: {str(e)}")
@@ -344,31 +624,8 @@ def register_routes(app):
     def get_service_stats():
         """إحصائيات الخدمة"""
         try:
-            from app.models.models import (
-                Banner, BannerType, BannerPosition, 
-                UserBanner, PageBanner, BannerStats
-            )
-            
-            stats = {
-                'banners': {
-                    'total': Banner.query.count(),
-                    'active': Banner.query.filter_by(is_active=True).count(),
-                    'published': Banner.query.filter_by(is_published=True).count()
-                },
-                'user_banners': {
-                    'total': UserBanner.query.count(),
-                    'active': UserBanner.query.filter_by(is_active=True).count(),
-                    'approved': UserBanner.query.filter_by(is_approved=True).count()
-                },
-                'page_banners': {
-                    'total': PageBanner.query.count(),
-                    'active': PageBanner.query.filter_by(is_active=True).count(),
-                    'published': PageBanner.query.filter_by(is_published=True).count()
-                },
-                'types': BannerType.query.count(),
-                'positions': BannerPosition.query.count(),
-                'service_info': SERVICE_INFO
-            }
+            # ثلاثة استعلامات تجميع شرطي على الأكثر، ولا شيء إن كانت الذاكرة المؤقتة صالحة
+            stats = dict(dashboard_stats.get_service_stats(), service_info=SERVICE_INFO)
             
             return jsonify({
                 'success': True,
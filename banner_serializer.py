@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Batch Banner Serialization - Naebak Project
+
+This module turns banners into API dictionaries. The per-object helpers are used
+by the models' to_dict() methods; BannerSerializer serializes a whole page of
+banners with a fixed number of queries, loading the referenced types and
+positions (with their banner counts) in one query each instead of lazily per row.
+Datetimes are left as datetime objects for the JSON provider to encode.
+"""
+
+import json
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, func, select, true
+
+
+def parse_metadata(raw: Optional[str]) -> Dict[str, Any]:
+    """
+    Parses a banner's metadata JSON.
+
+    Args:
+        raw (Optional[str]): The stored JSON text.
+
+    Returns:
+        Dict[str, Any]: The metadata, or an empty dict if missing or invalid.
+    """
+    if raw:
+        try:
+            return json.loads(raw)
+        except (TypeError, ValueError):
+            return {}
+    return {}
+
+
+def is_within_dates(banner: Any, now: datetime) -> bool:
+    """
+    Checks a banner's status flags and date range.
+
+    Args:
+        banner (Any): An object with is_active, is_published, start_date and end_date.
+        now (datetime): The naive UTC instant.
+
+    Returns:
+        bool: Whether the banner should be served at that instant.
+    """
+    if not banner.is_active or not banner.is_published:
+        return False
+    if banner.start_date and now < banner.start_date:
+        return False
+    if banner.end_date and now > banner.end_date:
+        return False
+    return True
+
+
+def type_to_dict(banner_type: Any, banners_count: int) -> Dict[str, Any]:
+    """
+    Serializes a banner type.
+
+    Args:
+        banner_type (Any): A BannerType or a row with the same columns.
+        banners_count (int): The number of banners of this type.
+
+    Returns:
+        Dict[str, Any]: The API representation.
+    """
+    return {
+        'id': banner_type.id,
+        'name': banner_type.name,
+        'name_en': banner_type.name_en,
+        'description': banner_type.description,
+        'icon': banner_type.icon,
+        'color': banner_type.color,
+        'priority': banner_type.priority,
+        'is_active': banner_type.is_active,
+        'banners_count': banners_count,
+        'created_at': banner_type.created_at,
+        'updated_at': banner_type.updated_at
+    }
+
+
+def position_to_dict(position: Any, active_banners_count: int) -> Dict[str, Any]:
+    """
+    Serializes a banner position.
+
+    Args:
+        position (Any): A BannerPosition or a row with the same columns.
+        active_banners_count (int): The number of active banners in this position.
+
+    Returns:
+        Dict[str, Any]: The API representation.
+    """
+    return {
+        'id': position.id,
+        'name': position.name,
+        'name_en': position.name_en,
+        'description': position.description,
+        'css_class': position.css_class,
+        'max_banners': position.max_banners,
+        'display_order': position.display_order,
+        'is_active': position.is_active,
+        'active_banners_count': active_banners_count,
+        'created_at': position.created_at,
+        'updated_at': position.updated_at
+    }
+
+
+def banner_to_dict(banner: Any, type_data: Optional[Dict], position_data: Optional[Dict],
+                   is_active_now: bool, metadata: Dict[str, Any],
+                   include_stats: bool = False) -> Dict[str, Any]:
+    """
+    Serializes a banner from its already-resolved parts.
+
+    Args:
+        banner (Any): A Banner or an object with the same attributes.
+        type_data (Optional[Dict]): The serialized banner type.
+        position_data (Optional[Dict]): The serialized banner position.
+        is_active_now (bool): Whether the banner is live.
+        metadata (Dict[str, Any]): The parsed metadata.
+        include_stats (bool): Whether to add view, click and CTR figures.
+
+    Returns:
+        Dict[str, Any]: The API representation.
+    """
+    data = {
+        'id': banner.id,
+        'title': banner.title,
+        'title_en': banner.title_en,
+        'content': banner.content,
+        'content_en': banner.content_en,
+        'image_url': banner.image_url,
+        'link_url': banner.link_url,
+        'link_text': banner.link_text,
+        'link_target': banner.link_target,
+        'type': type_data,
+        'position': position_data,
+        'priority': banner.priority,
+        'start_date': banner.start_date,
+        'end_date': banner.end_date,
+        'is_active': banner.is_active,
+        'is_published': banner.is_published,
+        'is_active_now': is_active_now,
+        'show_close_button': banner.show_close_button,
+        'auto_hide_after': banner.auto_hide_after,
+        'animation_type': banner.animation_type,
+        'custom_css': banner.custom_css,
+        'custom_js': banner.custom_js,
+        'metadata': metadata,
+        'created_at': banner.created_at,
+        'updated_at': banner.updated_at,
+        'published_at': banner.published_at
+    }
+
+    if include_stats:
+        view_count = banner.view_count or 0
+        click_count = banner.click_count or 0
+        data.update({
+            'view_count': view_count,
+            'click_count': click_count,
+            'ctr': round((click_count / max(view_count, 1)) * 100, 2)  # Click Through Rate
+        })
+
+    return data
+
+
+@contextmanager
+def count_queries(engine):
+    """
+    Counts the SQL statements executed on an engine.
+
+    Args:
+        engine: The SQLAlchemy engine.
+
+    Yields:
+        List[str]: The executed statements, filled in as they run.
+    """
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', _record)
+
+
+class BannerSerializer:
+    """
+    Serializes lists of banners with a constant number of queries.
+
+    The types and positions referenced by a batch are loaded with one query
+    each, their banner counts computed by correlated subqueries in the same
+    statement. Metadata strings are parsed once per distinct value, and the
+    live check uses a snapshot of live IDs when one is given, so serializing
+    a page costs at most two queries however many banners it holds.
+
+    Banners only need the attributes read by banner_to_dict(), plus type_id and
+    position_id; they may be ORM objects or plain rows.
+    """
+
+    def __init__(self, banners_table, types_table, positions_table):
+        """
+        Initialize the serializer.
+
+        Args:
+            banners_table: The banners Table.
+            types_table: The banner_types Table.
+            positions_table: The banner_positions Table.
+        """
+        self.banners = banners_table
+        self.types = types_table
+        self.positions = positions_table
+
+    def load_references(self, conn, type_ids: Iterable[int],
+                        position_ids: Iterable[int]) -> Tuple[Dict[int, Dict], Dict[int, Dict]]:
+        """
+        Loads and serializes the given types and positions.
+
+        Args:
+            conn: A SQLAlchemy Connection or Session.
+            type_ids (Iterable[int]): The banner type IDs.
+            position_ids (Iterable[int]): The banner position IDs.
+
+        Returns:
+            Tuple[Dict[int, Dict], Dict[int, Dict]]: Serialized types and positions by ID.
+        """
+        banners, types, positions = self.banners, self.types, self.positions
+        type_ids, position_ids = set(type_ids), set(position_ids)
+
+        type_data = {}
+        if type_ids:
+            banners_count = select(func.count()).where(
+                banners.c.type_id == types.c.id
+            ).correlate(types).scalar_subquery().label('banners_count')
+            query = select(types, banners_count).where(types.c.id.in_(type_ids))
+            for row in conn.execute(query):
+                type_data[row.id] = type_to_dict(row, row.banners_count)
+
+        position_data = {}
+        if position_ids:
+            active_count = select(func.count()).where(
+                banners.c.position_id == positions.c.id,
+                banners.c.is_active == true()
+            ).correlate(positions).scalar_subquery().label('active_banners_count')
+            query = select(positions, active_count).where(positions.c.id.in_(position_ids))
+            for row in conn.execute(query):
+                position_data[row.id] = position_to_dict(row, row.active_banners_count)
+
+        return type_data, position_data
+
+    def serialize(self, conn, banners: Iterable[Any], include_stats: bool = False,
+                  live_ids: Optional[Iterable[int]] = None,
+                  now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Serializes banners in bulk.
+
+        Args:
+            conn: A SQLAlchemy Connection or Session.
+            banners (Iterable[Any]): The banners, in output order.
+            include_stats (bool): Whether to add view, click and CTR figures.
+            live_ids (Optional[Iterable[int]]): The live banner IDs; None checks
+                each banner's flags and dates instead.
+            now (Optional[datetime]): The naive UTC instant for the date check.
+
+        Returns:
+            List[Dict[str, Any]]: The serialized banners.
+        """
+        banners = list(banners)
+        if not banners:
+            return []
+
+        type_data, position_data = self.load_references(
+            conn,
+            (banner.type_id for banner in banners if banner.type_id is not None),
+            (banner.position_id for banner in banners if banner.position_id is not None)
+        )
+
+        if live_ids is not None:
+            live_ids = live_ids if isinstance(live_ids, (set, frozenset)) else set(live_ids)
+            is_live: Callable[[Any], bool] = lambda banner: banner.id in live_ids
+        else:
+            now = now or datetime.utcnow()
+            is_live = lambda banner: is_within_dates(banner, now)
+
+        # Banners usually share a handful of metadata payloads; the parsed
+        # dicts are shared between entries and must be treated as read-only
+        parsed = {}
+        result = []
+        for banner in banners:
+            raw = banner.metadata_json
+            metadata = parsed.get(raw)
+            if metadata is None:
+                metadata = parsed[raw] = parse_metadata(raw)
+            result.append(banner_to_dict(
+                banner,
+                type_data.get(banner.type_id),
+                position_data.get(banner.position_id),
+                is_live(banner),
+                metadata,
+                include_stats
+            ))
+        return result
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Cache Warm-Up - Naebak Project
+
+This module loads responses into the server-side caches right after startup by
+requesting them through the application itself, so the first real requests to
+each placement after a deploy are served from memory instead of a cold cache
+and a cold database. Warm-up requests run the same route code as real ones but
+are marked in the WSGI environ, so routes and rate limits can tell them apart.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# WSGI environ flag carried by warm-up requests; clients cannot set it
+WARMUP_ENVIRON_KEY = 'naebak.warmup'
+
+
+def is_warmup_request(environ: dict) -> bool:
+    """
+    Checks whether a request was issued by the cache warmer.
+
+    Args:
+        environ (dict): The request's WSGI environ.
+
+    Returns:
+        bool: True for warm-up requests.
+    """
+    return bool(environ.get(WARMUP_ENVIRON_KEY))
+
+
+class CacheWarmer:
+    """
+    Requests a list of paths through a Flask app to fill its caches.
+
+    Each path is requested once per locale, since cached placement responses
+    are keyed by locale. The warmer reports ready once a warm-up has finished,
+    whether or not every request succeeded: a cold cache is slower, not wrong,
+    and should not keep an instance out of rotation.
+
+    Attributes:
+        locales (Sequence[Optional[str]]): Accept-Language values to warm; None
+            sends no header.
+        results (List[Dict[str, object]]): Path, locale, status and duration
+            of each request in the last warm-up.
+        duration_ms (float): How long the last warm-up took.
+        errors (int): Requests that raised or returned a server error.
+    """
+
+    def __init__(self, locales: Sequence[Optional[str]] = (None,)):
+        """
+        Initialize the warmer.
+
+        Args:
+            locales (Sequence[Optional[str]]): Accept-Language values to warm.
+        """
+        self.locales = tuple(locales)
+        self.results: List[Dict[str, object]] = []
+        self.duration_ms = 0.0
+        self.errors = 0
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether a warm-up has finished or been skipped."""
+        return self._ready.is_set()
+
+    def mark_ready(self):
+        """Reports ready without warming, e.g. when warm-up is disabled."""
+        self._ready.set()
+
+    def warm(self, app, paths: Iterable[str], locales: Optional[Sequence[Optional[str]]] = None
+             ) -> List[Dict[str, object]]:
+        """
+        Requests every path in every locale and logs each request's timing.
+
+        Args:
+            app (Flask): The application.
+            paths (Iterable[str]): The paths, including any query string.
+            locales (Optional[Sequence[Optional[str]]]): Overrides the locales.
+
+        Returns:
+            List[Dict[str, object]]: One result per request.
+        """
+        client = app.test_client()
+        results = []
+        errors = 0
+        started = time.perf_counter()
+
+        for path in paths:
+            for locale in (self.locales if locales is None else locales):
+                headers = {'Accept-Language': locale} if locale else {}
+                request_started = time.perf_counter()
+                try:
+                    status = client.get(path, headers=headers,
+                                        environ_base={WARMUP_ENVIRON_KEY: True}).status_code
+                except Exception as e:
+                    logger.warning(f"Cache warm-up of {path} failed: {str(e)}")
+                    status = None
+                elapsed_ms = round((time.perf_counter() - request_started) * 1000, 2)
+                if status is None or status >= 500:
+                    errors += 1
+                logger.info(f"Cache warm-up {path} [{locale or '-'}]: {status} in {elapsed_ms}ms")
+                results.append({'path': path, 'locale': locale, 'status': status, 'duration_ms': elapsed_ms})
+
+        self.results = results
+        self.errors = errors
+        self.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"Cache warm-up finished: {len(results)} requests in {self.duration_ms}ms, {errors} errors")
+        self._ready.set()
+        return results
+
+    def start(self, app, paths: Callable[[], Iterable[str]]):
+        """
+        Warms the caches in a background thread.
+
+        Args:
+            app (Flask): The application.
+            paths (Callable[[], Iterable[str]]): Returns the paths to warm; it is
+                called inside an application context.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, args=(app, paths), name='cache-warmup', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the warm-up to finish.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait.
+
+        Returns:
+            bool: True if the warmer is ready.
+        """
+        return self._ready.wait(timeout)
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        Returns warm-up counters for monitoring.
+
+        Returns:
+            Dict[str, object]: Readiness, request and error counts, and duration.
+        """
+        return {
+            'ready': self.ready,
+            'requests': len(self.results),
+            'errors': self.errors,
+            'duration_ms': self.duration_ms
+        }
+
+    def _run(self, app, paths: Callable[[], Iterable[str]]):
+        try:
+            with app.app_context():
+                path_list = list(paths())
+            self.warm(app, path_list)
+        except Exception as e:
+            logger.error(f"Cache warm-up failed: {str(e)}")
+        finally:
+            self._ready.set()
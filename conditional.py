@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Conditional GET Helpers - Naebak Project
+
+This module adds ETag / If-None-Match and Last-Modified / If-Modified-Since
+handling to read endpoints. Validators can be derived from what a response is
+built from (e.g. banner IDs and their last update times) and checked before
+anything is serialized, so a poll that finds nothing new costs a 304 with no body.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Any, Optional
+
+from flask import current_app, request
+from werkzeug.http import is_resource_modified, unquote_etag
+
+
+def make_etag(*parts: Any, weak: bool = True) -> str:
+    """
+    Builds an entity tag from the values a response is derived from.
+
+    Args:
+        *parts (Any): Values whose repr identifies the response content.
+        weak (bool): Whether to mark the tag as weak. Tags derived from inputs
+            rather than from the body bytes should be weak.
+
+    Returns:
+        str: The quoted entity tag.
+    """
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def is_not_modified(etag: Optional[str] = None, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Checks the current request's conditional headers.
+
+    Args:
+        etag (Optional[str]): The quoted entity tag of the current representation.
+        last_modified (Optional[datetime]): When the representation last changed (UTC).
+
+    Returns:
+        bool: True if the client's copy is still current.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if etag is None and last_modified is None:
+        return False
+    return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+
+def not_modified(etag: Optional[str] = None, last_modified: Optional[datetime] = None):
+    """
+    Builds an empty 304 response carrying the validators.
+
+    Args:
+        etag (Optional[str]): The quoted entity tag.
+        last_modified (Optional[datetime]): The last modification time (UTC).
+
+    Returns:
+        Response: The 304 response.
+    """
+    response = current_app.response_class(status=304)
+    response.headers.remove('Content-Type')
+    _set_validators(response, etag, last_modified)
+    return response
+
+
+def conditional(response, etag: Optional[str] = None, last_modified: Optional[datetime] = None):
+    """
+    Adds validators to a response and turns it into a 304 if the client is current.
+
+    Without an explicit ETag, one is computed from the body.
+
+    Args:
+        response (Response): The full response.
+        etag (Optional[str]): The quoted entity tag.
+        last_modified (Optional[datetime]): The last modification time (UTC).
+
+    Returns:
+        Response: The response, possibly converted to 304.
+    """
+    _set_validators(response, etag, last_modified)
+    if etag is None and response.status_code == 200:
+        response.add_etag()
+    return response.make_conditional(request)
+
+
+def _set_validators(response, etag: Optional[str], last_modified: Optional[datetime]):
+    if etag is not None:
+        response.set_etag(*unquote_etag(etag))
+    if last_modified is not None:
+        response.last_modified = last_modified
@@ -34,6 +34,8 @@ class Config:
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads/banners')
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 5242880))  # 5MB
     ALLOWED_EXTENSIONS = set(os.environ.get('ALLOWED_EXTENSIONS', 'jpg,jpeg,png,gif,webp,svg').split(','))
+    UPLOAD_STAGING_FOLDER = os.environ.get('UPLOAD_STAGING_FOLDER', 'uploads/staging')
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
     
     # إعدادات Google Cloud Storage
     GCS_BUCKET_NAME = os.environ.get('GCS_BUCKET_NAME', 'naebak-banners-storage')
@@ -74,6 +76,9 @@ class Config:
     MONITORING_ENABLED = os.environ.get('MONITORING_ENABLED', 'false').lower() == 'true'
     HEALTH_CHECK_INTERVAL = int(os.environ.get('HEALTH_CHECK_INTERVAL', 60))
     ANALYTICS_TRACKING = os.environ.get('ANALYTICS_TRACKING', 'true').lower() == 'true'
+    EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', 10000))
+    EVENT_BATCH_SIZE = int(os.environ.get('EVENT_BATCH_SIZE', 500))
+    EVENT_FLUSH_INTERVAL = float(os.environ.get('EVENT_FLUSH_INTERVAL', 1.0))  # بالثواني
     
     # إعدادات الخدمات الأخرى
     AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'http://localhost:8001')
@@ -65,7 +65,14 @@ class Config:
         'ENABLE_BANNER_ANALYTICS': os.environ.get('ENABLE_BANNER_ANALYTICS', 'true').lower() == 'true',
         'CACHE_DURATION_MINUTES': int(os.environ.get('CACHE_DURATION_MINUTES', '30')),
         'MAX_USER_BANNERS': int(os.environ.get('MAX_USER_BANNERS', '1')),
-        'REQUIRE_ADMIN_APPROVAL': os.environ.get('REQUIRE_ADMIN_APPROVAL', 'true').lower() == 'true'
+        'REQUIRE_ADMIN_APPROVAL': os.environ.get('REQUIRE_ADMIN_APPROVAL', 'true').lower() == 'true',
+        'STATS_ROLLUP_INTERVAL_SECONDS': int(os.environ.get('STATS_ROLLUP_INTERVAL_SECONDS', '300')),
+        'STATS_ROLLUP_SETTLE_SECONDS': int(os.environ.get('STATS_ROLLUP_SETTLE_SECONDS', '60')),
+        'STATS_ROLLUP_IN_PROCESS': os.environ.get('STATS_ROLLUP_IN_PROCESS', 'true').lower() == 'true',
+        'ACTIVATION_RESYNC_SECONDS': int(os.environ.get('ACTIVATION_RESYNC_SECONDS', '300')),
+        'AUTO_EXPIRE_BANNERS': os.environ.get('AUTO_EXPIRE_BANNERS', 'true').lower() == 'true',
+        'EXPIRY_SWEEP_INTERVAL_SECONDS': int(os.environ.get('EXPIRY_SWEEP_INTERVAL_SECONDS', '60')),
+        'EXPIRY_SWEEP_BATCH_SIZE': int(os.environ.get('EXPIRY_SWEEP_BATCH_SIZE', '500'))
     }
     
     # إعدادات الصور
@@ -91,7 +98,21 @@ class Config:
         'COMPRESS_LEVEL': 6,
         'COMPRESS_MIN_SIZE': 500,
         'CACHE_STATIC_FILES': True,
-        'STATIC_FILE_MAX_AGE': 31536000  # سنة واحدة
+        'STATIC_FILE_MAX_AGE': 31536000,  # سنة واحدة
+        'VIEW_COUNTER_FLUSH_INTERVAL': float(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', '5')),  # بالثواني
+        'VIEW_COUNTER_FLUSH_SIZE': int(os.environ.get('VIEW_COUNTER_FLUSH_SIZE', '500')),
+        'EVENT_QUEUE_SIZE': int(os.environ.get('EVENT_QUEUE_SIZE', '10000')),
+        'EVENT_BATCH_SIZE': int(os.environ.get('EVENT_BATCH_SIZE', '500')),
+        'EVENT_FLUSH_INTERVAL': float(os.environ.get('EVENT_FLUSH_INTERVAL', '1')),  # بالثواني
+        'PLACEMENT_CACHE_TTL': int(os.environ.get('PLACEMENT_CACHE_TTL', '300')),  # حد أقصى بالثواني، الإلغاء بالوسوم
+        'PLACEMENT_CACHE_MAX_ENTRIES': int(os.environ.get('PLACEMENT_CACHE_MAX_ENTRIES', '2048')),
+        'PLACEMENT_CACHE_MAX_BYTES': int(os.environ.get('PLACEMENT_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+        'PLACEMENT_CACHE_LOCAL_TTL': int(os.environ.get('PLACEMENT_CACHE_LOCAL_TTL', '30')),  # نسخ Redis في ذاكرة العامل
+        'PLACEMENT_CACHE_STALE_TTL': int(os.environ.get('PLACEMENT_CACHE_STALE_TTL', '60')),  # تقديم النسخة المنتهية أثناء إعادة البناء
+        'PLACEMENT_CACHE_BUILD_TIMEOUT': float(os.environ.get('PLACEMENT_CACHE_BUILD_TIMEOUT', '5')),  # انتظار طلب يعيد البناء
+        'CACHE_WARMUP_ON_STARTUP': os.environ.get('CACHE_WARMUP_ON_STARTUP', 'true').lower() == 'true',
+        'SERVICE_STATS_TTL': int(os.environ.get('SERVICE_STATS_TTL', '30')),  # الكتابات تلغيها فوراً
+        'PLACEMENT_CACHE_BACKEND': os.environ.get('PLACEMENT_CACHE_BACKEND', 'redis')  # redis, memory, local
     }
     
     # إعدادات السجلات
@@ -172,8 +193,22 @@ class TestingConfig(Config):
         'ENABLE_BANNER_ANALYTICS': False,
         'CACHE_DURATION_MINUTES': 1,
         'MAX_USER_BANNERS': 5,
-        'REQUIRE_ADMIN_APPROVAL': False
+        'REQUIRE_ADMIN_APPROVAL': False,
+        'STATS_ROLLUP_INTERVAL_SECONDS': 60,
+        'STATS_ROLLUP_SETTLE_SECONDS': 0,
+        'STATS_ROLLUP_IN_PROCESS': False,
+        'ACTIVATION_RESYNC_SECONDS': 60,
+        'AUTO_EXPIRE_BANNERS': False,
+        'EXPIRY_SWEEP_INTERVAL_SECONDS': 60,
+        'EXPIRY_SWEEP_BATCH_SIZE': 100
     }
+    
+    # طبقة مشتركة داخل العملية بدلاً من خادم Redis
+    PERFORMANCE_SETTINGS = Config.PERFORMANCE_SETTINGS.copy()
+    PERFORMANCE_SETTINGS.update({
+        'PLACEMENT_CACHE_BACKEND': 'memory',
+        'CACHE_WARMUP_ON_STARTUP': False
+    })
 
 
 # تحديد التكوين حسب البيئة
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 """ثوابت وبيانات أساسية لخدمة إدارة البنرات"""
 
+from types import MappingProxyType
+
 # أنواع البنرات
 BANNER_TYPES = [
     {
@@ -229,6 +231,19 @@ SUPPORTED_FILE_TYPES = [
     }
 ]
 
+# نسخ الصور المتجاوبة لكل نوع بنر (تُحسب من المقاس الموصى به)
+IMAGE_RENDITIONS = [
+    {"name": "1x", "scale": 1},
+    {"name": "2x", "scale": 2},
+    {"name": "mobile", "max_width": 480}
+]
+
+# صيغ ترميز النسخ بترتيب التفضيل
+RENDITION_FORMATS = [
+    {"format": "WEBP", "extension": "webp", "mime_type": "image/webp"},
+    {"format": "JPEG", "extension": "jpg", "mime_type": "image/jpeg"}
+]
+
 # إعدادات البنرات
 BANNER_SETTINGS = {
     'MAX_BANNERS_PER_USER': 10,
@@ -275,27 +290,43 @@ POSITION_CHOICES = [(pos['position'], pos['name']) for pos in BANNER_POSITIONS]
 STATUS_CHOICES = [(status['status'], status['name']) for status in BANNER_STATUS]
 CATEGORY_CHOICES = [(cat['category'], cat['name']) for cat in BANNER_CATEGORIES]
 
+# فهارس ثابتة تُبنى مرة واحدة عند الاستيراد للبحث والتحقق بزمن ثابت
+BANNER_TYPES_BY_KEY = MappingProxyType({banner['type']: banner for banner in reversed(BANNER_TYPES)})
+FILE_TYPES_BY_EXTENSION = MappingProxyType({ft['extension']: ft for ft in reversed(SUPPORTED_FILE_TYPES)})
+VALID_BANNER_TYPES = frozenset(BANNER_TYPES_BY_KEY)
+VALID_POSITIONS = frozenset(pos['position'] for pos in BANNER_POSITIONS)
+VALID_CATEGORIES = frozenset(cat['category'] for cat in BANNER_CATEGORIES)
+SUPPORTED_EXTENSIONS = frozenset(FILE_TYPES_BY_EXTENSION)
+
 # وظائف مساعدة
 def get_banner_type_info(banner_type):
     """الحصول على معلومات نوع البنر"""
-    for banner in BANNER_TYPES:
-        if banner['type'] == banner_type:
-            return banner
-    return None
+    return BANNER_TYPES_BY_KEY.get(banner_type)
+
+def get_rendition_widths(banner_type):
+    """الحصول على عروض نسخ الصورة لنوع البنر"""
+    banner_info = get_banner_type_info(banner_type)
+    if not banner_info:
+        return {}
+    base_width = int(banner_info['recommended_size'].split('x')[0])
+    widths = {}
+    for rendition in IMAGE_RENDITIONS:
+        width = base_width * rendition.get('scale', 1)
+        if 'max_width' in rendition:
+            width = min(width, rendition['max_width'])
+        widths[rendition['name']] = width
+    return widths
 
 def get_file_type_info(extension):
     """الحصول على معلومات نوع الملف"""
-    for file_type in SUPPORTED_FILE_TYPES:
-        if file_type['extension'] == extension.lower():
-            return file_type
-    return None
+    return FILE_TYPES_BY_EXTENSION.get(extension.lower())
 
 def is_valid_file_type(filename):
     """التحقق من صحة نوع الملف"""
     if '.' not in filename:
         return False
     extension = filename.rsplit('.', 1)[1].lower()
-    return any(ft['extension'] == extension for ft in SUPPORTED_FILE_TYPES)
+    return extension in SUPPORTED_EXTENSIONS
 
 def get_max_file_size(extension):
     """الحصول على الحد الأقصى لحجم الملف"""
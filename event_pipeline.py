@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Banner Event Pipeline - Naebak Project
+
+This module provides a bounded in-process queue and a background writer for banner
+interaction events. Request handlers enqueue events and return immediately, while the
+writer persists them in batches using multi-row inserts.
+"""
+
+import atexit
+import hashlib
+import hmac
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+# Raw banner interaction events, one row per click or view
+banner_events = Table(
+    'banner_events', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('banner_id', Integer, nullable=False),
+    Column('event_type', String(10), nullable=False),  # click, view
+    Column('occurred_at', DateTime, nullable=False),
+    Column('user_agent', String(500)),
+    Column('ip_hash', String(64)),
+    Column('referrer', String(500)),
+    Index('idx_banner_events_occurred', 'occurred_at', 'banner_id'),
+    # IDs must never be reused: the stats rollup keeps its position as the last event ID
+    sqlite_autoincrement=True,
+)
+
+
+def make_engine_writer(engine) -> Callable[[List[Dict[str, Any]]], None]:
+    """
+    Creates a batch writer that persists events into the banner_events table.
+
+    Each batch is written as a single multi-row INSERT inside one transaction.
+
+    Args:
+        engine: The SQLAlchemy engine to write to.
+
+    Returns:
+        Callable: A function that writes a list of event rows.
+    """
+    banner_events.create(engine, checkfirst=True)
+
+    def write(rows: List[Dict[str, Any]]):
+        with engine.begin() as conn:
+            conn.execute(banner_events.insert().values(rows))
+
+    return write
+
+
+class BannerEventPipeline:
+    """
+    Bounded, asynchronous ingestion pipeline for banner events.
+
+    Events are placed on a bounded queue without blocking. A background thread
+    collects them into batches of up to batch_size events, or whatever arrived
+    within flush_interval seconds, and hands each batch to the writer. When the
+    queue is full new events are dropped and counted instead of slowing down
+    the request.
+
+    Attributes:
+        max_queue_size (int): The maximum number of events waiting to be written.
+        batch_size (int): The maximum number of events per insert.
+        flush_interval (float): The maximum time in seconds an event waits for its batch.
+        enqueued (int): The number of events accepted.
+        dropped (int): The number of events rejected because the queue was full.
+        written (int): The number of events persisted.
+        write_errors (int): The number of batches that failed to persist.
+    """
+
+    def __init__(self, writer: Optional[Callable] = None, max_queue_size: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 1.0, ip_salt: str = ''):
+        """
+        Initialize the pipeline.
+
+        Args:
+            writer (Optional[Callable]): Function that persists a list of event rows.
+            max_queue_size (int): The maximum number of queued events.
+            batch_size (int): The maximum number of events per batch.
+            flush_interval (float): The maximum batching delay in seconds.
+            ip_salt (str): Secret used to hash client IP addresses.
+        """
+        self.writer = writer
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._ip_salt = ip_salt.encode('utf-8')
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.write_errors = 0
+
+    def start(self):
+        """Starts the background writer thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='banner-event-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self, timeout: float = 10.0):
+        """
+        Stops the writer and persists any events still queued.
+
+        Args:
+            timeout (float): How long to wait for the writer thread to finish.
+        """
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                break
+            self._write(batch)
+
+    def hash_ip(self, ip_address: Optional[str]) -> Optional[str]:
+        """
+        Hashes a client IP address so raw addresses are never stored.
+
+        Args:
+            ip_address (Optional[str]): The client IP address.
+
+        Returns:
+            Optional[str]: The hex digest, or None if no address was given.
+        """
+        if not ip_address:
+            return None
+        return hmac.new(self._ip_salt, ip_address.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def enqueue(self, event: Dict[str, Any]) -> bool:
+        """
+        Adds an event row to the queue without blocking.
+
+        Args:
+            event (Dict[str, Any]): The event row to persist.
+
+        Returns:
+            bool: True if the event was queued, False if it was dropped.
+        """
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def enqueue_click(self, banner_id: int, user_agent: str = '',
+                      ip_address: Optional[str] = None, referrer: str = '') -> bool:
+        """
+        Queues a banner click event.
+
+        Args:
+            banner_id (int): The ID of the clicked banner.
+            user_agent (str): The client User-Agent header.
+            ip_address (Optional[str]): The client IP address (stored hashed).
+            referrer (str): The Referer header.
+
+        Returns:
+            bool: True if the event was queued, False if it was dropped.
+        """
+        return self.enqueue(self._make_event('click', banner_id, user_agent, ip_address, referrer))
+
+    def enqueue_view(self, banner_id: int, user_agent: str = '',
+                     ip_address: Optional[str] = None, referrer: str = '') -> bool:
+        """
+        Queues a banner view (impression) event.
+
+        Args:
+            banner_id (int): The ID of the displayed banner.
+            user_agent (str): The client User-Agent header.
+            ip_address (Optional[str]): The client IP address (stored hashed).
+            referrer (str): The Referer header.
+
+        Returns:
+            bool: True if the event was queued, False if it was dropped.
+        """
+        return self.enqueue(self._make_event('view', banner_id, user_agent, ip_address, referrer))
+
+    @property
+    def saturated(self) -> bool:
+        """Whether the queue is at least 80% full."""
+        return self._queue.qsize() >= self.max_queue_size * 0.8
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Returns pipeline counters for monitoring.
+
+        Returns:
+            Dict[str, Any]: Queue depth, throughput and drop counters.
+        """
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_queue_size': self.max_queue_size,
+            'saturated': self.saturated,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'written': self.written,
+            'batches': self.batches,
+            'write_errors': self.write_errors
+        }
+
+    def _make_event(self, event_type: str, banner_id: int, user_agent: str,
+                    ip_address: Optional[str], referrer: str) -> Dict[str, Any]:
+        return {
+            'banner_id': banner_id,
+            'event_type': event_type,
+            'occurred_at': datetime.utcnow(),
+            'user_agent': (user_agent or '')[:500],
+            'ip_hash': self.hash_ip(ip_address),
+            'referrer': (referrer or '')[:500]
+        }
+
+    def _drain(self, block: bool = True) -> List[Dict[str, Any]]:
+        """Collects up to batch_size events, waiting at most flush_interval."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                if block:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        if self.writer is None:
+            self.dropped += len(batch)
+            return
+        try:
+            self.writer(batch)
+        except Exception as e:
+            self.write_errors += 1
+            logger.error(f"Error writing {len(batch)} banner events: {str(e)}")
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain()
+            if batch:
+                self._write(batch)
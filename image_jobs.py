@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Banner Image Jobs - Naebak Project
+
+This module moves banner image processing out of the request cycle. Uploads are
+written to a staging folder and decoded, resized, re-encoded and thumbnailed on a
+pool of worker processes, while the API reports progress through job IDs.
+"""
+
+import io
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+import constants
+from image_store import ContentStore
+
+logger = logging.getLogger(__name__)
+
+# Job states
+JOB_PENDING = 'pending'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+THUMBNAIL_SIZE = (200, 150)
+
+
+def _prepare_for_format(image: Image.Image, image_format: str) -> Image.Image:
+    """Converts an image to a mode the target format can encode."""
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if image_format == 'JPEG':
+        if has_alpha:
+            rgba = image.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            return background
+        return image if image.mode == 'RGB' else image.convert('RGB')
+    if has_alpha:
+        return image if image.mode == 'RGBA' else image.convert('RGBA')
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def _put_image(store: ContentStore, image: Image.Image, image_format: str, extension: str,
+               quality: int) -> Tuple[str, int]:
+    """Encodes an image and stores it under the digest of the encoded bytes."""
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=quality, optimize=True)
+    data = buffer.getvalue()
+    digest, _ = store.put_bytes(data, extension)
+    return store.relative_path(digest, extension), len(data)
+
+
+def generate_renditions(image: Image.Image, output_folder: str, banner_type: str,
+                        quality: int) -> List[Dict[str, Any]]:
+    """
+    Encodes the responsive renditions of a decoded image.
+
+    Every width from constants.get_rendition_widths() is produced from the same
+    decoded image, in each of constants.RENDITION_FORMATS. Files are stored in a
+    ContentStore under the SHA-256 of their bytes, so identical renditions are
+    written only once and their URLs never change content. Widths larger than
+    the source are capped, since upscaling would only add bytes.
+
+    Args:
+        image (Image.Image): The decoded source image.
+        output_folder (str): The root of the content store.
+        banner_type (str): The banner type, used to look up the rendition widths.
+        quality (int): The encoder quality (QUALITY_COMPRESSION).
+
+    Returns:
+        List[Dict[str, Any]]: One record per rendition and format.
+    """
+    widths = constants.get_rendition_widths(banner_type) or {'1x': image.width}
+    store = ContentStore(output_folder)
+
+    renditions = []
+    resized_by_width = {}
+    for name, width in widths.items():
+        width = min(width, image.width)
+        resized = resized_by_width.get(width)
+        if resized is None:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize(
+                (width, height), Image.Resampling.LANCZOS
+            )
+            resized_by_width[width] = resized
+
+        for target in constants.RENDITION_FORMATS:
+            filename, file_size = _put_image(
+                store, _prepare_for_format(resized, target['format']), target['format'],
+                f".{target['extension']}", quality
+            )
+
+            renditions.append({
+                'name': name,
+                'width': resized.width,
+                'height': resized.height,
+                'format': target['extension'],
+                'mime_type': target['mime_type'],
+                'filename': filename,
+                'file_size': file_size
+            })
+    return renditions
+
+
+def process_banner_image(source_path: str, output_folder: str, banner_type: str,
+                         settings: Dict[str, Any], remove_source: bool = True) -> Dict[str, Any]:
+    """
+    Resizes, re-encodes and thumbnails a staged upload.
+
+    This function runs on a worker process, so it only receives and returns
+    picklable values. The upload is decoded once; the resized image, its
+    thumbnail and all responsive renditions are produced from that decode.
+    Like the renditions, the processed image and its thumbnail are stored in a
+    ContentStore under the digest of their own bytes, so a change to the resize
+    or quality settings yields new URLs instead of new content behind old ones.
+    A staged source file is removed once it has been processed.
+
+    Args:
+        source_path (str): The path of the upload; its extension is kept.
+        output_folder (str): The root of the content store.
+        banner_type (str): The banner type, used to look up the recommended size.
+        settings (Dict[str, Any]): IMAGE_OPTIMIZATION, AUTO_RESIZE and QUALITY_COMPRESSION.
+        remove_source (bool): Whether to delete the source file afterwards.
+
+    Returns:
+        Dict[str, Any]: Image metadata matching the ImageInfo fields, plus the renditions.
+    """
+    banner_info = constants.get_banner_type_info(banner_type)
+    quality = settings.get('QUALITY_COMPRESSION', 85)
+    extension = os.path.splitext(source_path)[1].lower()
+    store = ContentStore(output_folder)
+
+    try:
+        with Image.open(source_path) as image:
+            image_format = image.format
+            image.load()
+            renditions = generate_renditions(image, output_folder, banner_type, quality)
+
+            if settings.get('IMAGE_OPTIMIZATION', True) and image_format in ['JPEG', 'JPG']:
+                image = image.convert('RGB')
+
+            if settings.get('AUTO_RESIZE', True) and banner_info:
+                recommended_size = banner_info.get('recommended_size', '').split('x')
+                if len(recommended_size) == 2:
+                    target_size = (int(recommended_size[0]), int(recommended_size[1]))
+                    image.thumbnail(target_size, Image.Resampling.LANCZOS)
+
+            filename, file_size = _put_image(store, image, image_format, extension, quality)
+
+            thumbnail = image.copy()
+            thumbnail.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+            thumbnail_filename, _ = _put_image(store, thumbnail, image_format, extension, quality)
+
+            return {
+                'filename': filename,
+                'file_size': file_size,
+                'width': image.width,
+                'height': image.height,
+                'format': image_format,
+                'upload_path': os.path.join(output_folder, filename),
+                'thumbnail_path': os.path.join(output_folder, thumbnail_filename),
+                'renditions': renditions
+            }
+    finally:
+        if remove_source:
+            try:
+                os.remove(source_path)
+            except OSError:
+                pass
+
+
+class ImageJobQueue:
+    """
+    Process-pool backed queue of banner image jobs.
+
+    The pool is created lazily on the first submission so that it is started
+    after any pre-forking done by the WSGI server. Finished jobs are kept in
+    memory, up to max_retained_jobs, so clients can poll their status.
+
+    Attributes:
+        staging_folder (str): The folder where raw uploads wait for processing.
+        output_folder (str): The folder where processed images are written.
+        max_workers (int): The number of worker processes.
+        settings (Dict[str, Any]): Image processing settings passed to the workers.
+        max_retained_jobs (int): The number of finished jobs kept for status queries.
+    """
+
+    def __init__(self, staging_folder: str, output_folder: str, max_workers: int = 2,
+                 settings: Optional[Dict[str, Any]] = None, max_retained_jobs: int = 1000):
+        """
+        Initialize the job queue.
+
+        Args:
+            staging_folder (str): The folder for staged uploads.
+            output_folder (str): The folder for processed images.
+            max_workers (int): The number of worker processes.
+            settings (Optional[Dict[str, Any]]): Image processing settings.
+            max_retained_jobs (int): The number of finished jobs kept in memory.
+        """
+        self.staging_folder = staging_folder
+        self.output_folder = output_folder
+        self.max_workers = max_workers
+        self.settings = dict(settings or {})
+        self.max_retained_jobs = max_retained_jobs
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        os.makedirs(staging_folder, exist_ok=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def submit(self, file, filename: str, banner_type: str,
+               on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """
+        Stages an upload and schedules it for processing.
+
+        Args:
+            file: The uploaded file object (anything with a save() method).
+            filename (str): The upload's file name; its extension selects the output format.
+            banner_type (str): The banner type of the image.
+            on_complete (Optional[Callable]): Called with the job record once processing succeeds.
+
+        Returns:
+            str: The ID of the new job.
+        """
+        job_id = uuid.uuid4().hex
+        staged_path = os.path.join(self.staging_folder, f"{job_id}{os.path.splitext(filename)[1]}")
+        file.save(staged_path)
+        return self._submit(job_id, staged_path, filename, banner_type, on_complete, True)
+
+    def submit_path(self, source_path: str, banner_type: str,
+                    on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """
+        Schedules an already stored file for processing, leaving the file in place.
+
+        Args:
+            source_path (str): The path of the stored upload.
+            banner_type (str): The banner type of the image.
+            on_complete (Optional[Callable]): Called with the job record once processing succeeds.
+
+        Returns:
+            str: The ID of the new job.
+        """
+        return self._submit(uuid.uuid4().hex, source_path, os.path.basename(source_path),
+                            banner_type, on_complete, False)
+
+    def _submit(self, job_id: str, source_path: str, filename: str, banner_type: str,
+                on_complete: Optional[Callable], remove_source: bool) -> str:
+        job = {
+            'job_id': job_id,
+            'status': JOB_PENDING,
+            'filename': filename,
+            'banner_type': banner_type,
+            'created_at': datetime.now().isoformat(),
+            'completed_at': None,
+            'result': None,
+            'error': None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+
+        future = self._get_executor().submit(
+            process_banner_image, source_path, self.output_folder,
+            banner_type, self.settings, remove_source
+        )
+        future.add_done_callback(lambda f: self._finish(job, f, on_complete))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a copy of a job record.
+
+        Args:
+            job_id (str): The job ID returned by submit().
+
+        Returns:
+            Optional[Dict[str, Any]]: The job record, or None if it is unknown.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Returns job counters for monitoring.
+
+        Returns:
+            Dict[str, Any]: Pending, completed and failed job counts.
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job['status'] == JOB_PENDING)
+        return {
+            'workers': self.max_workers,
+            'pending': pending,
+            'completed': self.completed,
+            'failed': self.failed
+        }
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops the worker pool.
+
+        Args:
+            wait (bool): Whether to wait for running jobs to finish.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def _finish(self, job: Dict[str, Any], future, on_complete: Optional[Callable]):
+        error = future.exception()
+        with self._lock:
+            job['completed_at'] = datetime.now().isoformat()
+            if error is None:
+                job['status'] = JOB_COMPLETED
+                job['result'] = future.result()
+                self.completed += 1
+            else:
+                job['status'] = JOB_FAILED
+                job['error'] = str(error)
+                self.failed += 1
+
+        if error is not None:
+            logger.error(f"Image job {job['job_id']} failed: {str(error)}")
+            return
+        if on_complete is not None:
+            try:
+                on_complete(dict(job))
+            except Exception as e:
+                logger.error(f"Error completing image job {job['job_id']}: {str(e)}")
+
+    def _prune(self):
+        """Drops the oldest finished jobs beyond max_retained_jobs."""
+        excess = len(self._jobs) - self.max_retained_jobs
+        if excess <= 0:
+            return
+        for job_id in [k for k, job in self._jobs.items() if job['status'] != JOB_PENDING][:excess]:
+            del self._jobs[job_id]
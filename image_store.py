@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Content-Addressed Image Store - Naebak Project
+
+This module stores banner images under the SHA-256 digest of their bytes. Identical
+uploads map to the same file, so they are written and processed only once, and a
+stored file never changes, which lets it be served with immutable cache headers.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from typing import Any, Dict, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+
+_DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+_STORED_NAME_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}[^/]*$')
+
+
+def is_content_addressed(relative_path: str) -> bool:
+    """
+    Checks whether a path points into the sharded, digest-named layout.
+
+    Args:
+        relative_path (str): A path relative to the store root.
+
+    Returns:
+        bool: True if the file content can never change.
+    """
+    return bool(_STORED_NAME_PATTERN.match(relative_path))
+
+
+class ContentStore:
+    """
+    Sharded, deduplicating file store keyed by SHA-256.
+
+    A file with digest ``abcdef...`` and extension ``.jpg`` is stored at
+    ``<root>/ab/cd/abcdef....jpg``. Derived files (processed images, thumbnails,
+    renditions) are stored under the digest of their own bytes; the JSON manifests
+    that map an original to them live next to it, using its digest as their name prefix.
+
+    Attributes:
+        root (str): The root folder of the store.
+    """
+
+    def __init__(self, root: str):
+        """
+        Initialize the store.
+
+        Args:
+            root (str): The root folder of the store.
+        """
+        self.root = root
+        self._tmp_folder = os.path.join(root, 'tmp')
+        os.makedirs(self._tmp_folder, exist_ok=True)
+
+    def relative_path(self, digest: str, suffix: str = '') -> str:
+        """
+        Returns the sharded path of a digest, relative to the store root.
+
+        Args:
+            digest (str): The hex SHA-256 digest.
+            suffix (str): Appended to the digest, e.g. '.jpg' or '-hero.webp'.
+
+        Returns:
+            str: The relative path, always using forward slashes.
+        """
+        if not _DIGEST_PATTERN.match(digest):
+            raise ValueError("invalid digest")
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+
+    def path(self, digest: str, suffix: str = '') -> str:
+        """
+        Returns the absolute path of a digest.
+
+        Args:
+            digest (str): The hex SHA-256 digest.
+            suffix (str): Appended to the digest.
+
+        Returns:
+            str: The file path.
+        """
+        return os.path.join(self.root, *self.relative_path(digest, suffix).split('/'))
+
+    def exists(self, digest: str, suffix: str = '') -> bool:
+        """Whether a file is already stored."""
+        return os.path.exists(self.path(digest, suffix))
+
+    def put_stream(self, stream, extension: str) -> Tuple[str, bool]:
+        """
+        Streams data to the store, hashing it on the way.
+
+        The data is copied in chunks to a temporary file while its digest is
+        computed. If the digest is already stored the temporary file is discarded,
+        otherwise it is atomically moved into place.
+
+        Args:
+            stream: A readable binary stream.
+            extension (str): The file extension, e.g. '.jpg'.
+
+        Returns:
+            Tuple[str, bool]: The digest, and whether a new file was stored.
+        """
+        sha256 = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_folder)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+                    tmp.write(chunk)
+            digest = sha256.hexdigest()
+            return digest, self._commit(tmp_path, digest, extension.lower())
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_bytes(self, data: bytes, extension: str) -> Tuple[str, bool]:
+        """
+        Stores a byte string under its digest.
+
+        Args:
+            data (bytes): The file content.
+            extension (str): The file extension.
+
+        Returns:
+            Tuple[str, bool]: The digest, and whether a new file was stored.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        if self.exists(digest, extension):
+            return digest, False
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_folder)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            return digest, self._commit(tmp_path, digest, extension)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load_manifest(self, digest: str, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Loads a JSON manifest stored next to a digest.
+
+        Args:
+            digest (str): The digest of the original file.
+            name (str): The manifest name, e.g. the banner type.
+
+        Returns:
+            Optional[Dict[str, Any]]: The manifest, or None if it does not exist.
+        """
+        try:
+            with open(self.path(digest, f"-{name}.json"), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_manifest(self, digest: str, name: str, manifest: Dict[str, Any]):
+        """
+        Atomically writes a JSON manifest next to a digest.
+
+        Args:
+            digest (str): The digest of the original file.
+            name (str): The manifest name.
+            manifest (Dict[str, Any]): The JSON-serializable manifest.
+        """
+        target = self.path(digest, f"-{name}.json")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_folder)
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+            json.dump(manifest, tmp)
+        os.replace(tmp_path, target)
+
+    def _commit(self, tmp_path: str, digest: str, extension: str) -> bool:
+        target = self.path(digest, extension)
+        if os.path.exists(target):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+        return True
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming Upload Validation - Naebak Project
+
+This module validates banner uploads from their first bytes. The magic number,
+format and pixel dimensions are read from the file header, and the body size is
+enforced while it streams, so oversized or spoofed uploads are rejected without
+buffering or decoding the whole file.
+"""
+
+import io
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+# Initial header read; the read size doubles until the header parses
+HEADER_CHUNK_SIZE = 4 * 1024
+MAX_HEADER_BYTES = 256 * 1024
+
+# Magic numbers for the supported raster formats
+_MAGIC_NUMBERS = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+]
+
+# Formats each extension may contain
+EXTENSION_FORMATS = {
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'gif': 'GIF',
+    'webp': 'WEBP',
+    'svg': 'SVG',
+}
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds its size limit while streaming."""
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    """
+    Identifies an image format from its magic number.
+
+    Args:
+        header (bytes): The first bytes of the file.
+
+    Returns:
+        Optional[str]: The format name (e.g. 'PNG'), or None if it is not recognized.
+    """
+    for magic, image_format in _MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+
+    text = header[:256].lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in header.lower()):
+        return 'SVG'
+    return None
+
+
+class ReplayStream:
+    """
+    Read-only stream that returns already consumed header bytes before the rest.
+
+    Attributes:
+        stream: The underlying stream, positioned just after the header.
+    """
+
+    def __init__(self, prefix: bytes, stream):
+        self._prefix = prefix
+        self.stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if self._prefix:
+            if size is None or size < 0:
+                data, self._prefix = self._prefix + self.stream.read(), b''
+                return data
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+            if len(data) < size:
+                data += self.stream.read(size - len(data))
+            return data
+        return self.stream.read(size)
+
+
+class LimitedReader:
+    """
+    Stream wrapper that raises UploadTooLarge once more than limit bytes are read.
+
+    Attributes:
+        limit (int): The maximum number of bytes allowed.
+        bytes_read (int): The number of bytes read so far.
+    """
+
+    def __init__(self, stream, limit: int):
+        self.stream = stream
+        self.limit = limit
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        if self.bytes_read > self.limit:
+            raise UploadTooLarge(f"upload exceeds {self.limit} bytes")
+        return data
+
+
+def read_image_header(stream, max_header_bytes: int = MAX_HEADER_BYTES) -> Dict[str, Any]:
+    """
+    Reads just enough of a stream to identify the image and its dimensions.
+
+    The header is parsed with a lazy Image.open() on the bytes read so far, which
+    reads the format headers without allocating or decoding pixel data.
+
+    Args:
+        stream: A readable binary stream positioned at the start of the file.
+        max_header_bytes (int): The maximum number of bytes to read.
+
+    Returns:
+        Dict[str, Any]: 'header' (the bytes consumed), 'magic_format', and for
+        raster images 'format', 'width' and 'height'. Unparsable headers have
+        no 'format' key.
+    """
+    header = b''
+    chunk_size = HEADER_CHUNK_SIZE
+    info = {}
+    while len(header) < max_header_bytes:
+        chunk = stream.read(min(chunk_size, max_header_bytes - len(header)))
+        if not chunk:
+            break
+        header += chunk
+        chunk_size *= 2
+
+        if 'magic_format' not in info:
+            info['magic_format'] = sniff_format(header)
+            if info['magic_format'] in (None, 'SVG'):
+                break
+
+        try:
+            with Image.open(io.BytesIO(header)) as image:
+                info.update(format=image.format, width=image.width, height=image.height)
+                break
+        except Image.DecompressionBombError:
+            info['decompression_bomb'] = True
+            break
+        except (OSError, SyntaxError, ValueError):
+            continue
+
+    info['header'] = header
+    info.setdefault('magic_format', sniff_format(header))
+    return info
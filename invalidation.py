@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Cache Invalidation Bus - Naebak Project
+
+This module provides an in-process publish/subscribe bus for cache invalidation.
+Components that change banners publish the affected IDs on a topic, and every
+cache that holds banner data subscribes and drops its stale entries.
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# Topics; keys are banner IDs, banner position IDs and page banner keys
+TOPIC_BANNERS = 'banners'
+TOPIC_POSITIONS = 'positions'
+TOPIC_PAGES = 'pages'
+
+
+class InvalidationBus:
+    """
+    Synchronous invalidation bus.
+
+    Subscribers are called in the publishing thread with the topic and the
+    list of affected keys. A failing subscriber is logged and does not stop
+    the others from being notified.
+
+    Attributes:
+        published (Dict[str, int]): The number of events published per topic.
+    """
+
+    def __init__(self):
+        """Initialize a bus without subscribers."""
+        self._subscribers: Dict[str, List[Callable]] = {}
+        self._lock = threading.Lock()
+        self.published: Dict[str, int] = {}
+
+    def subscribe(self, topic: str, callback: Callable[[str, List], None]):
+        """
+        Registers a callback for a topic.
+
+        Args:
+            topic (str): The topic, e.g. TOPIC_BANNERS.
+            callback (Callable[[str, List], None]): Called with (topic, keys).
+        """
+        with self._lock:
+            callbacks = self._subscribers.setdefault(topic, [])
+            if callback not in callbacks:
+                callbacks.append(callback)
+
+    def unsubscribe(self, topic: str, callback: Callable):
+        """
+        Removes a callback from a topic.
+
+        Args:
+            topic (str): The topic.
+            callback (Callable): The callback to remove.
+        """
+        with self._lock:
+            callbacks = self._subscribers.get(topic, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def publish(self, topic: str, keys: Iterable = ()):
+        """
+        Notifies every subscriber of a topic.
+
+        Args:
+            topic (str): The topic.
+            keys (Iterable): The affected keys (e.g. banner IDs). Empty means everything.
+        """
+        keys = list(keys)
+        with self._lock:
+            callbacks = list(self._subscribers.get(topic, ()))
+            self.published[topic] = self.published.get(topic, 0) + 1
+
+        for callback in callbacks:
+            try:
+                callback(topic, keys)
+            except Exception as e:
+                logger.error(f"Error in invalidation subscriber for {topic}: {str(e)}")
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        Returns bus counters for monitoring.
+
+        Returns:
+            Dict[str, object]: Subscribers and published events per topic.
+        """
+        with self._lock:
+            return {
+                'subscribers': {topic: len(cbs) for topic, cbs in self._subscribers.items()},
+                'published': dict(self.published)
+            }
+
+
+# Shared process-wide bus
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Fast JSON Provider - Naebak Project
+
+This module provides a Flask JSON provider backed by orjson. Datetimes, dates,
+UUIDs and dataclasses are serialized natively (datetimes as ISO 8601), so models
+can hand back raw values instead of formatting every field, and hot endpoints
+can build their body once as bytes and return it without another encoding pass.
+The standard library is used when orjson is not installed.
+"""
+
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, time
+from typing import Any, Optional
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+
+if orjson is not None:
+    # Non-string keys (e.g. banner IDs) are converted like the json module does
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+else:
+    _ORJSON_OPTIONS = 0
+
+
+def _default(obj: Any) -> Any:
+    """Converts values neither encoder handles natively."""
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False, indent: bool = False) -> bytes:
+    """
+    Serializes a value to UTF-8 JSON bytes.
+
+    Args:
+        obj (Any): The value to serialize.
+        sort_keys (bool): Whether to sort object keys.
+        indent (bool): Whether to pretty-print with two-space indentation.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    if orjson is not None:
+        options = _ORJSON_OPTIONS
+        if sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=options)
+
+    return json.dumps(
+        obj, default=_default, ensure_ascii=False, sort_keys=sort_keys,
+        indent=2 if indent else None, separators=None if indent else (',', ':')
+    ).encode('utf-8')
+
+
+def loads(data: Any) -> Any:
+    """
+    Parses a JSON document.
+
+    Args:
+        data (Any): The document as str, bytes or bytearray.
+
+    Returns:
+        Any: The parsed value.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(body: bytes, status: int = 200, headers: Optional[dict] = None):
+    """
+    Wraps already-serialized JSON bytes in a response.
+
+    Args:
+        body (bytes): The JSON document, e.g. from dumps_bytes().
+        status (int): The HTTP status code.
+        headers (Optional[dict]): Extra response headers.
+
+    Returns:
+        Response: The Flask response.
+    """
+    return current_app.response_class(body, status=status, headers=headers, mimetype=JSON_MIMETYPE)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider using orjson.
+
+    jsonify() and request.get_json() go through this provider once it is
+    installed. Unlike Flask's default provider, keys are not sorted unless
+    sort_keys is set and dates are written as ISO 8601 rather than HTTP dates,
+    matching what the API already returned from to_dict().
+    """
+
+    sort_keys = False
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        """Serializes a value to a JSON string."""
+        return dumps_bytes(obj, sort_keys=kwargs.get('sort_keys', self.sort_keys),
+                           indent=bool(kwargs.get('indent'))).decode('utf-8')
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        """Parses a JSON string or bytes."""
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        """Serializes the arguments to a JSON response, like jsonify()."""
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(
+            dumps_bytes(obj, sort_keys=self.sort_keys, indent=indent), mimetype=self.mimetype
+        )
+
+
+def init_json(app):
+    """
+    Installs FastJSONProvider on an application.
+
+    Args:
+        app (Flask): The application.
+    """
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
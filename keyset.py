@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Keyset Pagination - Naebak Project
+
+This module pages through ordered queries by seeking past the last row of the
+previous page instead of skipping rows with OFFSET, so every page costs one
+index range scan however deep it is. The position is handed to clients as an
+opaque, signed continuation token.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+
+from sqlalchemy import and_, func, or_
+
+# Bytes of HMAC-SHA256 kept in a token; enough to make forging impractical
+SIGNATURE_BYTES = 12
+
+
+class InvalidCursor(ValueError):
+    """Raised when a continuation token is malformed or its signature does not match."""
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sort_terms(order: Sequence[tuple]):
+    """Yields (expression, descending, column, null_as) for each keyset order entry."""
+    for column, descending, *rest in order:
+        null_as = rest[0] if rest else None
+        expression = column if null_as is None else func.coalesce(column, null_as)
+        yield expression, descending, column, null_as
+
+
+def encode_cursor(values: Sequence[Any], secret: str) -> str:
+    """
+    Builds a continuation token from the sort key of a page's last row.
+
+    Args:
+        values (Sequence[Any]): The sort key values (ints, strings, datetimes or None).
+        secret (str): The signing key.
+
+    Returns:
+        str: The URL-safe token.
+    """
+    payload = json.dumps([_encode_value(value) for value in values], separators=(',', ':')).encode('utf-8')
+    signature = hmac.new(secret.encode('utf-8'), payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return _b64encode(signature + payload)
+
+
+def decode_cursor(token: str, secret: str, length: Optional[int] = None) -> List[Any]:
+    """
+    Verifies a continuation token and returns its sort key.
+
+    Args:
+        token (str): The token from the client.
+        secret (str): The signing key.
+        length (Optional[int]): The expected number of values.
+
+    Returns:
+        List[Any]: The sort key values.
+
+    Raises:
+        InvalidCursor: If the token was not issued with this key or is malformed.
+    """
+    try:
+        raw = _b64decode(token)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    signature, payload = raw[:SIGNATURE_BYTES], raw[SIGNATURE_BYTES:]
+    expected = hmac.new(secret.encode('utf-8'), payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    if not hmac.compare_digest(signature, expected):
+        raise InvalidCursor("Cursor signature mismatch")
+    try:
+        values = [_decode_value(value) for value in json.loads(payload)]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed cursor")
+    if length is not None and len(values) != length:
+        raise InvalidCursor("Cursor does not match this listing")
+    return values
+
+
+def seek_after(order: Sequence[tuple], values: Sequence[Any]):
+    """
+    Builds the predicate selecting rows that sort after a given sort key.
+
+    Columns may mix ascending and descending order, so the predicate is the
+    expanded form ``a > x OR (a = x AND (b < y OR (b = y AND ...)))`` rather
+    than a row-value comparison. A NULL would make every comparison unknown and
+    drop the row, so nullable columns must be given a null_as value: they are
+    sorted and compared as COALESCE(column, null_as), here and in order_by().
+    The last column must be non-null and unique, e.g. the primary key.
+
+    Args:
+        order (Sequence[tuple]): (column, descending) or (column, descending, null_as)
+            entries, in sort order.
+        values (Sequence[Any]): The sort key of the last row already returned.
+
+    Returns:
+        The SQLAlchemy boolean expression.
+    """
+    predicate = None
+    for (expression, descending, _, _), value in reversed(list(zip(_sort_terms(order), values))):
+        after = expression < value if descending else expression > value
+        predicate = after if predicate is None else or_(after, and_(expression == value, predicate))
+    return predicate
+
+
+def order_by(order: Sequence[tuple]) -> list:
+    """
+    Builds the ORDER BY clauses matching a keyset order.
+
+    Args:
+        order (Sequence[tuple]): The keyset order, as for seek_after().
+
+    Returns:
+        list: The clauses.
+    """
+    return [expression.desc() if descending else expression.asc()
+            for expression, descending, _, _ in _sort_terms(order)]
+
+
+def sort_key(row: Any, order: Sequence[tuple]) -> List[Any]:
+    """
+    Reads a row's sort key, with NULLs replaced as in seek_after().
+
+    Args:
+        row (Any): An ORM object or row with attributes named after the columns.
+        order (Sequence[tuple]): The keyset order, as for seek_after().
+
+    Returns:
+        List[Any]: The values, in order.
+    """
+    values = []
+    for _, _, column, null_as in _sort_terms(order):
+        value = getattr(row, column.key)
+        values.append(null_as if value is None else value)
+    return values
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+In-Memory Redis Stand-In - Naebak Project
+
+This module implements the small subset of the redis-py client used by the
+shared placement cache (strings, hashes, sets, key expiry, pipelines and
+pub/sub) on top of plain dictionaries. Several caches sharing one instance
+behave like several workers sharing one Redis server, which is how tests and
+single-process development setups run without a server.
+"""
+
+import fnmatch
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def _encode(value: Any) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+class InMemoryPubSub:
+    """Subscription handle returned by InMemoryRedis.pubsub()."""
+
+    def __init__(self, server: 'InMemoryRedis', ignore_subscribe_messages: bool = False):
+        self._server = server
+        self._queue: 'queue.Queue[dict]' = queue.Queue()
+        self._channels = set()
+        self._ignore_subscribe_messages = ignore_subscribe_messages
+
+    def subscribe(self, *channels: str):
+        """Subscribes to channels."""
+        for channel in channels:
+            channel = _encode(channel)
+            self._channels.add(channel)
+            self._server._subscribe(channel, self)
+            if not self._ignore_subscribe_messages:
+                self._queue.put({'type': 'subscribe', 'channel': channel, 'data': len(self._channels)})
+
+    def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0.0) -> Optional[dict]:
+        """Returns the next message, waiting up to timeout seconds."""
+        try:
+            return self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """Drops all subscriptions."""
+        for channel in self._channels:
+            self._server._unsubscribe(channel, self)
+        self._channels.clear()
+
+    def _deliver(self, channel: bytes, data: bytes):
+        self._queue.put({'type': 'message', 'channel': channel, 'data': data})
+
+
+class InMemoryPipeline:
+    """Buffers commands and runs them on execute(), like a redis-py pipeline."""
+
+    def __init__(self, server: 'InMemoryRedis'):
+        self._server = server
+        self._commands = []
+
+    def __getattr__(self, name: str):
+        method = getattr(self._server, name)
+
+        def queue_command(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue_command
+
+    def execute(self) -> List[Any]:
+        """Runs the buffered commands and returns their results."""
+        commands, self._commands = self._commands, []
+        return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._commands = []
+
+
+class InMemoryRedis:
+    """
+    Thread-safe in-process Redis stand-in.
+
+    Commands take the same arguments and return the same values as their
+    redis-py counterparts. Values are stored as bytes, as redis-py returns
+    them without decode_responses. Expired keys are removed when they are
+    next accessed.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._data: Dict[bytes, Any] = {}
+        self._expires: Dict[bytes, float] = {}
+        self._subscribers: Dict[bytes, list] = {}
+        self._lock = threading.RLock()
+
+    # Keys
+
+    def _live(self, key: bytes):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= self.clock():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    def exists(self, *keys) -> int:
+        with self._lock:
+            return sum(1 for key in keys if self._live(_encode(key)) is not None)
+
+    def delete(self, *keys) -> int:
+        with self._lock:
+            removed = 0
+            for key in map(_encode, keys):
+                if self._live(key) is not None:
+                    removed += 1
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            return removed
+
+    def expire(self, key, seconds: float) -> bool:
+        with self._lock:
+            key = _encode(key)
+            if self._live(key) is None:
+                return False
+            self._expires[key] = self.clock() + seconds
+            return True
+
+    def ttl(self, key) -> int:
+        with self._lock:
+            key = _encode(key)
+            if self._live(key) is None:
+                return -2
+            expires = self._expires.get(key)
+            return -1 if expires is None else int(round(expires - self.clock()))
+
+    def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None) -> Iterator[bytes]:
+        with self._lock:
+            keys = [key for key in list(self._data) if self._live(key) is not None]
+        for key in keys:
+            if match is None or fnmatch.fnmatchcase(key.decode('utf-8'), match):
+                yield key
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    # Strings
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            return self._live(_encode(key))
+
+    def set(self, key, value, ex: Optional[float] = None, px: Optional[int] = None,
+            nx: bool = False) -> Optional[bool]:
+        with self._lock:
+            key = _encode(key)
+            if nx and self._live(key) is not None:
+                return None
+            self._data[key] = _encode(value)
+            if px is not None:
+                ex = px / 1000.0
+            if ex is not None:
+                self._expires[key] = self.clock() + ex
+            else:
+                self._expires.pop(key, None)
+            return True
+
+    def mget(self, keys, *args) -> List[Optional[bytes]]:
+        keys = [keys, *args] if isinstance(keys, (str, bytes)) else list(keys) + list(args)
+        with self._lock:
+            return [self._live(_encode(key)) for key in keys]
+
+    def incr(self, key, amount: int = 1) -> int:
+        with self._lock:
+            key = _encode(key)
+            value = int(self._live(key) or 0) + amount
+            self._data[key] = _encode(value)
+            return value
+
+    # Hashes
+
+    def hset(self, key, field=None, value=None, mapping: Optional[dict] = None) -> int:
+        with self._lock:
+            key = _encode(key)
+            current = self._live(key)
+            if current is None:
+                current = self._data[key] = {}
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            added = 0
+            for name, item in items.items():
+                name = _encode(name)
+                added += name not in current
+                current[name] = _encode(item)
+            return added
+
+    def hgetall(self, key) -> Dict[bytes, bytes]:
+        with self._lock:
+            return dict(self._live(_encode(key)) or {})
+
+    # Sets
+
+    def sadd(self, key, *members) -> int:
+        with self._lock:
+            key = _encode(key)
+            current = self._live(key)
+            if current is None:
+                current = self._data[key] = set()
+            before = len(current)
+            current.update(map(_encode, members))
+            return len(current) - before
+
+    def smembers(self, key) -> set:
+        with self._lock:
+            return set(self._live(_encode(key)) or ())
+
+    # Pipelines and pub/sub
+
+    def pipeline(self, transaction: bool = True) -> InMemoryPipeline:
+        return InMemoryPipeline(self)
+
+    def publish(self, channel, message) -> int:
+        channel, message = _encode(channel), _encode(message)
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber._deliver(channel, message)
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> InMemoryPubSub:
+        return InMemoryPubSub(self, ignore_subscribe_messages)
+
+    def ping(self) -> bool:
+        return True
+
+    def _subscribe(self, channel: bytes, subscriber: InMemoryPubSub):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(subscriber)
+
+    def _unsubscribe(self, channel: bytes, subscriber: InMemoryPubSub):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
@@ -6,26 +6,61 @@ This module defines the core data models and business logic for the Naebak Banne
 It includes models for banner data, statistics, image information, and the main banner service class.
 """
 
-from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Any, Optional, Sequence
 from datetime import datetime, timedelta
-import os
 from PIL import Image
+from sqlalchemy import text
 import constants
+from hyperloglog import HyperLogLog
+from image_validation import EXTENSION_FORMATS, LimitedReader, ReplayStream, read_image_header
+from selection_index import BannerSelectionIndex
 
-@dataclass
+def pick_rendition(renditions: Sequence[Dict[str, Any]], width: Optional[int] = None,
+                   accept_webp: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Picks the smallest rendition that is at least the requested width.
+
+    Args:
+        renditions (Sequence[Dict[str, Any]]): The banner's renditions.
+        width (Optional[int]): The rendered width in device pixels. Defaults to the 1x width.
+        accept_webp (bool): Whether the client accepts WebP images.
+
+    Returns:
+        Optional[Dict[str, Any]]: The chosen rendition, or None if the banner has none.
+    """
+    candidates = [
+        r for r in renditions if accept_webp or r['format'] != 'webp'
+    ] or list(renditions)
+    if not candidates:
+        return None
+    candidates = sorted(candidates, key=lambda r: (r['width'], r['file_size']))
+
+    if width is None:
+        base = [r['width'] for r in candidates if r['name'] == '1x']
+        width = base[0] if base else candidates[-1]['width']
+
+    for rendition in candidates:
+        if rendition['width'] >= width:
+            return rendition
+    return candidates[-1]
+
+@dataclass(slots=True)
 class BannerData:
     """
     Represents a banner in the system.
 
     This dataclass encapsulates all the information needed to display and manage a banner,
-    including its content, positioning, scheduling, and performance metrics.
+    including its content, positioning, scheduling, and performance metrics. It is
+    slotted, so instances carry no per-object __dict__; the selection index holds
+    snapshot() copies, so edits to a banner are served only once it is indexed again.
 
     Attributes:
         id (Optional[int]): The unique identifier for the banner.
         title (str): The title of the banner.
         description (str): A detailed description of the banner content.
         image_url (str): The URL of the banner image.
+        image_hash (Optional[str]): The SHA-256 digest of the uploaded image in the content store.
         link_url (str): The URL that the banner links to when clicked.
         alt_text (str): Alternative text for accessibility.
         banner_type (str): The type of banner (e.g., 'hero', 'sidebar', 'footer').
@@ -41,11 +76,13 @@ class BannerData:
         updated_at (Optional[datetime]): When the banner was last updated.
         click_count (int): The number of times the banner has been clicked.
         view_count (int): The number of times the banner has been viewed.
+        renditions (List[Dict[str, Any]]): Responsive image renditions (width, format, url).
     """
     id: Optional[int] = None
     title: str = ""
     description: str = ""
     image_url: str = ""
+    image_hash: Optional[str] = None
     link_url: str = ""
     alt_text: str = ""
     banner_type: str = "hero"
@@ -61,12 +98,38 @@ class BannerData:
     updated_at: Optional[datetime] = None
     click_count: int = 0
     view_count: int = 0
+    renditions: List[Dict[str, Any]] = field(default_factory=list)
+    
+    def pick_rendition(self, width: Optional[int] = None,
+                       accept_webp: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Picks the smallest rendition that is at least the requested width.
+
+        Args:
+            width (Optional[int]): The rendered width in device pixels. Defaults to the 1x width.
+            accept_webp (bool): Whether the client accepts WebP images.
+
+        Returns:
+            Optional[Dict[str, Any]]: The chosen rendition, or None if the banner has none.
+        """
+        return pick_rendition(self.renditions, width, accept_webp)
+    
+    def snapshot(self) -> 'BannerData':
+        """
+        Returns a copy of the banner for the selection index.
+
+        Returns:
+            BannerData: The copy; later changes to this object, including its
+                renditions list, do not affect it.
+        """
+        return replace(self, renditions=list(self.renditions))
     
     def to_dict(self) -> Dict[str, Any]:
         """
         Converts the banner data to a dictionary format.
         
         This method is useful for serialization, API responses, and database operations.
+        Datetimes are returned as-is; the app's JSON provider writes them as ISO 8601.
         
         Returns:
             Dict[str, Any]: A dictionary representation of the banner data.
@@ -76,6 +139,7 @@ class BannerData:
             'title': self.title,
             'description': self.description,
             'image_url': self.image_url,
+            'image_hash': self.image_hash,
             'link_url': self.link_url,
             'alt_text': self.alt_text,
             'banner_type': self.banner_type,
@@ -84,13 +148,14 @@ class BannerData:
             'status': self.status,
             'priority': self.priority,
             'governorate': self.governorate,
-            'start_date': self.start_date.isoformat() if self.start_date else None,
-            'end_date': self.end_date.isoformat() if self.end_date else None,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
             'created_by': self.created_by,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
             'click_count': self.click_count,
-            'view_count': self.view_count
+            'view_count': self.view_count,
+            'renditions': self.renditions
         }
 
 @dataclass
@@ -129,7 +194,7 @@ class BannerStats:
             'total_clicks': self.total_clicks,
             'click_through_rate': self.click_through_rate,
             'unique_viewers': self.unique_viewers,
-            'last_viewed': self.last_viewed.isoformat() if self.last_viewed else None
+            'last_viewed': self.last_viewed
         }
 
 @dataclass
@@ -193,19 +258,25 @@ class BannerService:
         upload_folder (str): The directory where uploaded images are stored.
         max_file_size (int): The maximum allowed file size for uploads.
         allowed_extensions (set): The set of allowed file extensions.
+        selection_index (BannerSelectionIndex): Priority-sorted index of active banners.
+        engine: The SQLAlchemy engine used to read precomputed statistics (optional).
     """
     
-    def __init__(self, config):
+    def __init__(self, config, engine=None):
         """
         Initialize the banner service with configuration settings.
         
         Args:
             config: The application configuration object containing upload settings.
+            engine: The SQLAlchemy engine holding the banner_stats rollup table (optional).
         """
         self.config = config
+        self.engine = engine
         self.upload_folder = config.UPLOAD_FOLDER
         self.max_file_size = config.MAX_CONTENT_LENGTH
         self.allowed_extensions = config.ALLOWED_EXTENSIONS
+        self.selection_index = BannerSelectionIndex()
+        self.selection_index.rebuild(self._load_banners())
     
     def validate_banner_data(self, banner_data: BannerData) -> List[str]:
         """
@@ -231,18 +302,15 @@ class BannerService:
             errors.append("النص البديل مطلوب")
         
         # Validate banner type
-        valid_types = [bt['type'] for bt in constants.BANNER_TYPES]
-        if banner_data.banner_type not in valid_types:
+        if banner_data.banner_type not in constants.VALID_BANNER_TYPES:
             errors.append("نوع البنر غير صحيح")
         
         # Validate position
-        valid_positions = [pos['position'] for pos in constants.BANNER_POSITIONS]
-        if banner_data.position not in valid_positions:
+        if banner_data.position not in constants.VALID_POSITIONS:
             errors.append("موضع البنر غير صحيح")
         
         # Validate category
-        valid_categories = [cat['category'] for cat in constants.BANNER_CATEGORIES]
-        if banner_data.category not in valid_categories:
+        if banner_data.category not in constants.VALID_CATEGORIES:
             errors.append("فئة البنر غير صحيحة")
         
         # Validate dates
@@ -258,6 +326,11 @@ class BannerService:
 
         This method checks the file type, size, and other constraints
         to ensure the uploaded image is suitable for use as a banner.
+        Only the header bytes are read: the magic number must match the file
+        extension and the dimensions must be within the configured bounds.
+        On success file.stream is replaced by a stream that replays the header
+        and raises UploadTooLarge if the body exceeds the per-extension limit,
+        so the size is enforced while the upload is stored.
 
         Args:
             file: The uploaded file object.
@@ -274,93 +347,49 @@ class BannerService:
         
         # Check file type
         if not constants.is_valid_file_type(file.filename):
-            errors.append("نوع الملف غير مدعوم")
+            errors.append(constants.VALIDATION_MESSAGES['INVALID_FILE_TYPE'])
             return errors
+        extension = file.filename.rsplit('.', 1)[1].lower()
         
-        # Check file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-        
-        max_size = self.max_file_size
-        if file_size > max_size:
+        # Check the declared size against the per-extension limit
+        max_size = min(self.max_file_size, constants.get_max_file_size(extension) * 1024 * 1024)
+        if file.content_length and file.content_length > max_size:
             errors.append(f"حجم الملف كبير جداً (الحد الأقصى: {max_size // (1024*1024)}MB)")
+            return errors
         
-        return errors
-    
-    def process_image(self, file, banner_type: str) -> ImageInfo:
-        """
-        Processes and optimizes an uploaded image.
-
-        This method handles image optimization, resizing, and metadata extraction
-        to prepare the image for use as a banner.
-
-        Args:
-            file: The uploaded file object.
-            banner_type (str): The type of banner this image will be used for.
-
-        Returns:
-            ImageInfo: An object containing metadata about the processed image.
-        """
-        # Get banner type information
-        banner_info = constants.get_banner_type_info(banner_type)
-        
-        # Open the image
-        image = Image.open(file)
-        original_width, original_height = image.size
-        
-        # Optimize image if required
-        if self.config.IMAGE_OPTIMIZATION:
-            # Compress image
-            if image.format in ['JPEG', 'JPG']:
-                image = image.convert('RGB')
+        # Check the magic number and dimensions from the header only
+        header_info = read_image_header(file.stream)
+        expected_format = EXTENSION_FORMATS.get(extension)
+        if header_info['magic_format'] != expected_format:
+            errors.append(constants.VALIDATION_MESSAGES['INVALID_FILE_TYPE'])
+            return errors
         
-        # Resize if required
-        if self.config.AUTO_RESIZE and banner_info:
-            recommended_size = banner_info.get('recommended_size', '').split('x')
-            if len(recommended_size) == 2:
-                target_width = int(recommended_size[0])
-                target_height = int(recommended_size[1])
-                
-                # Resize while maintaining aspect ratio
-                image.thumbnail((target_width, target_height), Image.Resampling.LANCZOS)
+        if expected_format != 'SVG':
+            if header_info.get('format') != expected_format:
+                errors.append(constants.VALIDATION_MESSAGES['INVALID_FILE_TYPE'])
+                return errors
+            width, height = header_info['width'], header_info['height']
+            if not (self.config.MIN_BANNER_WIDTH <= width <= self.config.MAX_BANNER_WIDTH and
+                    self.config.MIN_BANNER_HEIGHT <= height <= self.config.MAX_BANNER_HEIGHT):
+                errors.append(
+                    f"{constants.VALIDATION_MESSAGES['INVALID_DIMENSIONS']} ({width}x{height})"
+                )
+                return errors
         
-        # Create image information
-        image_info = ImageInfo(
-            filename=file.filename,
-            original_filename=file.filename,
-            file_size=file_size if 'file_size' in locals() else 0,
-            width=image.width,
-            height=image.height,
-            format=image.format,
-            mime_type=file.content_type,
-            upload_path=f"{self.upload_folder}/{file.filename}"
-        )
+        # Enforce the size limit on the rest of the body while it streams
+        file.stream = LimitedReader(ReplayStream(header_info['header'], file.stream), max_size)
         
-        return image_info
+        return errors
     
-    def get_active_banners(self, position: Optional[str] = None, 
-                          category: Optional[str] = None,
-                          governorate: Optional[str] = None) -> List[BannerData]:
+    def _load_banners(self) -> List[BannerData]:
         """
-        Retrieves active banners based on filtering criteria.
-
-        This method implements the core business logic for banner selection,
-        including filtering by position, category, and geographic targeting.
-
-        Args:
-            position (Optional[str]): Filter by banner position.
-            category (Optional[str]): Filter by banner category.
-            governorate (Optional[str]): Filter by target governorate.
+        Loads the banner inventory used to build the selection index.
 
         Returns:
-            List[BannerData]: A list of active banners matching the criteria.
+            List[BannerData]: All known banners, in display order for equal priorities.
         """
         # This is a sample implementation - in a real application, this would query the database
-        banners = []
-        
-        # Sample data
-        sample_banners = [
+        return [
             BannerData(
                 id=1,
                 title="مرحباً بكم في منصة نائبك",
@@ -384,21 +413,54 @@ class BannerService:
                 priority=2
             )
         ]
-        
-        # Apply filters
-        for banner in sample_banners:
-            if position and banner.position != position:
-                continue
-            if category and banner.category != category:
-                continue
-            if governorate and banner.governorate and banner.governorate != governorate:
-                continue
-            banners.append(banner)
-        
-        # Sort by priority
-        banners.sort(key=lambda x: x.priority)
-        
-        return banners
+    
+    def index_banner(self, banner_data: BannerData):
+        """
+        Adds a created or updated banner to the selection index.
+
+        Banners that are not active, or whose end date has passed, are dropped
+        from the index. Banners with a future start date are activated when it arrives.
+        The index holds a snapshot, so later edits to banner_data must be indexed
+        again to take effect.
+
+        Args:
+            banner_data (BannerData): The banner that was created or updated.
+        """
+        self.selection_index.upsert(banner_data.snapshot())
+    
+    def unindex_banner(self, banner_id: int):
+        """
+        Removes a deleted banner from the selection index.
+
+        Args:
+            banner_id (int): The ID of the banner to remove.
+        """
+        self.selection_index.remove(banner_id)
+    
+    def get_active_banners(self, position: Optional[str] = None, 
+                          category: Optional[str] = None,
+                          governorate: Optional[str] = None) -> List[BannerData]:
+        """
+        Retrieves active banners based on filtering criteria.
+
+        This method implements the core business logic for banner selection,
+        including filtering by position, category, and geographic targeting.
+        Results come from the precomputed selection index, so a request costs
+        a dictionary lookup instead of a scan and sort over all banners.
+
+        Args:
+            position (Optional[str]): Filter by banner position.
+            category (Optional[str]): Filter by banner category.
+            governorate (Optional[str]): Filter by target governorate.
+
+        Returns:
+            List[BannerData]: A list of active banners matching the criteria.
+        """
+        return self.selection_index.lookup(
+            position=position,
+            category=category,
+            governorate=governorate
+        )
     
     def get_banner_analytics(self, banner_id: int, 
                            start_date: Optional[datetime] = None,
@@ -407,7 +469,8 @@ class BannerService:
         Retrieves analytics data for a specific banner.
 
         This method calculates and returns performance metrics for a banner,
-        which can be used for reporting and optimization purposes.
+        which can be used for reporting and optimization purposes. Metrics are
+        read from the precomputed daily banner_stats rows rather than raw events.
 
         Args:
             banner_id (int): The ID of the banner to get analytics for.
@@ -417,17 +480,49 @@ class BannerService:
         Returns:
             BannerStats: An object containing the banner's performance statistics.
         """
-        # Sample data - in a real implementation, this would query analytics data
-        stats = BannerStats(
-            banner_id=banner_id,
-            total_views=1250,
-            total_clicks=89,
-            click_through_rate=7.12,
-            unique_viewers=1100,
-            last_viewed=datetime.now()
+        if self.engine is None:
+            # Sample data - used when no statistics database is configured
+            return BannerStats(
+                banner_id=banner_id,
+                total_views=1250,
+                total_clicks=89,
+                click_through_rate=7.12,
+                unique_viewers=1100,
+                last_viewed=datetime.now()
+            )
+        
+        conditions = ["banner_id = :banner_id"]
+        params = {'banner_id': banner_id}
+        if start_date:
+            conditions.append("date >= :start_date")
+            params['start_date'] = start_date.date()
+        if end_date:
+            conditions.append("date <= :end_date")
+            params['end_date'] = end_date.date()
+        
+        where = " AND ".join(conditions)
+        totals_query = text(
+            "SELECT COALESCE(SUM(views), 0) AS views, COALESCE(SUM(clicks), 0) AS clicks, "
+            "MAX(last_viewed_at) AS last_viewed FROM banner_stats WHERE " + where
         )
+        sketches_query = text("SELECT views_sketch FROM banner_stats WHERE " + where)
+        with self.engine.connect() as conn:
+            row = conn.execute(totals_query, params).one()
+            # Daily unique-viewer sketches merge into an estimate for the whole range
+            unique_viewers = HyperLogLog.merged(conn.execute(sketches_query, params).scalars()).count()
+        
+        last_viewed = row.last_viewed
+        if isinstance(last_viewed, str):
+            last_viewed = datetime.fromisoformat(last_viewed)
         
-        return stats
+        return BannerStats(
+            banner_id=banner_id,
+            total_views=row.views,
+            total_clicks=row.clicks,
+            click_through_rate=round(row.clicks / row.views * 100, 2) if row.views else 0.0,
+            unique_viewers=unique_viewers,
+            last_viewed=last_viewed
+        )
     
     def create_thumbnail(self, image_path: str, thumbnail_size: tuple = (200, 150)) -> str:
         """
@@ -452,22 +547,37 @@ class BannerService:
         
         return thumbnail_path
     
-    def schedule_banner_expiry(self, banner_id: int, expiry_date: datetime):
+    def schedule_banner_expiry(self, banner_id: int, expiry_date: Optional[datetime] = None) -> bool:
         """
         Schedules a banner to expire at a specific date.
 
         This method sets up automated expiry for banners, ensuring they
         are automatically deactivated when their campaign period ends.
+        The end date is recorded on the banner and the selection index
+        queues the expiry on its timeline, so the banner stops being served
+        at that instant without a separate task scheduler.
 
         Args:
             banner_id (int): The ID of the banner to schedule for expiry.
-            expiry_date (datetime): When the banner should expire.
+            expiry_date (Optional[datetime]): When the banner should expire. Defaults to
+                DEFAULT_BANNER_DURATION_DAYS after the banner's start date when
+                AUTO_EXPIRE_BANNERS is enabled; an explicit date is always honored.
 
-        Note:
-            In a real implementation, this would use a task scheduler like Celery.
+        Returns:
+            bool: True if the banner was found and its expiry scheduled.
         """
-        # In a real application, this would use Celery or another task scheduler
-        pass
+        banner = self.selection_index.banners.get(banner_id)
+        if banner is None:
+            return False
+        
+        if expiry_date is None:
+            if not self.config.AUTO_EXPIRE_BANNERS:
+                return False
+            starts_at = banner.start_date or datetime.now()
+            expiry_date = starts_at + timedelta(days=self.config.DEFAULT_BANNER_DURATION_DAYS)
+        
+        self.selection_index.upsert(replace(banner, end_date=expiry_date, updated_at=datetime.now()))
+        return True
     
     def get_banner_recommendations(self, user_id: int, 
                                  position: str) -> List[BannerData]:
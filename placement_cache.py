@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Placement Response Cache - Naebak Project
+
+This module caches fully serialized banner placement responses. Entries are keyed
+by endpoint, normalized filters and locale, hold the JSON bytes with their ETag,
+and are tagged with what they depend on (banner IDs, positions, page keys) so a
+write drops exactly the responses it affects instead of waiting for a TTL.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Set, Tuple
+
+# Tag carried by responses that list banners without a narrower filter; any
+# banner change can alter them
+TAG_BANNERS = ('banners',)
+
+CachedResponse = namedtuple(
+    'CachedResponse', ['body', 'etag', 'last_modified', 'banner_ids', 'tags', 'expires_at']
+)
+
+
+def banner_tag(banner_id: int) -> Tuple[str, int]:
+    """The tag of responses that contain a banner."""
+    return ('banner', banner_id)
+
+
+def banner_ids_in(tags: Iterable[Hashable]) -> List[int]:
+    """The banner IDs named by banner tags, ignoring other tags."""
+    return [tag[1] for tag in tags if isinstance(tag, tuple) and len(tag) == 2 and tag[0] == 'banner']
+
+
+def position_tag(position_id: int) -> Tuple[str, int]:
+    """The tag of responses filtered to a banner position."""
+    return ('position', position_id)
+
+
+def page_tag(page_key: str) -> Tuple[str, str]:
+    """The tag of responses for a page banner."""
+    return ('page', page_key)
+
+
+def normalize_filters(filters: Mapping[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    """
+    Builds a canonical form of request filters.
+
+    Missing and empty values are dropped and the rest are compared as stripped
+    strings, so ``?a=1&b=`` and ``?a=1`` share an entry.
+
+    Args:
+        filters (Mapping[str, Any]): Filter names and values.
+
+    Returns:
+        Tuple[Tuple[str, str], ...]: The sorted (name, value) pairs.
+    """
+    normalized = []
+    for name, value in filters.items():
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            normalized.append((name, value))
+    return tuple(sorted(normalized))
+
+
+def make_key(endpoint: str, filters: Optional[Mapping[str, Any]] = None,
+             locale: Optional[str] = None, version: Hashable = None) -> tuple:
+    """
+    Builds a cache key.
+
+    Args:
+        endpoint (str): The endpoint name.
+        filters (Optional[Mapping[str, Any]]): The request filters.
+        locale (Optional[str]): The response locale.
+        version (Hashable): Extra state the response depends on, e.g. the
+            live-set version of the activation timeline.
+
+    Returns:
+        tuple: The key.
+    """
+    return (endpoint, normalize_filters(filters or {}), (locale or '').lower(), version)
+
+
+def compute_etag(body: bytes) -> str:
+    """
+    Computes a strong ETag from a response body.
+
+    Args:
+        body (bytes): The body.
+
+    Returns:
+        str: The quoted entity tag.
+    """
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class PlacementCache:
+    """
+    Bounded, tag-invalidated cache of serialized responses.
+
+    Each tag maps to the keys of the entries carrying it, so invalidating a tag
+    removes its entries without scanning the cache. The TTL only bounds how long
+    an entry can outlive a change that was never published; least recently
+    used entries are evicted when max_entries or max_bytes is exceeded. An
+    expired entry is kept for stale_ttl more seconds so it can be served by
+    get_stale() while it is rebuilt; invalidation removes it immediately.
+
+    Every invalidation advances a generation and records it against its tags.
+    An entry stored with the generation taken before it was built is discarded
+    if any of its tags was invalidated since, so a rebuild that read the
+    database before a write cannot put back what the write invalidated.
+
+    Attributes:
+        ttl (float): Seconds an entry stays valid without invalidation.
+        stale_ttl (float): Seconds an expired entry is kept for get_stale().
+        max_entries (int): The maximum number of entries.
+        max_bytes (int): The maximum total size of the cached bodies.
+        size (int): The current total size of the cached bodies.
+        hits (int): Lookups served from the cache.
+        misses (int): Lookups that found nothing.
+        invalidations (int): Entries removed by tag.
+        discarded (int): Entries not stored because they were invalidated while built.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 2048, max_bytes: int = 64 * 1024 * 1024,
+                 clock: Callable[[], float] = time.monotonic, stale_ttl: float = 0):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl (float): Seconds an entry stays valid without invalidation.
+            max_entries (int): The maximum number of entries.
+            max_bytes (int): The maximum total size of the cached bodies.
+            clock (Callable[[], float]): Monotonic time source.
+            stale_ttl (float): Seconds an expired entry is kept for get_stale().
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.clock = clock
+        self._entries: 'OrderedDict[tuple, CachedResponse]' = OrderedDict()
+        self._tags: Dict[Hashable, Set[tuple]] = {}
+        self._generation = 0
+        self._tag_generations: Dict[Hashable, int] = {}
+        self._cleared_generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.discarded = 0
+
+    @property
+    def generation(self) -> int:
+        """The current invalidation generation, taken before building an entry."""
+        return self._generation
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        """
+        Returns a valid entry.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            Optional[CachedResponse]: The entry, or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= self.clock():
+                if entry.expires_at + self.stale_ttl <= self.clock():
+                    self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get_stale(self, key: tuple) -> Optional[CachedResponse]:
+        """
+        Returns an entry that may have expired but is within its stale period.
+
+        Lookups through this method are not counted as hits or misses.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            Optional[CachedResponse]: The entry, or None if missing or past its stale period.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at + self.stale_ttl <= self.clock():
+                self._remove(key)
+                entry = None
+            return entry
+
+    def put(self, key: tuple, body: bytes, tags: Iterable[Hashable] = (),
+            banner_ids: Iterable[int] = (), last_modified: Optional[datetime] = None,
+            ttl: Optional[float] = None) -> CachedResponse:
+        """
+        Stores a serialized response.
+
+        Args:
+            key (tuple): The cache key.
+            body (bytes): The JSON body.
+            tags (Iterable[Hashable]): The tags to invalidate the entry by.
+            banner_ids (Iterable[int]): The banners in the response, in order.
+            last_modified (Optional[datetime]): When the response content last changed.
+            ttl (Optional[float]): Overrides the default TTL.
+
+        Returns:
+            CachedResponse: The stored entry.
+        """
+        return self.store(key, self.entry(body, tags, banner_ids, last_modified, ttl))
+
+    def entry(self, body: bytes, tags: Iterable[Hashable] = (), banner_ids: Iterable[int] = (),
+              last_modified: Optional[datetime] = None, ttl: Optional[float] = None) -> CachedResponse:
+        """
+        Builds an entry for store() without storing it.
+
+        Args:
+            body (bytes): The JSON body.
+            tags (Iterable[Hashable]): The tags to invalidate the entry by.
+            banner_ids (Iterable[int]): The banners in the response, in order.
+            last_modified (Optional[datetime]): When the response content last changed.
+            ttl (Optional[float]): Overrides the default TTL.
+
+        Returns:
+            CachedResponse: The entry.
+        """
+        return CachedResponse(
+            body=body,
+            etag=compute_etag(body),
+            last_modified=last_modified,
+            banner_ids=tuple(banner_ids),
+            tags=frozenset(tags),
+            expires_at=self.clock() + (self.ttl if ttl is None else ttl)
+        )
+
+    def store(self, key: tuple, entry: CachedResponse,
+              generation: Optional[int] = None) -> Optional[CachedResponse]:
+        """
+        Stores a prepared entry, e.g. one fetched from a shared tier.
+
+        Args:
+            key (tuple): The cache key.
+            entry (CachedResponse): The entry; expires_at is on this cache's clock.
+            generation (Optional[int]): The generation taken before the entry was
+                built. If any of its tags was invalidated since, it is not stored.
+
+        Returns:
+            Optional[CachedResponse]: The stored entry, or None if it was discarded.
+        """
+        with self._lock:
+            if generation is not None and self._invalidated_since(generation, entry.tags):
+                self.discarded += 1
+                return None
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > 1 and (
+                    len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, tags: Iterable[Hashable]) -> int:
+        """
+        Removes every entry carrying any of the tags.
+
+        Args:
+            tags (Iterable[Hashable]): The tags.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            self._generation += 1
+            if len(self._tag_generations) > self.max_entries:
+                # Forget old tag generations; builds in progress are discarded once
+                self._cleared_generation = self._generation - 1
+                self._tag_generations.clear()
+            for tag in tags:
+                self._tag_generations[tag] = self._generation
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+            self._generation += 1
+            self._cleared_generation = self._generation
+            self._tag_generations.clear()
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        Returns cache counters for monitoring.
+
+        Returns:
+            Dict[str, object]: Entry, tag, hit, miss and invalidation counts.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'tags': len(self._tags),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions,
+            'discarded': self.discarded
+        }
+
+    def _invalidated_since(self, generation: int, tags: Iterable[Hashable]) -> bool:
+        if self._cleared_generation > generation:
+            return True
+        return any(self._tag_generations.get(tag, 0) > generation for tag in tags)
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
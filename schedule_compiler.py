@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Banner Schedule Compiler - Naebak Project
+
+This module compiles weekly banner schedules (days of week plus a daily time
+window in a given timezone) into a weekday bitmask and minute-of-day intervals,
+so checking whether a schedule is showing becomes a bit test and the next
+visibility change can be computed exactly.
+"""
+
+import threading
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_TIMEZONE = 'Africa/Cairo'
+
+# Bit d is set when the schedule applies on day d (0=Sunday, 6=Saturday)
+ALL_DAYS_MASK = 0b1111111
+
+MINUTES_PER_DAY = 24 * 60
+
+_zones: Dict[str, ZoneInfo] = {}
+
+
+def get_zone(name: Optional[str]) -> ZoneInfo:
+    """
+    Returns a cached ZoneInfo, falling back to UTC for unknown names.
+
+    Args:
+        name (Optional[str]): The IANA timezone name.
+
+    Returns:
+        ZoneInfo: The timezone.
+    """
+    name = name or DEFAULT_TIMEZONE
+    zone = _zones.get(name)
+    if zone is None:
+        try:
+            zone = ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            zone = ZoneInfo('UTC')
+        _zones[name] = zone
+    return zone
+
+
+def _to_utc(value: Optional[datetime]) -> datetime:
+    """Converts a datetime to aware UTC; naive values are taken as UTC."""
+    if value is None:
+        return datetime.now(dt_timezone.utc)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=dt_timezone.utc)
+    return value.astimezone(dt_timezone.utc)
+
+
+def local_position(zone: ZoneInfo, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """
+    Returns the weekday (0=Sunday) and minute of day of an instant in a timezone.
+
+    Args:
+        zone (ZoneInfo): The timezone.
+        now (Optional[datetime]): The instant; naive values are UTC. Defaults to now.
+
+    Returns:
+        Tuple[int, int]: (weekday, minute_of_day).
+    """
+    local = _to_utc(now).astimezone(zone)
+    return (local.weekday() + 1) % 7, local.hour * 60 + local.minute
+
+
+def days_to_mask(days: Union[str, Iterable[int]]) -> int:
+    """
+    Builds a weekday bitmask from day numbers (0=Sunday).
+
+    Args:
+        days (Union[str, Iterable[int]]): Day numbers, or the comma-separated
+            days_of_week column as stored.
+
+    Returns:
+        int: The bitmask; no days means every day.
+    """
+    if isinstance(days, str):
+        days = days.split(',') if days else ()
+    mask = 0
+    for day in days:
+        mask |= 1 << (int(day) % 7)
+    return mask or ALL_DAYS_MASK
+
+
+def _rotate(mask: int) -> int:
+    """Shifts a weekday mask one day later (Saturday wraps to Sunday)."""
+    return ((mask << 1) | (mask >> 6)) & ALL_DAYS_MASK
+
+
+class CompiledSchedule:
+    """
+    A weekly schedule compiled to weekday masks and minute-of-day intervals.
+
+    Each segment is (weekday_mask, start_minute, end_minute) with the end
+    exclusive. A window that crosses midnight (e.g. 22:00-02:00) is split into
+    a segment on its own days and a segment on the following days.
+
+    Attributes:
+        zone (ZoneInfo): The timezone the schedule is expressed in.
+        segments (Tuple[Tuple[int, int, int], ...]): The compiled segments.
+    """
+
+    __slots__ = ('zone', 'segments')
+
+    def __init__(self, zone: ZoneInfo, segments: Iterable[Tuple[int, int, int]]):
+        self.zone = zone
+        self.segments = tuple(segments)
+
+    @classmethod
+    def compile(cls, days: Union[str, Iterable[int]], start: Optional[time], end: Optional[time],
+                timezone: Optional[str] = None, enabled: bool = True) -> 'CompiledSchedule':
+        """
+        Compiles a schedule definition.
+
+        Args:
+            days (Union[str, Iterable[int]]): Day numbers (0=Sunday), as a list or
+                the stored comma-separated string; empty means every day.
+            start (Optional[time]): The daily start time; None means midnight.
+            end (Optional[time]): The daily end time; None means end of day.
+            timezone (Optional[str]): The IANA timezone name.
+            enabled (bool): Whether the schedule is active at all.
+
+        Returns:
+            CompiledSchedule: The compiled schedule.
+        """
+        zone = get_zone(timezone)
+        if not enabled:
+            return cls(zone, ())
+
+        mask = days_to_mask(days)
+        start_minute = start.hour * 60 + start.minute if start else 0
+        end_minute = end.hour * 60 + end.minute if end else MINUTES_PER_DAY
+
+        if start_minute < end_minute:
+            segments = [(mask, start_minute, end_minute)]
+        elif start_minute > end_minute:
+            # Overnight window: the tail after midnight belongs to the next day
+            segments = [(mask, start_minute, MINUTES_PER_DAY)]
+            if end_minute:
+                segments.append((_rotate(mask), 0, end_minute))
+        else:
+            segments = []
+        return cls(zone, segments)
+
+    def is_active_at_position(self, weekday: int, minute: int) -> bool:
+        """
+        Checks the schedule against a precomputed local weekday and minute.
+
+        Args:
+            weekday (int): The local weekday (0=Sunday).
+            minute (int): The local minute of day.
+
+        Returns:
+            bool: Whether the schedule is showing.
+        """
+        bit = 1 << weekday
+        for mask, start, end in self.segments:
+            if mask & bit and start <= minute < end:
+                return True
+        return False
+
+    def is_active_at(self, now: Optional[datetime] = None) -> bool:
+        """
+        Checks whether the schedule is showing at an instant.
+
+        Args:
+            now (Optional[datetime]): The instant; naive values are UTC. Defaults to now.
+
+        Returns:
+            bool: Whether the schedule is showing.
+        """
+        return self.is_active_at_position(*local_position(self.zone, now))
+
+    def next_transition(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        Returns the next instant at which the schedule starts or stops showing.
+
+        Args:
+            now (Optional[datetime]): The instant to search from; naive values are UTC.
+
+        Returns:
+            Optional[datetime]: The naive UTC time of the next change, or None if
+            the schedule is always or never showing.
+        """
+        now_utc = _to_utc(now)
+        current = self.is_active_at(now_utc)
+        local_midnight = datetime.combine(now_utc.astimezone(self.zone).date(), time.min)
+
+        boundaries = set()
+        for offset in range(8):
+            day_start = local_midnight + timedelta(days=offset)
+            bit = 1 << ((day_start.weekday() + 1) % 7)
+            for mask, start, end in self.segments:
+                if mask & bit:
+                    boundaries.add(day_start + timedelta(minutes=start))
+                    boundaries.add(day_start + timedelta(minutes=end))
+
+        for boundary in sorted(boundaries):
+            instant = boundary.replace(tzinfo=self.zone).astimezone(dt_timezone.utc)
+            if instant > now_utc and self.is_active_at(instant) != current:
+                return instant.replace(tzinfo=None)
+        return None
+
+
+def filter_active(compiled: Iterable[Tuple[object, CompiledSchedule]],
+                  now: Optional[datetime] = None) -> List[object]:
+    """
+    Returns the keys of the schedules showing at an instant.
+
+    The local weekday and minute are computed once per timezone, so checking
+    many schedules costs one bit test per segment.
+
+    Args:
+        compiled (Iterable[Tuple[object, CompiledSchedule]]): (key, schedule) pairs.
+        now (Optional[datetime]): The instant; naive values are UTC. Defaults to now.
+
+    Returns:
+        List[object]: The keys of the showing schedules.
+    """
+    now_utc = _to_utc(now)
+    positions = {}
+    active = []
+    for key, schedule in compiled:
+        position = positions.get(schedule.zone)
+        if position is None:
+            position = positions[schedule.zone] = local_position(schedule.zone, now_utc)
+        if schedule.is_active_at_position(*position):
+            active.append(key)
+    return active
+
+
+class ScheduleCache:
+    """
+    Per-schedule cache of compiled schedules.
+
+    Entries are keyed by schedule ID and validated against the schedule's
+    definition, so an updated schedule is recompiled on its next use.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, schedule_id, signature: tuple, days: Union[str, Iterable[int]], start: Optional[time],
+            end: Optional[time], timezone: Optional[str], enabled: bool) -> CompiledSchedule:
+        """
+        Returns the compiled schedule, compiling it if missing or outdated.
+
+        Args:
+            schedule_id: The schedule ID; None disables caching.
+            signature (tuple): The raw definition the cached entry must match.
+            days, start, end, timezone, enabled: The definition, as for CompiledSchedule.compile().
+                Pass days_of_week unparsed; it is only parsed when the schedule is compiled.
+
+        Returns:
+            CompiledSchedule: The compiled schedule.
+        """
+        if schedule_id is not None:
+            entry = self._entries.get(schedule_id)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+
+        compiled = CompiledSchedule.compile(days, start, end, timezone, enabled)
+        if schedule_id is not None:
+            with self._lock:
+                self._entries[schedule_id] = (signature, compiled)
+        return compiled
+
+    def invalidate(self, schedule_id=None):
+        """
+        Drops one cached schedule, or all of them.
+
+        Args:
+            schedule_id: The schedule ID, or None to clear the cache.
+        """
+        with self._lock:
+            if schedule_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(schedule_id, None)
+
+
+# Shared process-wide cache
+schedule_cache = ScheduleCache()
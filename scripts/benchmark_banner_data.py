@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Banner Representation Benchmark - Naebak Project
+
+Compares the banner objects held by the serving index: the previous plain
+dataclass (with a per-instance __dict__) and the slotted BannerData, built
+directly and through snapshot(). Reports construction rate, attribute read
+rate, to_dict() rate and memory per banner; rates are the best of several runs.
+
+Usage:
+    python scripts/benchmark_banner_data.py [--count 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import fields, make_dataclass
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import BannerData  # noqa: E402
+
+# The representation before slots: same fields and defaults, with a __dict__
+PlainBannerData = make_dataclass(
+    'PlainBannerData',
+    [(f.name, f.type, f) for f in fields(BannerData)],
+    namespace={'to_dict': BannerData.to_dict}
+)
+
+NOW = datetime(2025, 1, 1, 12, 0)
+
+
+def banner_kwargs(banner_id):
+    return dict(
+        id=banner_id,
+        title="مرحباً بكم في منصة نائبك",
+        image_url="/static/banners/welcome.jpg",
+        banner_type="hero",
+        position="top",
+        category="informational",
+        status="active",
+        priority=banner_id % 5 + 1,
+        start_date=NOW,
+        created_at=NOW,
+        updated_at=NOW
+    )
+
+
+def build(factory, count):
+    return [factory(**banner_kwargs(i)) for i in range(count)]
+
+
+def best_rate(operation, operations, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return operations / min(timings)
+
+
+def read_all(banners):
+    for banner in banners:
+        banner.id, banner.priority, banner.position, banner.category, banner.governorate, banner.end_date
+
+
+def to_dict_all(banners):
+    for banner in banners:
+        banner.to_dict()
+
+
+def bytes_per_banner(factory, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    banners = build(factory, count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list holding the banners is not part of their cost
+    return (after - before - sys.getsizeof(banners)) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--count', type=int, default=100000, help='banners per measurement')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per rate; the best is reported')
+    args = parser.parse_args()
+
+    variants = [
+        ('dataclass (before)', PlainBannerData),
+        ('slotted BannerData', BannerData),
+        ('BannerData.snapshot()', lambda **kwargs: BannerData(**kwargs).snapshot()),
+    ]
+
+    print(f"{'representation':<22}{'objects/s':>12}{'reads/s':>14}{'to_dict/s':>12}{'bytes/banner':>14}")
+    for name, factory in variants:
+        banners = build(factory, args.count)
+        created = best_rate(lambda: build(factory, args.count), args.count, args.repeat)
+        reads = best_rate(lambda: read_all(banners), args.count * 6, args.repeat)
+        dicts = best_rate(lambda: to_dict_all(banners), args.count, args.repeat)
+        size = bytes_per_banner(factory, args.count)
+        print(f"{name:<22}{created:>12,.0f}{reads:>14,.0f}{dicts:>12,.0f}{size:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
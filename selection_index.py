@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Banner Selection Index - Naebak Project
+
+This module provides an in-memory index of active banners used by the banner service
+to answer display queries without scanning and sorting the whole banner inventory.
+"""
+
+import heapq
+import itertools
+import threading
+from bisect import insort
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Wildcard used in index keys for an unfiltered dimension
+ANY = '*'
+
+# Governorate slot for banners that are not targeted at a specific governorate
+ALL_GOVERNORATES = ''
+
+_ACTIVATE = 'activate'
+_EXPIRE = 'expire'
+
+
+class BannerSelectionIndex:
+    """
+    Precomputed selection index for active banners.
+
+    Every active banner is stored in the priority-sorted bucket of each
+    (position, category, governorate) key it can match, including wildcard keys.
+    A display query then becomes a dictionary lookup plus a slice. The index is
+    patched incrementally when banners are created, updated, started or expired.
+    Resolved queries are cached, least recently used first out, up to max_results.
+
+    Attributes:
+        banners (Dict[int, object]): Indexed and pending banners by ID.
+        buckets (Dict[Tuple[str, str, str], list]): Priority-sorted entries per key.
+        max_results (int): The maximum number of cached query results.
+    """
+
+    def __init__(self, max_results: int = 1024):
+        """
+        Initialize an empty selection index.
+
+        Args:
+            max_results (int): The maximum number of cached query results.
+        """
+        self.max_results = max_results
+        self._lock = threading.RLock()
+        self._seq = itertools.count()
+        self.banners: Dict[int, object] = {}
+        self.buckets: Dict[Tuple[str, str, str], list] = {}
+        self._entries = {}     # banner_id -> (sort_key, keys)
+        self._versions = {}    # banner_id -> version, used to skip stale timeline events
+        self._results: 'OrderedDict[tuple, tuple]' = OrderedDict()  # query key -> banners, LRU order
+        self._timeline = []    # heap of (when, seq, banner_id, version, action)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rebuild(self, banners: Iterable, now: Optional[datetime] = None):
+        """
+        Rebuilds the index from a full banner inventory.
+
+        Args:
+            banners (Iterable): The banners to index, in display order for equal priorities.
+            now (Optional[datetime]): The reference time (defaults to the current time).
+        """
+        with self._lock:
+            self.banners.clear()
+            self.buckets.clear()
+            self._entries.clear()
+            self._versions.clear()
+            self._results.clear()
+            self._timeline = []
+            for banner in banners:
+                self.upsert(banner, now=now)
+
+    def upsert(self, banner, now: Optional[datetime] = None):
+        """
+        Adds or updates a single banner.
+
+        Banners that are not active or whose end date has passed are dropped.
+        Banners with a future start date are activated when it arrives.
+
+        Args:
+            banner: The banner that was created or updated.
+            now (Optional[datetime]): The reference time (defaults to the current time).
+        """
+        now = now or datetime.now()
+        with self._lock:
+            version = self._versions.get(banner.id, 0) + 1
+            self._detach(banner.id)
+            self._versions[banner.id] = version
+
+            if banner.status != 'active':
+                return
+            if banner.end_date and banner.end_date <= now:
+                return
+
+            self.banners[banner.id] = banner
+            if banner.start_date and banner.start_date > now:
+                self._schedule(banner.start_date, banner.id, version, _ACTIVATE)
+            else:
+                self._attach(banner)
+
+            if banner.end_date:
+                self._schedule(banner.end_date, banner.id, version, _EXPIRE)
+
+    def remove(self, banner_id: int):
+        """
+        Removes a banner from the index.
+
+        Args:
+            banner_id (int): The ID of the banner to remove.
+        """
+        with self._lock:
+            self._versions[banner_id] = self._versions.get(banner_id, 0) + 1
+            self._detach(banner_id)
+
+    def lookup(self, position: Optional[str] = None,
+               category: Optional[str] = None,
+               governorate: Optional[str] = None,
+               limit: Optional[int] = None,
+               now: Optional[datetime] = None) -> List:
+        """
+        Returns the active banners matching a query, sorted by priority.
+
+        Banners without a target governorate match every governorate.
+
+        Args:
+            position (Optional[str]): Filter by banner position.
+            category (Optional[str]): Filter by banner category.
+            governorate (Optional[str]): Filter by target governorate.
+            limit (Optional[int]): The maximum number of banners to return.
+            now (Optional[datetime]): The reference time (defaults to the current time).
+
+        Returns:
+            List: The matching banners.
+        """
+        self.advance(now)
+
+        query = (position or ANY, category or ANY, governorate or ANY)
+        with self._lock:
+            result = self._results.get(query)
+            if result is None:
+                result = self._resolve(*query)
+                self._results[query] = result
+                if len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+            else:
+                self._results.move_to_end(query)
+
+        return list(result[:limit] if limit else result)
+
+    def advance(self, now: Optional[datetime] = None):
+        """
+        Applies start and end date transitions that are due.
+
+        Args:
+            now (Optional[datetime]): The reference time (defaults to the current time).
+        """
+        timeline = self._timeline
+        now = now or datetime.now()
+        if not timeline or timeline[0][0] > now:
+            return
+
+        with self._lock:
+            while self._timeline and self._timeline[0][0] <= now:
+                _, _, banner_id, version, action = heapq.heappop(self._timeline)
+                if self._versions.get(banner_id) != version:
+                    continue
+                if action == _ACTIVATE and banner_id in self.banners:
+                    self._attach(self.banners[banner_id])
+                elif action == _EXPIRE:
+                    self._detach(banner_id)
+
+    def _resolve(self, position: str, category: str, governorate: str) -> tuple:
+        """Merges the sorted buckets that make up a query key."""
+        if governorate == ANY:
+            entries = self.buckets.get((position, category, ANY), [])
+        else:
+            entries = heapq.merge(
+                self.buckets.get((position, category, governorate), []),
+                self.buckets.get((position, category, ALL_GOVERNORATES), [])
+            )
+        return tuple(self.banners[banner_id] for _, _, banner_id in entries)
+
+    def _keys_for(self, banner) -> List[Tuple[str, str, str]]:
+        governorate = banner.governorate or ALL_GOVERNORATES
+        return [
+            (position, category, gov)
+            for position in (banner.position, ANY)
+            for category in (banner.category, ANY)
+            for gov in (governorate, ANY)
+        ]
+
+    def _attach(self, banner):
+        if banner.id in self._entries:
+            return
+        sort_key = (banner.priority, next(self._seq), banner.id)
+        keys = self._keys_for(banner)
+        for key in keys:
+            insort(self.buckets.setdefault(key, []), sort_key)
+        self._entries[banner.id] = (sort_key, keys)
+        self._results.clear()
+
+    def _detach(self, banner_id: int):
+        entry = self._entries.pop(banner_id, None)
+        self.banners.pop(banner_id, None)
+        if entry is None:
+            return
+        sort_key, keys = entry
+        for key in keys:
+            bucket = self.buckets.get(key)
+            if bucket:
+                bucket.remove(sort_key)
+                if not bucket:
+                    del self.buckets[key]
+        self._results.clear()
+
+    def _schedule(self, when: datetime, banner_id: int, version: int, action: str):
+        heapq.heappush(self._timeline, (when, next(self._seq), banner_id, version, action))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Serving Indexes - Naebak Project
+
+This module defines the indexes behind the banner placement queries, creates any
+that an existing database is missing, and reads query plans so tests can assert
+that placement queries keep using them as the inventory grows.
+
+- ix_banners_serving (position_id, is_active, is_published, priority): the
+  current-banners query for a position is an equality match on the first three
+  columns, read in priority order, so it needs no sort and stops after LIMIT rows.
+- ix_banners_window (is_active, end_date, start_date): the expiry sweep and
+  other date-window filters on live banners become range scans.
+"""
+
+import logging
+from typing import List
+
+from sqlalchemy import Index, inspect, text
+
+logger = logging.getLogger(__name__)
+
+
+def banner_serving_indexes() -> List[Index]:
+    """
+    Builds the serving indexes of the banners table.
+
+    Columns are named rather than bound, so the same definitions can be
+    attached to the declarative model and to a plain Table. A new list is
+    returned on every call, since an index belongs to a single table.
+
+    Returns:
+        List[Index]: The index definitions.
+    """
+    return [
+        Index('ix_banners_serving', 'position_id', 'is_active', 'is_published', 'priority'),
+        Index('ix_banners_window', 'is_active', 'end_date', 'start_date'),
+    ]
+
+
+def ensure_indexes(engine, table) -> List[str]:
+    """
+    Creates the table's declared indexes that the database does not have yet.
+
+    create_all() only creates indexes together with their table, so this is
+    the migration step for databases created before an index was declared.
+    It is idempotent and safe to run on every start.
+
+    Args:
+        engine: The SQLAlchemy engine.
+        table (Table): The table whose declared indexes to create.
+
+    Returns:
+        List[str]: The names of the indexes created.
+    """
+    existing = {index['name'] for index in inspect(engine).get_indexes(table.name)}
+    created = []
+    with engine.begin() as conn:
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(conn)
+                created.append(index.name)
+                logger.info(f"Created index {index.name} on {table.name}")
+    return created
+
+
+def explain(conn, statement) -> str:
+    """
+    Returns the database's plan for a statement.
+
+    Args:
+        conn: A SQLAlchemy connection.
+        statement: A SQLAlchemy select.
+
+    Returns:
+        str: The plan as text, one step per line.
+
+    Raises:
+        NotImplementedError: For databases other than SQLite and PostgreSQL.
+    """
+    dialect = conn.dialect.name
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+    if dialect == 'sqlite':
+        rows = conn.execute(text(f'EXPLAIN QUERY PLAN {compiled}')).all()
+        return '\n'.join(row[-1] for row in rows)
+    if dialect == 'postgresql':
+        rows = conn.execute(text(f'EXPLAIN {compiled}')).all()
+        return '\n'.join(row[0] for row in rows)
+    raise NotImplementedError(f"EXPLAIN is not supported for {dialect}")
+
+
+def uses_index(plan: str, index_name: str) -> bool:
+    """
+    Checks whether a plan reads an index instead of scanning the table.
+
+    Args:
+        plan (str): The output of explain().
+        index_name (str): The index name.
+
+    Returns:
+        bool: True if the plan uses the index.
+    """
+    return index_name in plan
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Request Coalescing - Naebak Project
+
+This module lets concurrent callers that need the same missing value share one
+computation: the first caller for a key (the leader) runs it while the others
+wait for its result, so a cache expiry under load causes one database query per
+key instead of one per request.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class Flight:
+    """
+    One in-progress computation.
+
+    Attributes:
+        result (Any): The leader's result, once done.
+        error (Optional[BaseException]): The leader's exception, if it failed.
+        waiters (int): The number of callers that joined.
+    """
+
+    __slots__ = ('_done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+    @property
+    def done(self) -> bool:
+        """Whether the leader has finished."""
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the leader to finish.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait; None waits indefinitely.
+
+        Returns:
+            bool: True if the leader finished in time.
+        """
+        return self._done.wait(timeout)
+
+
+class SingleFlight:
+    """
+    Per-key coalescing of concurrent computations within a process.
+
+    Attributes:
+        leaders (int): Computations started.
+        coalesced (int): Callers that waited for another caller's computation.
+        timeouts (int): Waiting callers that gave up.
+    """
+
+    def __init__(self):
+        """Initialize with no computations in flight."""
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def begin(self, key: Hashable) -> Tuple[Flight, bool]:
+        """
+        Joins the flight for a key, starting one if none is in progress.
+
+        A caller that gets is_leader=True must call finish() for the key.
+
+        Args:
+            key (Hashable): The key.
+
+        Returns:
+            Tuple[Flight, bool]: The flight and whether the caller leads it.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, key: Hashable, flight: Flight, result: Any = None,
+               error: Optional[BaseException] = None):
+        """
+        Publishes the leader's outcome and wakes the waiters.
+
+        Args:
+            key (Hashable): The key.
+            flight (Flight): The flight returned by begin().
+            result (Any): The computed value.
+            error (Optional[BaseException]): The exception, if the computation failed.
+        """
+        flight.result = result
+        flight.error = error
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight._done.set()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Runs fn once for all concurrent callers with the same key.
+
+        Waiters receive the leader's result or re-raise its exception. A waiter
+        that times out runs fn itself rather than fail the request.
+
+        Args:
+            key (Hashable): The key.
+            fn (Callable[[], Any]): The computation.
+            timeout (Optional[float]): Seconds a waiter waits for the leader.
+
+        Returns:
+            Any: The computed value.
+        """
+        flight, leader = self.begin(key)
+        if not leader:
+            return self.wait(flight, fn, timeout)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result)
+        return result
+
+    def wait(self, flight: Flight, fallback: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Waits for a flight and returns its outcome.
+
+        Args:
+            flight (Flight): The flight joined as a waiter.
+            fallback (Callable[[], Any]): Computes the value if the wait times out.
+            timeout (Optional[float]): Seconds to wait.
+
+        Returns:
+            Any: The leader's result, or the fallback's.
+        """
+        self.coalesced += 1
+        if not flight.wait(timeout):
+            self.timeouts += 1
+            return fallback()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        Returns coalescing counters for monitoring.
+
+        Returns:
+            Dict[str, int]: In-flight keys, leaders, coalesced callers and timeouts.
+        """
+        return {
+            'in_flight': len(self._flights),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts
+        }
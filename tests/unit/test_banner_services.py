@@ -0,0 +1,1691 @@
+"""
+Unit tests for banner service components
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+import numpy as np
+import pytest
+from dataclasses import replace
+from types import SimpleNamespace
+from datetime import datetime, time as dt_time, timedelta
+from PIL import Image
+
+from werkzeug.datastructures import FileStorage
+
+import constants
+from config import Config
+from models import BannerData, BannerService
+from selection_index import BannerSelectionIndex
+from hyperloglog import HyperLogLog
+from image_jobs import ImageJobQueue, JOB_COMPLETED, JOB_FAILED, generate_renditions, process_banner_image
+from image_store import ContentStore, is_content_addressed
+from image_validation import LimitedReader, UploadTooLarge, read_image_header
+from schedule_compiler import CompiledSchedule, ScheduleCache, filter_active
+from activation_timeline import ActivationTimeline, BannerWindow
+from invalidation import TOPIC_BANNERS, TOPIC_POSITIONS, InvalidationBus, invalidation_bus
+from banner_serializer import BannerSerializer, count_queries
+from placement_cache import PlacementCache, TAG_BANNERS, banner_ids_in, banner_tag, make_key, page_tag
+from memory_redis import InMemoryRedis
+from two_tier_cache import RedisTier, TwoTierCache
+from single_flight import SingleFlight
+from cache_warmup import CacheWarmer, is_warmup_request
+from aggregate_stats import AggregateCache, conditional_counts, count_rows
+from serving_indexes import banner_serving_indexes, ensure_indexes, explain, uses_index
+from keyset import InvalidCursor, decode_cursor, encode_cursor, order_by, seek_after, sort_key
+from conditional import conditional, is_not_modified, make_etag, not_modified
+from json_provider import dumps_bytes, init_json, json_response, loads as json_loads
+from event_pipeline import BannerEventPipeline, banner_events, make_engine_writer
+from app.services.stats_rollup import StatsRollup, rollup_state
+from app.services.view_counter import ImpressionCounter
+from app.services.expiry_sweeper import ExpirySweeper
+from app.services.range_analytics import RangeAnalytics, day_over_day, moving_average
+
+
+def make_banner(banner_id, **kwargs):
+    defaults = dict(
+        id=banner_id,
+        title=f"banner {banner_id}",
+        position="top",
+        category="informational",
+        status="active",
+        priority=3,
+    )
+    defaults.update(kwargs)
+    return BannerData(**defaults)
+
+
+@pytest.mark.unit
+class TestBannerSelectionIndex:
+    """Test the in-memory banner selection index"""
+
+    def setup_method(self):
+        self.now = datetime(2025, 1, 1, 12, 0)
+        self.index = BannerSelectionIndex()
+
+    def test_lookup_sorted_by_priority(self):
+        """Banners are returned in priority order, ties in insertion order"""
+        self.index.rebuild([
+            make_banner(1, priority=3),
+            make_banner(2, priority=1),
+            make_banner(3, priority=3),
+        ], now=self.now)
+
+        result = self.index.lookup(now=self.now)
+        assert [b.id for b in result] == [2, 1, 3]
+
+    def test_filters_by_position_and_category(self):
+        """Filters narrow the candidate list"""
+        self.index.rebuild([
+            make_banner(1, position="top", category="service"),
+            make_banner(2, position="sidebar_right", category="service"),
+            make_banner(3, position="top", category="event"),
+        ], now=self.now)
+
+        assert [b.id for b in self.index.lookup(position="top", now=self.now)] == [1, 3]
+        assert [b.id for b in self.index.lookup(
+            position="top", category="service", now=self.now)] == [1]
+
+    def test_governorate_includes_untargeted_banners(self):
+        """A governorate query matches that governorate and untargeted banners"""
+        self.index.rebuild([
+            make_banner(1, governorate="Cairo", priority=2),
+            make_banner(2, governorate="Giza", priority=1),
+            make_banner(3, priority=1),
+        ], now=self.now)
+
+        assert [b.id for b in self.index.lookup(governorate="Cairo", now=self.now)] == [3, 1]
+        assert [b.id for b in self.index.lookup(now=self.now)] == [2, 3, 1]
+
+    def test_incremental_update_and_remove(self):
+        """Updates reposition banners and removals drop them"""
+        self.index.rebuild([make_banner(1, priority=1), make_banner(2, priority=2)], now=self.now)
+        assert [b.id for b in self.index.lookup(now=self.now)] == [1, 2]
+
+        self.index.upsert(make_banner(1, priority=5), now=self.now)
+        assert [b.id for b in self.index.lookup(now=self.now)] == [2, 1]
+
+        self.index.upsert(make_banner(2, status="paused"), now=self.now)
+        self.index.remove(1)
+        assert self.index.lookup(now=self.now) == []
+
+    def test_start_and_end_dates(self):
+        """Banners appear at their start date and expire at their end date"""
+        self.index.rebuild([
+            make_banner(1, end_date=self.now + timedelta(hours=1)),
+            make_banner(2, start_date=self.now + timedelta(hours=2)),
+        ], now=self.now)
+
+        assert [b.id for b in self.index.lookup(now=self.now)] == [1]
+        later = self.now + timedelta(hours=3)
+        assert [b.id for b in self.index.lookup(now=later)] == [2]
+
+    def test_limit(self):
+        """The result can be sliced to a limit"""
+        self.index.rebuild([make_banner(i, priority=i) for i in range(1, 6)], now=self.now)
+        assert [b.id for b in self.index.lookup(limit=2, now=self.now)] == [1, 2]
+
+    def test_result_cache_is_bounded(self):
+        """Arbitrary query values cannot grow the result cache past max_results"""
+        index = BannerSelectionIndex(max_results=3)
+        index.rebuild([make_banner(1, governorate="Cairo")], now=self.now)
+
+        assert [b.id for b in index.lookup(governorate="Cairo", now=self.now)] == [1]
+        for i in range(50):
+            assert index.lookup(governorate=f"unknown-{i}", now=self.now) == []
+            index.lookup(governorate="Cairo", now=self.now)
+
+        assert len(index._results) == 3
+        assert ('*', '*', 'Cairo') in index._results
+        assert [b.id for b in index.lookup(governorate="Cairo", now=self.now)] == [1]
+
+
+@pytest.mark.unit
+class TestHyperLogLog:
+    """Test the HyperLogLog unique viewer sketch"""
+
+    def test_estimate_within_error_bounds(self):
+        """Estimates stay within a few percent of the exact count"""
+        sketch = HyperLogLog()
+        sketch.update(f"viewer-{i}" for i in range(20000))
+        assert abs(sketch.count() - 20000) / 20000 < 0.05
+
+    def test_duplicates_not_counted(self):
+        """Repeated values do not increase the estimate"""
+        sketch = HyperLogLog()
+        for _ in range(10):
+            sketch.update(f"viewer-{i}" for i in range(100))
+        assert 95 <= sketch.count() <= 105
+
+    def test_merge_equals_union(self):
+        """Merging daily sketches estimates the union of viewers"""
+        monday, tuesday = HyperLogLog(), HyperLogLog()
+        monday.update(f"viewer-{i}" for i in range(0, 6000))
+        tuesday.update(f"viewer-{i}" for i in range(3000, 9000))
+
+        week = HyperLogLog.merged([monday.to_bytes(), None, tuesday.to_bytes()])
+        assert abs(week.count() - 9000) / 9000 < 0.05
+
+    def test_serialization_round_trip(self):
+        """Registers survive storage in the stats row"""
+        sketch = HyperLogLog(precision=10)
+        sketch.update(range(500))
+        restored = HyperLogLog.from_bytes(sketch.to_bytes())
+        assert restored.precision == 10
+        assert restored.count() == sketch.count()
+
+    def test_merge_rejects_different_precision(self):
+        """Sketches with different precision cannot be merged"""
+        with pytest.raises(ValueError):
+            HyperLogLog(precision=10).merge(HyperLogLog(precision=12))
+
+
+class StubUpload:
+    """Minimal stand-in for a werkzeug FileStorage"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+
+@pytest.mark.unit
+class TestImageJobQueue:
+    """Test background banner image processing"""
+
+    def setup_method(self):
+        self.completed = []
+
+    def wait_for(self, queue, job_id, timeout=30):
+        deadline = time.monotonic() + timeout
+        while queue.get(job_id)['status'] == 'pending' and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return queue.get(job_id)
+
+    def test_resizes_and_thumbnails_on_worker(self, tmp_path):
+        """Hero images are resized to the recommended size and the staged file removed"""
+        buffer = io.BytesIO()
+        Image.new('RGB', (2400, 900), 'red').save(buffer, 'JPEG')
+        queue = ImageJobQueue(str(tmp_path / 'staging'), str(tmp_path / 'out'), max_workers=1)
+        try:
+            job_id = queue.submit(StubUpload(buffer.getvalue()), 'hero.jpg', 'hero',
+                                  on_complete=self.completed.append)
+            job = self.wait_for(queue, job_id)
+        finally:
+            queue.shutdown()
+
+        assert job['status'] == JOB_COMPLETED
+        assert (job['result']['width'], job['result']['height']) == (1600, 600)
+        assert os.path.exists(job['result']['thumbnail_path'])
+        assert os.listdir(tmp_path / 'staging') == []
+        assert self.completed[0]['job_id'] == job_id
+
+    def test_processed_files_named_by_their_own_content(self, tmp_path):
+        """The processed image URL changes when different settings change its bytes"""
+        source = tmp_path / 'upload.jpg'
+        Image.new('RGB', (2400, 900), 'red').save(source, 'JPEG')
+        results = [
+            process_banner_image(str(source), str(tmp_path / 'out'), 'hero',
+                                 {'QUALITY_COMPRESSION': quality}, remove_source=False)
+            for quality in (85, 40)
+        ]
+
+        for result in results:
+            with open(result['upload_path'], 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            assert result['filename'] == ContentStore(str(tmp_path / 'out')).relative_path(digest, '.jpg')
+            assert is_content_addressed(result['filename'])
+        assert results[0]['filename'] != results[1]['filename']
+        assert results[0]['thumbnail_path'] != results[1]['thumbnail_path']
+
+    def test_invalid_image_fails_job(self, tmp_path):
+        """Undecodable uploads mark the job as failed"""
+        queue = ImageJobQueue(str(tmp_path / 'staging'), str(tmp_path / 'out'), max_workers=1)
+        try:
+            job = self.wait_for(queue, queue.submit(StubUpload(b'not an image'), 'x.png', 'hero'))
+        finally:
+            queue.shutdown()
+
+        assert job['status'] == JOB_FAILED
+        assert queue.metrics()['failed'] == 1
+
+
+@pytest.mark.unit
+class TestRenditions:
+    """Test responsive rendition generation and selection"""
+
+    def test_generates_widths_and_formats(self, tmp_path):
+        """Sidebar images get 1x, 2x and mobile renditions in WebP and JPEG"""
+        image = Image.new('RGBA', (900, 750), (0, 128, 255, 200))
+        renditions = generate_renditions(image, str(tmp_path), 'sidebar', 80)
+
+        widths = {(r['name'], r['format']): r['width'] for r in renditions}
+        assert widths[('1x', 'webp')] == 300
+        assert widths[('2x', 'jpg')] == 600
+        assert widths[('mobile', 'webp')] == 300
+        for rendition in renditions:
+            assert os.path.exists(tmp_path / rendition['filename'])
+        # 1x and mobile share a width, so their files are content-identical
+        assert len({r['filename'] for r in renditions}) == 4
+
+    def test_pick_smallest_adequate_rendition(self):
+        """Serving picks the smallest rendition covering the requested width"""
+        banner = make_banner(1, renditions=[
+            {'name': '2x', 'width': 600, 'format': 'webp', 'file_size': 900},
+            {'name': '1x', 'width': 300, 'format': 'webp', 'file_size': 300},
+            {'name': '1x', 'width': 300, 'format': 'jpg', 'file_size': 500},
+        ])
+        assert banner.pick_rendition()['file_size'] == 300
+        assert banner.pick_rendition(400)['width'] == 600
+        assert banner.pick_rendition(2000)['width'] == 600
+        assert banner.pick_rendition(accept_webp=False)['format'] == 'jpg'
+        assert make_banner(2).pick_rendition() is None
+
+
+@pytest.mark.unit
+class TestContentStore:
+    """Test the content-addressed image store"""
+
+    def test_identical_uploads_stored_once(self, tmp_path):
+        """Re-uploading the same bytes reuses the stored file"""
+        store = ContentStore(str(tmp_path))
+        digest, created = store.put_stream(io.BytesIO(b'creative' * 10000), '.JPG')
+        again, created_again = store.put_stream(io.BytesIO(b'creative' * 10000), '.jpg')
+
+        assert (digest, created) == (again, True)
+        assert created_again is False
+        assert store.relative_path(digest, '.jpg') == f"{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+        assert os.path.exists(store.path(digest, '.jpg'))
+        assert os.listdir(tmp_path / 'tmp') == []
+
+    def test_manifest_round_trip(self, tmp_path):
+        """Processing results are remembered per digest and banner type"""
+        store = ContentStore(str(tmp_path))
+        digest, _ = store.put_bytes(b'image', '.png')
+        assert store.load_manifest(digest, 'hero') is None
+        store.save_manifest(digest, 'hero', {'filename': 'x'})
+        assert store.load_manifest(digest, 'hero') == {'filename': 'x'}
+
+    def test_content_addressed_paths(self):
+        """Only digest-named files in the sharded layout are immutable"""
+        digest = 'ab' * 32
+        assert is_content_addressed(f"ab/ab/{digest}-hero_thumb.jpg")
+        assert not is_content_addressed("banner.jpg")
+        assert not is_content_addressed(f"cd/ab/../{digest}.jpg")
+
+
+@pytest.mark.unit
+class TestStreamingUploadValidation:
+    """Test header-only validation of uploaded images"""
+
+    def setup_method(self):
+        self.service = BannerService(Config)
+
+    def make_upload(self, filename, size=(800, 300), image_format='PNG'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'blue').save(buffer, image_format)
+        return FileStorage(stream=io.BytesIO(buffer.getvalue()), filename=filename), buffer.getvalue()
+
+    def test_valid_upload_replays_full_body(self):
+        """A valid image passes and the stored stream still yields every byte"""
+        upload, data = self.make_upload('banner.png')
+        assert self.service.validate_image_file(upload) == []
+        assert upload.stream.read() == data
+
+    def test_spoofed_extension_rejected(self):
+        """A JPEG renamed to .png is rejected from its magic number"""
+        upload, _ = self.make_upload('banner.png', image_format='JPEG')
+        assert self.service.validate_image_file(upload)
+
+    def test_dimensions_checked_from_header(self):
+        """Images outside the configured dimensions are rejected"""
+        upload, _ = self.make_upload('banner.png', size=(100, 100))
+        assert self.service.validate_image_file(upload)
+
+    def test_undecodable_header_reported_as_invalid_type(self):
+        """A PNG signature followed by garbage is an invalid file type, not a dimensions error"""
+        upload = FileStorage(stream=io.BytesIO(b'\x89PNG\r\n\x1a\n' + b'\0' * 512), filename='banner.png')
+        assert self.service.validate_image_file(upload) == [constants.VALIDATION_MESSAGES['INVALID_FILE_TYPE']]
+
+    def test_header_read_stops_early(self):
+        """Only the header is read, not the whole body"""
+        stream = io.BytesIO(self.make_upload('x.png', size=(1900, 1000))[1] + b'\0' * 1000000)
+        info = read_image_header(stream)
+        assert (info['format'], info['width'], info['height']) == ('PNG', 1900, 1000)
+        assert stream.tell() < 64 * 1024
+
+    def test_body_limit_enforced_while_streaming(self):
+        """Reading past the per-extension limit aborts the upload"""
+        reader = LimitedReader(io.BytesIO(b'x' * 2048), 1024)
+        with pytest.raises(UploadTooLarge):
+            while reader.read(512):
+                pass
+
+
+@pytest.mark.unit
+class TestCompiledSchedule:
+    """Test compiled weekly schedules"""
+
+    def setup_method(self):
+        # Working days (Sunday-Thursday), 09:00-17:00 Cairo time (UTC+2 in January)
+        self.schedule = CompiledSchedule.compile(
+            [0, 1, 2, 3, 4], dt_time(9, 0), dt_time(17, 0), 'Africa/Cairo'
+        )
+
+    def test_evaluated_in_schedule_timezone(self):
+        """The window applies in the schedule's timezone, not the server's"""
+        sunday = datetime(2025, 1, 5)
+        assert self.schedule.is_active_at(sunday.replace(hour=7, minute=0))
+        assert not self.schedule.is_active_at(sunday.replace(hour=6, minute=59))
+        assert not self.schedule.is_active_at(sunday.replace(hour=15, minute=0))
+        # Friday is not a working day
+        assert not self.schedule.is_active_at(datetime(2025, 1, 10, 10, 0))
+
+    def test_overnight_window(self):
+        """Windows crossing midnight continue into the next day"""
+        schedule = CompiledSchedule.compile([6], dt_time(22, 0), dt_time(2, 0), 'UTC')
+        assert schedule.is_active_at(datetime(2025, 1, 11, 23, 0))   # Saturday night
+        assert schedule.is_active_at(datetime(2025, 1, 12, 1, 59))   # Sunday morning
+        assert not schedule.is_active_at(datetime(2025, 1, 12, 23, 0))
+
+    def test_next_transition(self):
+        """The next visibility change is returned in UTC"""
+        thursday_evening = datetime(2025, 1, 9, 16, 0)  # 18:00 Cairo, after the window
+        assert self.schedule.next_transition(thursday_evening) == datetime(2025, 1, 12, 7, 0)
+        assert self.schedule.next_transition(datetime(2025, 1, 12, 8, 0)) == datetime(2025, 1, 12, 15, 0)
+        assert CompiledSchedule.compile([], None, None, 'UTC').next_transition() is None
+
+    def test_filter_active_and_cache(self):
+        """Many schedules are checked at once and recompiled when changed"""
+        cache = ScheduleCache()
+        first = cache.get(1, ('v1',), [], dt_time(9, 0), dt_time(10, 0), 'UTC', True)
+        assert cache.get(1, ('v1',), [], None, None, 'UTC', True) is first
+        changed = cache.get(1, ('v2',), [], None, None, 'UTC', True)
+        assert changed is not first
+
+        # The stored days_of_week string is parsed only when compiling
+        weekend = cache.get(2, ('0,6',), '0,6', None, None, 'UTC', True)
+        assert weekend.segments == CompiledSchedule.compile([0, 6], None, None, 'UTC').segments
+        assert cache.get(2, ('0,6',), 'not parsed on a hit', None, None, 'UTC', True) is weekend
+
+        now = datetime(2025, 1, 5, 12, 0)
+        assert filter_active([(1, first), (2, changed), (3, self.schedule)], now) == [2, 3]
+
+
+@pytest.mark.unit
+class TestActivationTimeline:
+    """Test the precomputed live set of banners"""
+
+    def setup_method(self):
+        self.now = datetime(2025, 1, 5, 12, 0)
+        self.timeline = ActivationTimeline(clock=lambda: self.now)
+
+    def window(self, banner_id, **kwargs):
+        defaults = dict(banner_id=banner_id, enabled=True, start_date=None, end_date=None, schedules=())
+        defaults.update(kwargs)
+        return BannerWindow(**defaults)
+
+    def test_transitions_flip_live_set(self):
+        """Start and end dates move banners in and out of the live set"""
+        self.timeline.rebuild([
+            self.window(1),
+            self.window(2, start_date=self.now + timedelta(hours=1)),
+            self.window(3, end_date=self.now + timedelta(hours=2)),
+            self.window(4, enabled=False),
+        ])
+        assert self.timeline.live_ids == {1, 3}
+        assert self.timeline.next_wakeup() == self.now + timedelta(hours=1)
+
+        # A late wake-up processes every transition that is due
+        assert self.timeline.advance(self.now + timedelta(hours=3)) == 2
+        assert self.timeline.live_ids == {1, 2}
+
+    def test_schedule_windows(self):
+        """Scheduled banners are live only inside their window"""
+        schedule = CompiledSchedule.compile([], dt_time(13, 0), dt_time(14, 0), 'UTC')
+        self.timeline.rebuild([self.window(1, schedules=(schedule,))])
+        assert self.timeline.live_ids == set()
+        self.timeline.advance(self.now + timedelta(hours=1))
+        assert self.timeline.live_ids == {1}
+        self.timeline.advance(self.now + timedelta(hours=2))
+        assert self.timeline.live_ids == set()
+
+    def test_update_supersedes_pending_transition(self):
+        """Updating or removing a banner invalidates its queued transitions"""
+        self.timeline.rebuild([self.window(1, end_date=self.now + timedelta(hours=1))])
+        self.timeline.upsert(self.window(1))
+        self.timeline.advance(self.now + timedelta(hours=2))
+        assert self.timeline.live_ids == {1}
+
+        self.timeline.remove(1)
+        assert self.timeline.live_ids == set()
+        assert self.timeline.next_wakeup() is None
+
+
+@pytest.mark.unit
+class TestBannerExpiry:
+    """Test expiry scheduling and invalidation events"""
+
+    def test_schedule_banner_expiry_uses_default_duration(self):
+        """Banners without an explicit date expire after the default duration"""
+        service = BannerService(Config)
+        banner = make_banner(500, start_date=datetime.now() - timedelta(days=1))
+        service.index_banner(banner)
+        assert service.schedule_banner_expiry(banner.id)
+        indexed = service.selection_index.banners[banner.id]
+        assert indexed.end_date == banner.start_date + timedelta(days=Config.DEFAULT_BANNER_DURATION_DAYS)
+
+        assert service.schedule_banner_expiry(banner.id, datetime.now() - timedelta(seconds=1))
+        assert banner.id not in [b.id for b in service.get_active_banners()]
+        assert not service.schedule_banner_expiry(99999)
+
+    def test_explicit_expiry_ignores_auto_expire_setting(self):
+        """Turning off automatic expiry only disables the default duration"""
+        config = type('NoAutoExpire', (Config,), {'AUTO_EXPIRE_BANNERS': False})
+        service = BannerService(config)
+        banner = make_banner(501, start_date=datetime.now() - timedelta(days=1))
+        service.index_banner(banner)
+
+        assert not service.schedule_banner_expiry(banner.id)
+        assert service.selection_index.banners[banner.id].end_date is None
+
+        expiry = datetime.now() + timedelta(days=2)
+        assert service.schedule_banner_expiry(banner.id, expiry)
+        assert service.selection_index.banners[banner.id].end_date == expiry
+
+    def test_bus_notifies_all_subscribers(self):
+        """A failing subscriber does not block the others"""
+        bus = InvalidationBus()
+        received = []
+
+        def failing(topic, keys):
+            raise RuntimeError("boom")
+
+        bus.subscribe('banners', failing)
+        bus.subscribe('banners', lambda topic, keys: received.append((topic, keys)))
+        bus.publish('banners', {3, 4})
+        bus.publish('other', [1])
+
+        assert received == [('banners', [3, 4])]
+        assert bus.metrics()['published'] == {'banners': 1, 'other': 1}
+
+
+@pytest.mark.unit
+class TestBannerSerializer:
+    """Test batch serialization query counts"""
+
+    def setup_method(self):
+        from sqlalchemy import (Boolean, Column, DateTime, Integer, MetaData, String, Table,
+                                create_engine, insert)
+
+        metadata = MetaData()
+        common = lambda: [Column('id', Integer, primary_key=True), Column('name', String),
+                          Column('name_en', String), Column('description', String),
+                          Column('is_active', Boolean), Column('created_at', DateTime),
+                          Column('updated_at', DateTime)]
+        types = Table('banner_types', metadata, *common(), Column('icon', String),
+                      Column('color', String), Column('priority', Integer))
+        positions = Table('banner_positions', metadata, *common(), Column('css_class', String),
+                          Column('max_banners', Integer), Column('display_order', Integer))
+        banners = Table('banners', metadata, Column('id', Integer, primary_key=True),
+                        Column('type_id', Integer), Column('position_id', Integer),
+                        Column('is_active', Boolean))
+
+        self.engine = create_engine('sqlite://')
+        metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(insert(types), [{'id': i, 'name': f't{i}', 'name_en': f't{i}'} for i in (1, 2)])
+            conn.execute(insert(positions), [{'id': i, 'name': f'p{i}', 'name_en': f'p{i}'} for i in (1, 2)])
+            conn.execute(insert(banners), [
+                {'id': i, 'type_id': 1 + i % 2, 'position_id': 1 + i % 2, 'is_active': i % 3 != 0}
+                for i in range(1, 51)
+            ])
+        self.serializer = BannerSerializer(banners, types, positions)
+
+    def banners(self, count):
+        fields = ('title', 'title_en', 'content', 'content_en', 'image_url', 'link_url',
+                  'link_text', 'link_target', 'priority', 'start_date', 'end_date',
+                  'is_published', 'show_close_button', 'auto_hide_after', 'animation_type',
+                  'custom_css', 'custom_js', 'created_at', 'updated_at', 'published_at',
+                  'view_count', 'click_count')
+        return [SimpleNamespace(id=i, type_id=1 + i % 2, position_id=1 + i % 2, is_active=True,
+                                metadata_json='{"campaign": "x"}', **dict.fromkeys(fields))
+                for i in range(1, count + 1)]
+
+    def test_query_count_is_constant(self):
+        """A page costs two queries regardless of its size"""
+        with self.engine.connect() as conn:
+            for size in (1, 10, 50):
+                with count_queries(self.engine) as statements:
+                    data = self.serializer.serialize(conn, self.banners(size), live_ids={1})
+                assert len(statements) == 2
+                assert len(data) == size
+
+            with count_queries(self.engine) as statements:
+                assert self.serializer.serialize(conn, []) == []
+            assert statements == []
+
+    def test_references_and_counts(self):
+        """Types and positions carry their banner counts"""
+        with self.engine.connect() as conn:
+            data = self.serializer.serialize(conn, self.banners(2), live_ids={1}, include_stats=True)
+
+        assert [d['is_active_now'] for d in data] == [True, False]
+        assert data[0]['type']['id'] == 2 and data[0]['type']['banners_count'] == 25
+        assert data[1]['position']['id'] == 1
+        assert data[1]['position']['active_banners_count'] == 17
+        assert data[0]['metadata'] == {'campaign': 'x'}
+        assert data[0]['metadata'] is data[1]['metadata']
+        assert set(data[0]) >= {'view_count', 'click_count', 'ctr'}
+
+
+@pytest.mark.unit
+class TestJSONProvider:
+    """Test the orjson-backed JSON provider"""
+
+    def test_native_types(self):
+        """Datetimes are ISO 8601 and non-string keys are stringified"""
+        payload = {'when': datetime(2024, 3, 1, 9, 30), 'ids': {5: 'x'}, 'tags': {'a'},
+                   'banner': make_banner(1, title='عرض').to_dict()}
+        decoded = json_loads(dumps_bytes(payload))
+
+        assert decoded['when'] == '2024-03-01T09:30:00'
+        assert decoded['ids'] == {'5': 'x'}
+        assert decoded['tags'] == ['a']
+        assert decoded['banner']['title'] == 'عرض'
+        assert 'عرض'.encode('utf-8') in dumps_bytes(payload)
+
+    def test_flask_integration(self):
+        """jsonify, request parsing and pre-serialized bodies use the provider"""
+        from flask import Flask, jsonify, request
+
+        flask_app = Flask(__name__)
+        init_json(flask_app)
+
+        @flask_app.route('/echo', methods=['POST'])
+        def echo():
+            return jsonify(received=request.get_json(), at=datetime(2024, 1, 2))
+
+        @flask_app.route('/raw')
+        def raw():
+            return json_response(dumps_bytes({'b': 1, 'a': 2}), status=201)
+
+        client = flask_app.test_client()
+        response = client.post('/echo', json={'x': 1})
+        assert response.get_json() == {'received': {'x': 1}, 'at': '2024-01-02T00:00:00'}
+
+        response = client.get('/raw')
+        assert response.status_code == 201
+        assert response.mimetype == 'application/json'
+        assert response.data == b'{"b":1,"a":2}'
+
+
+@pytest.mark.unit
+class TestPlacementCache:
+    """Test the tag-invalidated placement response cache"""
+
+    def setup_method(self):
+        self.now = 1000.0
+        self.cache = PlacementCache(ttl=60, max_entries=3, clock=lambda: self.now)
+
+    def test_keys_normalize_filters(self):
+        """Empty filters and locale case do not split entries"""
+        assert make_key('current', {'position': 2, 'type': ''}, 'AR') == \
+            make_key('current', {'type': None, 'position': '2'}, 'ar')
+        assert make_key('current', {'position': 2}) != make_key('current', {'position': 3})
+
+    def test_invalidate_by_tag(self):
+        """Only the entries carrying a tag are dropped"""
+        listing = self.cache.put('list', b'[1,2]', tags=[TAG_BANNERS, banner_tag(1), banner_tag(2)],
+                                 banner_ids=[1, 2])
+        self.cache.put('page', b'{}', tags=[page_tag('home')])
+
+        assert self.cache.get('list').etag == listing.etag
+        assert self.cache.get('list').banner_ids == (1, 2)
+        assert self.cache.invalidate([banner_tag(2)]) == 1
+        assert self.cache.get('list') is None
+        assert self.cache.get('page') is not None
+
+        assert self.cache.invalidate([page_tag('home'), page_tag('home')]) == 1
+        assert self.cache.metrics()['entries'] == 0
+        assert self.cache.metrics()['tags'] == 0
+
+    def test_ttl_and_eviction(self):
+        """Entries expire after the TTL and the least recently used is evicted"""
+        for key in ('a', 'b', 'c'):
+            self.cache.put(key, key.encode())
+        self.cache.get('a')
+        self.cache.put('d', b'd')
+        assert self.cache.get('b') is None
+        assert self.cache.get('a') is not None
+
+        self.now += 61
+        assert self.cache.get('a') is None
+        assert self.cache.metrics()['evictions'] == 1
+
+    def test_size_accounting(self):
+        """Bodies are evicted once their total size exceeds max_bytes"""
+        cache = PlacementCache(max_bytes=10)
+        cache.put('a', b'12345')
+        cache.put('b', b'12345')
+        assert cache.size == 10
+        cache.put('c', b'123')
+        assert cache.get('a') is None
+        assert cache.metrics()['bytes'] == 8
+
+
+@pytest.mark.unit
+class TestConditionalGet:
+    """Test ETag and Last-Modified handling"""
+
+    def setup_method(self):
+        from flask import Flask, jsonify
+
+        self.flask_app = Flask(__name__)
+        self.updated_at = datetime(2024, 5, 1, 12, 0, 0)
+        self.etag = make_etag([(1, self.updated_at)])
+        self.serialized = 0
+
+        @self.flask_app.route('/derived')
+        def derived():
+            if is_not_modified(self.etag, self.updated_at):
+                return not_modified(self.etag, self.updated_at)
+            self.serialized += 1
+            return conditional(jsonify(ids=[1]), self.etag, self.updated_at)
+
+        @self.flask_app.route('/hashed')
+        def hashed():
+            return conditional(jsonify(['a', 'b']))
+
+        self.client = self.flask_app.test_client()
+
+    def test_derived_validators_skip_serialization(self):
+        """A matching If-None-Match or If-Modified-Since returns an empty 304"""
+        first = self.client.get('/derived')
+        assert first.status_code == 200
+        assert first.headers['ETag'] == self.etag
+        assert self.etag.startswith('W/')
+
+        assert self.client.get('/derived', headers={'If-None-Match': self.etag}).status_code == 304
+        response = self.client.get('/derived', headers={'If-Modified-Since': first.headers['Last-Modified']})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert self.serialized == 1
+
+        self.etag = make_etag([(1, self.updated_at), (2, self.updated_at)])
+        assert self.client.get('/derived', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+    def test_content_etag_changes_on_edit(self):
+        """Editing any served field changes the tag even when id and update time do not"""
+        banner = make_banner(1, start_date=self.updated_at, updated_at=self.updated_at)
+        etag = make_etag([banner.to_dict()], 'top', None, None, 'active')
+
+        for change in ({'title': "بنر معدل"}, {'link_url': "/news"}, {'priority': 2},
+                       {'end_date': datetime(2024, 6, 1)}):
+            edited = replace(banner, **change)
+            assert make_etag([edited.to_dict()], 'top', None, None, 'active') != etag
+        assert make_etag([banner.to_dict()], 'top', None, None, 'active') == etag
+
+    def test_content_hash_etag(self):
+        """Responses without explicit validators get a body hash ETag"""
+        first = self.client.get('/hashed')
+        etag = first.headers['ETag']
+        assert not etag.startswith('W/')
+        assert self.client.get('/hashed', headers={'If-None-Match': etag}).status_code == 304
+        assert self.client.get('/hashed', headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+@pytest.mark.unit
+class TestTwoTierCache:
+    """Test the local LRU in front of a shared Redis tier"""
+
+    def setup_method(self):
+        self.redis = InMemoryRedis()
+        self.workers = [TwoTierCache(remote=RedisTier(self.redis, prefix='test:'), local_ttl=5)
+                        for _ in range(2)]
+
+    def teardown_method(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def test_shared_tier_fills_other_workers(self):
+        """A response rendered by one worker is served from Redis, then locally, by another"""
+        first, second = self.workers
+        stored = first.put('current', b'{"data":[1]}', tags=[TAG_BANNERS, banner_tag(1)], banner_ids=[1],
+                           last_modified=datetime(2024, 1, 1))
+
+        entry = second.get('current')
+        assert (entry.body, entry.etag, entry.banner_ids) == (stored.body, stored.etag, (1,))
+        assert entry.last_modified == datetime(2024, 1, 1)
+        assert banner_tag(1) in entry.tags
+        second.get('current')
+        assert second.metrics()['remote']['hits'] == 1
+        assert second.local.hits == 1
+
+    def test_invalidation_reaches_every_worker(self):
+        """Invalidating a tag clears Redis and, via pub/sub, the other workers' memory"""
+        first, second = self.workers
+        for worker in self.workers:
+            worker.start()
+        first.put('current', b'[1]', tags=[banner_tag(1)])
+        first.put('page', b'{}', tags=[page_tag('home')])
+        second.get('current')
+        second.get('page')
+        time.sleep(0.05)
+
+        first.invalidate([banner_tag(1)])
+        deadline = time.time() + 2
+        while second.local.get('current') is not None and time.time() < deadline:
+            time.sleep(0.01)
+
+        assert second.local.get('current') is None
+        assert second.get('page') is not None
+        assert first.get('current') is None
+        assert second.messages_received == 1 and first.messages_received == 0
+
+    def test_remote_invalidations_reach_listeners(self):
+        """Other per-worker state is told which banners another worker invalidated"""
+        first, second = self.workers
+        received = []
+        second.subscribe(received.append)
+        second.subscribe(lambda tags: 1 / 0)
+
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(second.remote.channel)
+        first.invalidate([TAG_BANNERS, banner_tag(4), page_tag('home')])
+        first.clear()
+        for _ in range(2):
+            second.handle_message(pubsub.get_message(timeout=1)['data'])
+
+        assert received == [[TAG_BANNERS, banner_tag(4), page_tag('home')], []]
+        assert banner_ids_in(received[0]) == [4]
+
+    def test_redis_failure_falls_back_to_local(self):
+        """Redis errors are counted and the local tier keeps serving"""
+        class BrokenRedis:
+            def __getattr__(self, name):
+                raise ConnectionError("redis down")
+
+        cache = TwoTierCache(remote=RedisTier(BrokenRedis()))
+        cache.put('k', b'1')
+        assert cache.get('k').body == b'1'
+        assert cache.get('missing') is None
+        cache.invalidate([banner_tag(1)])
+        assert cache.metrics()['remote']['errors'] == 3
+
+
+@pytest.mark.unit
+class TestRequestCoalescing:
+    """Test single-flight rebuilds and stale-while-revalidate on cache misses"""
+
+    def setup_method(self):
+        self.now = [0.0]
+        self.builds = 0
+        self.release = threading.Event()
+
+    def slow_build(self):
+        self.builds += 1
+        self.release.wait(2)
+        return {'body': b'[%d]' % self.builds, 'banner_ids': [self.builds]}
+
+    def run_concurrently(self, fn, count):
+        results = [None] * count
+
+        def worker(index):
+            results[index] = fn()
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join(2)
+        return results
+
+    def test_single_flight_shares_one_computation(self):
+        """Concurrent callers with the same key run the computation once"""
+        flights = SingleFlight()
+        results = self.run_concurrently(lambda: flights.do('k', self.slow_build, timeout=2), 8)
+
+        assert self.builds == 1
+        assert all(result == results[0] for result in results)
+        assert flights.metrics() == {'in_flight': 0, 'leaders': 1, 'coalesced': 7, 'timeouts': 0}
+
+    def test_miss_is_rebuilt_once(self):
+        """Requests missing the same key wait for one rebuild"""
+        cache = TwoTierCache(PlacementCache(ttl=10))
+        entries = self.run_concurrently(lambda: cache.get_or_build('current', self.slow_build), 6)
+
+        assert self.builds == 1
+        assert {entry.body for entry in entries} == {b'[1]'}
+        assert cache.get('current').banner_ids == (1,)
+
+    def test_expired_entry_served_while_rebuilding(self):
+        """Within the stale period, only the rebuilding request waits"""
+        cache = TwoTierCache(PlacementCache(ttl=10, stale_ttl=30, clock=lambda: self.now[0]))
+        cache.put('current', b'[0]')
+        self.now[0] = 15
+
+        entries = self.run_concurrently(lambda: cache.get_or_build('current', self.slow_build), 5)
+        assert self.builds == 1
+        assert sorted(entry.body for entry in entries) == [b'[0]'] * 4 + [b'[1]']
+        assert cache.metrics()['rebuilds']['stale_served'] == 4
+
+        # Past the stale period, or after invalidation, nothing stale is served
+        cache.put('page', b'{}', tags=[page_tag('home')])
+        cache.invalidate([page_tag('home')])
+        assert cache.local.get_stale('page') is None
+        self.now[0] = 100
+        assert cache.local.get_stale('current') is None
+
+    def test_failed_rebuild_serves_stale(self):
+        """A rebuild error falls back to the stale entry when there is one"""
+        cache = TwoTierCache(PlacementCache(ttl=10, stale_ttl=30, clock=lambda: self.now[0]))
+        cache.put('current', b'[0]')
+        self.now[0] = 15
+
+        def failing_build():
+            raise RuntimeError("database unavailable")
+        assert cache.get_or_build('current', failing_build).body == b'[0]'
+        with pytest.raises(RuntimeError):
+            cache.get_or_build('missing', failing_build)
+
+    def test_build_invalidated_midway_is_not_stored(self):
+        """A rebuild that read data before an invalidation is served once but not cached"""
+        cache = TwoTierCache(PlacementCache(ttl=300))
+
+        def build_during(invalidate):
+            def build():
+                self.builds += 1
+                invalidate()
+                return {'body': b'[%d]' % self.builds, 'tags': [TAG_BANNERS, banner_tag(1)]}
+            return build
+
+        assert cache.get_or_build('current', build_during(lambda: cache.invalidate([banner_tag(1)]))).body == b'[1]'
+        assert cache.get('current') is None
+        assert cache.get_or_build('cleared', build_during(cache.clear)).body == b'[2]'
+        assert cache.get('cleared') is None
+        assert cache.metrics()['local']['discarded'] == 2
+
+        # Invalidating unrelated tags does not discard the build
+        assert cache.get_or_build('current', build_during(lambda: cache.invalidate([page_tag('home')]))).body == b'[3]'
+        assert cache.get('current').body == b'[3]'
+
+    def test_build_invalidated_by_another_worker_is_not_shared(self):
+        """An invalidation by another worker during a rebuild keeps it out of both tiers"""
+        redis_client = InMemoryRedis()
+        first, second = [TwoTierCache(remote=RedisTier(redis_client, prefix='test:')) for _ in range(2)]
+
+        def build():
+            self.builds += 1
+            # The other worker's message has not arrived here yet
+            second.invalidate([banner_tag(1)])
+            return {'body': b'[1]', 'tags': [banner_tag(1)]}
+
+        assert first.get_or_build('current', build).body == b'[1]'
+        assert first.get('current') is None and second.get('current') is None
+
+        second.remote.clear()
+        assert first.get_or_build('current', lambda: {'body': b'[2]', 'tags': [banner_tag(1)]}).body == b'[2]'
+        assert second.get('current').body == b'[2]'
+
+    def test_workers_share_rebuild_through_redis_lock(self):
+        """A worker that cannot take the rebuild lock waits for the result in Redis"""
+        redis_client = InMemoryRedis()
+        first, second = [TwoTierCache(remote=RedisTier(redis_client, prefix='test:'), build_timeout=2)
+                         for _ in range(2)]
+        assert first.remote.acquire('current', 'other', 2)
+
+        def publish_later():
+            time.sleep(0.1)
+            first.put('current', b'[7]', banner_ids=[7])
+            first.remote.release('current', 'other')
+        threading.Thread(target=publish_later).start()
+
+        entry = second.get_or_build('current', self.slow_build)
+        assert entry.body == b'[7]' and self.builds == 0
+        assert not redis_client.exists(first.remote.lock_key('current'))
+
+
+@pytest.mark.unit
+class TestCacheWarmer:
+    """Test warming placement responses through the app on startup"""
+
+    def setup_method(self):
+        from flask import Flask, request
+
+        self.seen = []
+        self.app = Flask(__name__)
+
+        @self.app.route('/placements/<key>')
+        def placement(key):
+            self.seen.append((key, request.headers.get('Accept-Language'), is_warmup_request(request.environ)))
+            if key == 'broken':
+                raise RuntimeError("database unavailable")
+            return {'key': key}
+
+    def test_warms_every_path_in_every_locale(self, caplog):
+        """Each path is requested per locale, flagged as warm-up, and timed"""
+        warmer = CacheWarmer(locales=['ar', 'en'])
+        assert not warmer.ready
+
+        with caplog.at_level('INFO', logger='cache_warmup'):
+            results = warmer.warm(self.app, ['/placements/top', '/placements/home'])
+
+        assert self.seen == [('top', 'ar', True), ('top', 'en', True), ('home', 'ar', True), ('home', 'en', True)]
+        assert [(r['path'], r['locale'], r['status']) for r in results][:2] == [
+            ('/placements/top', 'ar', 200), ('/placements/top', 'en', 200)]
+        assert all(r['duration_ms'] >= 0 for r in results)
+        assert sum('Cache warm-up /placements/' in message for message in caplog.messages) == 4
+        assert warmer.ready and warmer.metrics()['requests'] == 4
+
+    def test_background_warm_up_reports_ready_despite_errors(self):
+        """A failing path is counted but does not keep the instance unready"""
+        warmer = CacheWarmer()
+        warmer.start(self.app, lambda: ['/placements/broken', '/placements/top'])
+
+        assert warmer.wait(5)
+        assert warmer.metrics()['errors'] == 1
+        assert [r['status'] for r in warmer.results] == [500, 200]
+
+
+@pytest.mark.unit
+class TestConstantsIndexes:
+    """Test the lookup tables built from the constants at import"""
+
+    def test_lookups_match_the_lists(self):
+        """Indexed lookups return the same entries the lists hold"""
+        for banner in constants.BANNER_TYPES:
+            assert constants.get_banner_type_info(banner['type']) is banner
+        assert constants.get_banner_type_info('unknown') is None
+        assert constants.get_file_type_info('PNG')['mime_type'] == 'image/png'
+        assert constants.is_valid_file_type('banner.JPEG')
+        assert not constants.is_valid_file_type('banner.exe')
+        assert not constants.is_valid_file_type('banner')
+        assert constants.VALID_POSITIONS == {pos['position'] for pos in constants.BANNER_POSITIONS}
+
+    def test_indexes_are_read_only(self):
+        """The shared indexes cannot be modified by callers"""
+        with pytest.raises(TypeError):
+            constants.BANNER_TYPES_BY_KEY['new'] = {}
+        assert isinstance(constants.VALID_CATEGORIES, frozenset)
+
+
+@pytest.mark.unit
+class TestBannerSnapshots:
+    """Test the slotted banner representation held by the serving index"""
+
+    def test_snapshot_is_independent_copy(self):
+        """A snapshot has the same fields and output, and does not share the renditions list"""
+        banner = make_banner(1, start_date=datetime(2025, 1, 1), renditions=[
+            {'name': '1x', 'width': 300, 'format': 'webp', 'file_size': 300}])
+        copy = banner.snapshot()
+
+        assert copy == banner and copy is not banner
+        assert copy.to_dict() == banner.to_dict()
+        assert copy.pick_rendition() == banner.pick_rendition()
+        assert not hasattr(banner, '__dict__')
+
+        with pytest.raises(AttributeError):
+            banner.unknown_field = 1
+        banner.renditions.append({'name': '2x', 'width': 600, 'format': 'webp', 'file_size': 900})
+        assert len(copy.renditions) == 1
+
+    def test_index_holds_snapshots(self):
+        """Edits to a banner reach the serving index only when it is indexed again"""
+        service = BannerService(Config)
+        banner = make_banner(700, priority=1)
+        service.index_banner(banner)
+        banner.title = "edited"
+
+        served = [b for b in service.get_active_banners() if b.id == 700][0]
+        assert isinstance(served, BannerData) and served.title == "banner 700"
+        service.index_banner(banner)
+        assert [b.title for b in service.get_active_banners() if b.id == 700] == ["edited"]
+
+
+@pytest.mark.unit
+class TestKeysetPagination:
+    """Test seek pagination with signed continuation tokens"""
+
+    def setup_method(self):
+        from sqlalchemy import Column, DateTime, Integer, MetaData, Table, create_engine
+
+        self.engine = create_engine('sqlite://')
+        metadata = MetaData()
+        self.banners = Table(
+            'banners', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('priority', Integer, nullable=False),
+            Column('created_at', DateTime, nullable=False)
+        )
+        metadata.create_all(self.engine)
+        base = datetime(2025, 1, 1)
+        with self.engine.begin() as conn:
+            conn.execute(self.banners.insert(), [
+                {'id': i, 'priority': i % 3 + 1, 'created_at': base + timedelta(minutes=i % 4)}
+                for i in range(1, 31)
+            ])
+        self.order = [(self.banners.c.priority, False), (self.banners.c.created_at, True),
+                      (self.banners.c.id, True)]
+
+    def fetch_page(self, conn, cursor, per_page):
+        query = self.banners.select()
+        if cursor:
+            query = query.where(seek_after(self.order, decode_cursor(cursor, 'secret', len(self.order))))
+        rows = conn.execute(query.order_by(*order_by(self.order)).limit(per_page + 1)).fetchall()
+        next_cursor = encode_cursor(sort_key(rows[per_page - 1], self.order), 'secret') \
+            if len(rows) > per_page else None
+        return rows[:per_page], next_cursor
+
+    def test_pages_cover_the_offset_order_with_ties(self):
+        """Following the cursors returns every row once, in the full sort order"""
+        with self.engine.connect() as conn:
+            expected = [row.id for row in conn.execute(
+                self.banners.select().order_by(*order_by(self.order)))]
+            seen, cursor = [], None
+            while True:
+                rows, cursor = self.fetch_page(conn, cursor, 7)
+                seen.extend(row.id for row in rows)
+                if cursor is None:
+                    break
+
+        assert seen == expected and len(seen) == 30
+
+    def test_tampered_cursor_is_rejected(self):
+        """Tokens are opaque and only accepted with the key they were signed with"""
+        token = encode_cursor([2, datetime(2025, 1, 1, 0, 3), 17], 'secret')
+        assert decode_cursor(token, 'secret', 3) == [2, datetime(2025, 1, 1, 0, 3), 17]
+
+        forged = encode_cursor([2, datetime(2025, 1, 1, 0, 3), 1], 'other')
+        for bad in (forged, token[:-2], 'not a cursor', ''):
+            with pytest.raises(InvalidCursor):
+                decode_cursor(bad, 'secret', 3)
+        with pytest.raises(InvalidCursor):
+            decode_cursor(token, 'secret', 2)
+
+    def test_null_sort_columns_are_not_skipped(self):
+        """Rows with NULL priority or created_at are paged in the coalesced order"""
+        from sqlalchemy import create_engine, select
+        from app.models import BANNER_LISTING_ORDER, Banner
+
+        engine = create_engine('sqlite://')
+        Banner.__table__.create(engine)
+        base = datetime(2025, 1, 1)
+        rows = [
+            {'id': i, 'title': f'banner {i}', 'type_id': 1, 'position_id': 1,
+             'priority': None if i % 3 == 0 else i % 2 + 1,
+             'created_at': None if i % 4 == 0 else base + timedelta(minutes=i % 5)}
+            for i in range(1, 26)
+        ]
+        with engine.begin() as conn:
+            conn.execute(Banner.__table__.insert(), rows)
+        expected = [row['id'] for row in sorted(rows, key=lambda row: (
+            row['priority'] or 1, -(row['created_at'] or datetime(1970, 1, 1)).timestamp(), -row['id']))]
+
+        seen, cursor = [], None
+        with engine.connect() as conn:
+            while True:
+                query = select(Banner.__table__)
+                if cursor:
+                    query = query.where(seek_after(BANNER_LISTING_ORDER, decode_cursor(cursor, 'secret', 3)))
+                page = conn.execute(query.order_by(*order_by(BANNER_LISTING_ORDER)).limit(5)).fetchall()
+                seen.extend(row.id for row in page)
+                if len(page) < 5:
+                    break
+                cursor = encode_cursor(sort_key(page[-1], BANNER_LISTING_ORDER), 'secret')
+
+        assert seen == expected and len(seen) == 25
+
+
+def make_banners_table(metadata):
+    from sqlalchemy import Boolean, Column, DateTime, Integer, String, Table
+
+    return Table(
+        'banners', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('title', String(200)),
+        Column('position_id', Integer, nullable=False),
+        Column('priority', Integer),
+        Column('is_active', Boolean),
+        Column('is_published', Boolean),
+        Column('start_date', DateTime),
+        Column('end_date', DateTime),
+        *banner_serving_indexes()
+    )
+
+
+def serving_queries(banners, now):
+    from sqlalchemy import and_, select
+
+    current = select(banners.c.id, banners.c.priority).where(
+        banners.c.position_id == 3,
+        banners.c.is_active == True,
+        banners.c.is_published == True
+    ).order_by(banners.c.priority).limit(5)
+    expired = select(banners.c.id).where(and_(
+        banners.c.is_active == True,
+        banners.c.end_date.isnot(None),
+        banners.c.end_date < now
+    )).limit(500)
+    return current, expired
+
+
+@pytest.mark.unit
+class TestServingIndexes:
+    """Test that placement queries stay on their indexes"""
+
+    def setup_method(self):
+        from sqlalchemy import MetaData, create_engine, text
+
+        self.engine = create_engine('sqlite://')
+        self.banners = make_banners_table(MetaData())
+        self.banners.metadata.create_all(self.engine)
+        base = datetime(2025, 1, 1)
+        with self.engine.begin() as conn:
+            conn.execute(self.banners.insert(), [{
+                'title': f'banner {i}', 'position_id': i % 8, 'priority': i % 5 + 1,
+                'is_active': i % 3 != 0, 'is_published': i % 4 != 0,
+                'start_date': base + timedelta(days=i % 300),
+                'end_date': None if i % 5 == 0 else base + timedelta(days=i % 700)
+            } for i in range(5000)])
+            conn.execute(text('ANALYZE'))
+
+    def test_placement_queries_use_serving_indexes(self):
+        """The position query and the expiry window are index searches, not scans"""
+        current, expired = serving_queries(self.banners, datetime(2025, 6, 1))
+        with self.engine.connect() as conn:
+            current_plan = explain(conn, current)
+            expired_plan = explain(conn, expired)
+
+        assert uses_index(current_plan, 'ix_banners_serving')
+        assert 'TEMP B-TREE' not in current_plan
+        assert uses_index(expired_plan, 'ix_banners_window')
+        assert 'end_date<' in expired_plan.replace(' ', '')
+
+    def test_ensure_indexes_adds_only_missing_indexes(self):
+        """The migration step creates missing indexes and is idempotent"""
+        from sqlalchemy import text
+
+        assert ensure_indexes(self.engine, self.banners) == []
+        with self.engine.begin() as conn:
+            conn.execute(text('DROP INDEX ix_banners_window'))
+        assert ensure_indexes(self.engine, self.banners) == ['ix_banners_window']
+        assert ensure_indexes(self.engine, self.banners) == []
+
+    @pytest.mark.skipif(not os.environ.get('TEST_POSTGRES_URL'), reason="TEST_POSTGRES_URL not set")
+    def test_postgresql_plans_use_serving_indexes(self):
+        """On PostgreSQL the same queries can be answered from the indexes"""
+        from sqlalchemy import MetaData, create_engine, text
+
+        engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+        banners = make_banners_table(MetaData())
+        banners.metadata.drop_all(engine)
+        banners.metadata.create_all(engine)
+        try:
+            with engine.connect() as conn:
+                # Small test tables favour sequential scans; rule them out to test usability
+                conn.execute(text('SET enable_seqscan = off'))
+                current, expired = serving_queries(banners, datetime(2025, 6, 1))
+                assert uses_index(explain(conn, current), 'ix_banners_serving')
+                assert uses_index(explain(conn, expired), 'ix_banners_window')
+        finally:
+            banners.metadata.drop_all(engine)
+
+
+@pytest.mark.unit
+class TestAggregateStats:
+    """Test conditional-aggregation counts and their cache"""
+
+    def test_counts_come_from_one_query(self):
+        """All flags of a table, plus other tables' totals, are counted in one round trip"""
+        from sqlalchemy import Boolean, Column, Integer, MetaData, Table, create_engine
+
+        engine = create_engine('sqlite://')
+        metadata = MetaData()
+        banners = Table('banners', metadata, Column('id', Integer, primary_key=True),
+                        Column('is_active', Boolean), Column('is_published', Boolean))
+        types = Table('banner_types', metadata, Column('id', Integer, primary_key=True))
+        metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(banners.insert(), [
+                {'is_active': i % 2 == 0, 'is_published': i % 3 == 0} for i in range(12)])
+            conn.execute(types.insert(), [{'id': 1}, {'id': 2}])
+
+        query = conditional_counts(banners, {
+            'active': banners.c.is_active == True,
+            'published': banners.c.is_published == True
+        }, extra={'types': count_rows(types)})
+        with count_queries(engine) as statements, engine.connect() as conn:
+            row = conn.execute(query).one()
+            empty = conn.execute(conditional_counts(types, {'odd': types.c.id > 5})).one()
+
+        assert (row.total, row.active, row.published, row.types) == (12, 6, 4, 2)
+        assert (empty.total, empty.odd) == (2, 0)
+        assert len(statements) == 2
+
+    def test_cache_expires_and_is_invalidated_by_writes(self):
+        """Values are served until the TTL or an invalidation, whichever comes first"""
+        now = [0.0]
+        cache = AggregateCache(ttl=30, clock=lambda: now[0])
+        computed = []
+
+        def compute():
+            computed.append(len(computed) + 1)
+            return {'total': computed[-1]}
+
+        assert cache.get(compute) == {'total': 1}
+        assert cache.get(compute) == {'total': 1}
+        cache.invalidate('banners', [1])
+        assert cache.get(compute) == {'total': 2}
+        now[0] = 31
+        assert cache.get(compute) == {'total': 3}
+        assert cache.metrics()['hits'] == 1
+
+    def test_write_during_refresh_is_not_hidden(self):
+        """A result computed before an invalidation is returned once but not cached"""
+        cache = AggregateCache(ttl=30)
+
+        def racing_compute():
+            cache.invalidate()
+            return {'total': 'stale'}
+
+        assert cache.get(racing_compute) == {'total': 'stale'}
+        assert cache.get(lambda: {'total': 'fresh'}) == {'total': 'fresh'}
+
+
+@pytest.mark.unit
+class TestStatsRollup:
+    """Test the incremental rollup of raw events into daily BannerStats rows"""
+
+    def setup_method(self):
+        from sqlalchemy import create_engine
+        from app.models import BannerStats
+
+        self.engine = create_engine('sqlite://')
+        for table in (banner_events, rollup_state, BannerStats.__table__):
+            table.create(self.engine)
+        self.rollup = StatsRollup(settle_seconds=60, engine=self.engine)
+        self.now = datetime.utcnow()
+
+    def add_events(self, *events, age=120):
+        with self.engine.begin() as conn:
+            conn.execute(banner_events.insert(), [
+                {'banner_id': banner_id, 'event_type': event_type, 'ip_hash': ip_hash,
+                 'occurred_at': self.now - timedelta(seconds=age)}
+                for banner_id, event_type, ip_hash in events
+            ])
+
+    def totals(self, banner_id=1):
+        rows = self.rollup.daily_stats(banner_id)
+        return (sum(row['views'] for row in rows), sum(row['clicks'] for row in rows),
+                self.rollup.unique_visitors(banner_id))
+
+    def test_folds_only_new_events(self):
+        """Each run adds the events past the watermark to the stored counters and sketches"""
+        self.add_events((1, 'view', 'a'), (1, 'view', 'a'), (1, 'view', 'b'), (1, 'click', 'a'))
+        self.rollup.rollup_recent()
+        assert self.totals() == (3, 1, 2)
+
+        # Raw events already rolled up are not read again
+        with self.engine.begin() as conn:
+            conn.execute(banner_events.delete())
+        self.add_events((1, 'view', 'b'), (1, 'view', 'c'), (2, 'click', 'c'))
+        assert self.rollup.rollup_recent() >= 2
+        assert self.totals() == (5, 1, 3)
+        assert self.totals(2)[1] == 1
+
+        # Nothing new: another process sharing the watermark finds no work
+        assert StatsRollup(engine=self.engine).rollup_recent() == 0
+        assert self.totals() == (5, 1, 3)
+
+    def test_recent_events_wait_for_the_settle_period(self):
+        """Events that may still be committing are left for the next run"""
+        self.add_events((1, 'view', 'a'))
+        self.rollup.rollup_recent()
+        self.add_events((1, 'view', 'b'), age=0)
+        assert self.rollup.rollup_recent() == 0
+        assert self.totals()[0] == 1
+
+        self.rollup.settle_seconds = 0
+        self.rollup.rollup_recent()
+        assert self.totals()[0] == 2
+
+    def test_last_view_time_comes_from_view_events(self):
+        """last_viewed is the latest view event, not when the rollup ran"""
+        self.add_events((1, 'view', 'a'), age=300)
+        self.add_events((1, 'click', 'a'), age=120)
+        self.rollup.rollup_recent()
+        self.add_events((1, 'view', 'b'), age=200)
+        self.rollup.rollup_recent()
+
+        last_view = self.now - timedelta(seconds=200)
+        assert self.rollup.summarize(1)['last_viewed_at'] == last_view
+        assert BannerService(Config, engine=self.engine).get_banner_analytics(1).last_viewed == last_view
+
+    def test_backfill_stops_at_the_watermark(self):
+        """A full recompute leaves events past the watermark to the incremental run"""
+        self.add_events((1, 'view', 'a'), (1, 'click', 'a'))
+        self.rollup.rollup_recent()
+        self.add_events((1, 'view', 'b'), (1, 'view', 'c'))
+
+        today = datetime.utcnow().date()
+        self.rollup.backfill(today - timedelta(days=1), today)
+        assert self.totals() == (1, 1, 1)
+
+        self.rollup.rollup_recent()
+        assert self.totals() == (3, 1, 3)
+        assert self.rollup.summarize(1)['ctr'] == round(100 / 3, 2)
+        assert all(row['ctr'] == round(row['clicks'] / row['views'] * 100, 2)
+                   for row in self.rollup.daily_stats(1) if row['views'])
+
+
+@pytest.mark.unit
+class TestImpressionCounter:
+    """Test buffered view and click counting"""
+
+    def setup_method(self):
+        from sqlalchemy import Column, Integer, MetaData, Table, create_engine
+
+        self.engine = create_engine('sqlite://')
+        self.banners = Table('banners', MetaData(), Column('id', Integer, primary_key=True),
+                             Column('view_count', Integer), Column('click_count', Integer))
+        self.banners.create(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(self.banners.insert(), [{'id': 1, 'view_count': 10, 'click_count': None},
+                                                 {'id': 2, 'view_count': None, 'click_count': None}])
+        self.counter = ImpressionCounter(flush_interval=60, flush_size=5, engine=self.engine)
+
+    def counts(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(self.banners.select().order_by(self.banners.c.id)).all()
+        return {row.id: (row.view_count, row.click_count) for row in rows}
+
+    def test_flush_writes_one_batched_update(self):
+        """Pending deltas are applied in a single executemany and the buffer empties"""
+        for _ in range(3):
+            self.counter.record_view(1)
+        self.counter.record_click(1)
+        self.counter.record_view(2, count=2)
+        assert self.counter.pending_size == 6
+        assert self.counter.metrics()['pending_banners'] == 2
+
+        with count_queries(self.engine) as statements:
+            assert self.counter.flush() == 6
+        assert len(statements) == 1
+        assert self.counts() == {1: (13, 1), 2: (2, 0)}
+        assert self.counter.pending_size == 0
+        assert self.counter.flush() == 0
+        assert self.counter.metrics()['flushed_batches'] == 1
+
+    def test_failed_flush_restores_pending_counts(self):
+        """Counts survive a failed write and are applied by the next flush"""
+        self.counter.record_view(1, count=2)
+        self.counter.record_click(2)
+        class FailingEngine:
+            def begin(self):
+                raise ConnectionError("database down")
+
+        self.counter._engine = FailingEngine()
+
+        assert self.counter.flush() == 0
+        assert self.counter.pending_size == 3
+        assert self.counter.metrics()['failed_flushes'] == 1
+
+        self.counter.record_view(1)
+        self.counter._engine = self.engine
+        assert self.counter.flush() == 4
+        assert self.counts() == {1: (13, 0), 2: (0, 1)}
+
+    def test_shutdown_flushes_what_is_left(self, monkeypatch):
+        """The exit hook stops the thread and writes the remaining counts"""
+        import atexit
+        exit_hooks = []
+        monkeypatch.setattr(atexit, 'register', exit_hooks.append)
+        self.counter.start()
+        self.counter.record_view(2)
+        self.counter.record_click(2)
+
+        assert exit_hooks == [self.counter.shutdown]
+        exit_hooks[0]()
+
+        assert not self.counter._thread.is_alive()
+        assert self.counts()[2] == (1, 1)
+        assert self.counter.pending_size == 0
+
+
+@pytest.mark.unit
+class TestBannerEventPipeline:
+    """Test the bounded event queue and its batching writer"""
+
+    def test_full_queue_drops_and_counts(self):
+        """Events beyond the queue bound are rejected without blocking, and counted"""
+        written = []
+        pipeline = BannerEventPipeline(writer=written.extend, max_queue_size=3)
+
+        accepted = [pipeline.enqueue_view(1, ip_address='10.0.0.1') for _ in range(5)]
+        assert accepted == [True, True, True, False, False]
+        metrics = pipeline.metrics()
+        assert (metrics['enqueued'], metrics['dropped'], metrics['queue_depth']) == (3, 2, 3)
+        assert metrics['saturated']
+
+        # Draining frees room for new events
+        pipeline.shutdown()
+        assert len(written) == 3
+        assert pipeline.enqueue_click(1)
+
+    def test_batches_are_multi_row_inserts(self):
+        """Each batch is one INSERT, and client IPs are stored only as keyed hashes"""
+        from sqlalchemy import create_engine, func, select
+
+        engine = create_engine('sqlite://')
+        pipeline = BannerEventPipeline(writer=make_engine_writer(engine), batch_size=4, ip_salt='salt')
+        for i in range(10):
+            pipeline.enqueue_view(i % 2, user_agent='agent', ip_address='10.0.0.%d' % i)
+
+        with count_queries(engine) as statements:
+            pipeline.shutdown()
+
+        assert [statement.split()[0] for statement in statements] == ['INSERT'] * 3
+        assert (pipeline.written, pipeline.batches) == (10, 3)
+        with engine.connect() as conn:
+            assert conn.execute(select(func.count()).select_from(banner_events)).scalar() == 10
+            ip_hashes = conn.execute(select(banner_events.c.ip_hash)).scalars().all()
+        assert pipeline.hash_ip('10.0.0.0') in ip_hashes
+        assert not any(ip_hash.startswith('10.') for ip_hash in ip_hashes)
+
+    def test_failed_batch_is_counted_and_writer_continues(self):
+        """A write error loses only its batch"""
+        batches = []
+
+        def flaky_writer(rows):
+            if not batches:
+                batches.append(None)
+                raise ConnectionError("database down")
+            batches.append(rows)
+
+        pipeline = BannerEventPipeline(writer=flaky_writer, batch_size=2)
+        for banner_id in range(4):
+            pipeline.enqueue_click(banner_id)
+        pipeline.shutdown()
+
+        assert (pipeline.write_errors, pipeline.written) == (1, 2)
+        assert [row['banner_id'] for row in batches[1]] == [2, 3]
+
+    def test_shutdown_drains_the_background_writer(self, monkeypatch):
+        """Stopping the writer persists every accepted event"""
+        import atexit
+        monkeypatch.setattr(atexit, 'register', lambda hook: None)
+        written = []
+        pipeline = BannerEventPipeline(writer=written.extend, batch_size=50, flush_interval=0.05)
+        pipeline.start()
+        for banner_id in range(200):
+            pipeline.enqueue_view(banner_id)
+        pipeline.shutdown(timeout=2)
+
+        assert not pipeline._thread.is_alive()
+        assert sorted(row['banner_id'] for row in written) == list(range(200))
+        assert pipeline.metrics()['queue_depth'] == 0
+
+
+@pytest.mark.unit
+class TestRangeAnalytics:
+    """Test vectorized range analytics over daily stats rows"""
+
+    def setup_method(self):
+        from sqlalchemy import create_engine
+        from app.models import Banner, BannerStats
+
+        self.engine = create_engine('sqlite://')
+        Banner.__table__.create(self.engine)
+        BannerStats.__table__.create(self.engine)
+        self.start = datetime(2025, 3, 1).date()
+
+        def day(offset):
+            return self.start + timedelta(days=offset)
+
+        with self.engine.begin() as conn:
+            conn.execute(Banner.__table__.insert(), [
+                {'id': banner_id, 'title': f"banner {banner_id}", 'type_id': 1, 'position_id': position_id}
+                for banner_id, position_id in ((1, 10), (2, 10), (3, 20), (4, 20))
+            ])
+            conn.execute(BannerStats.__table__.insert(), [
+                # Banner 1 has gaps on days 1 and 3; banner 4 has no rows
+                {'banner_id': 1, 'date': day(0), 'views': 10, 'clicks': 1},
+                {'banner_id': 1, 'date': day(2), 'views': 20, 'clicks': 4},
+                {'banner_id': 2, 'date': day(1), 'views': 5, 'clicks': 0},
+                {'banner_id': 3, 'date': day(3), 'views': 0, 'clicks': 0},
+                # Outside the range
+                {'banner_id': 1, 'date': day(4), 'views': 99, 'clicks': 99},
+            ])
+        self.analytics = RangeAnalytics(self.engine)
+
+    def test_moving_average_and_deltas(self):
+        """Trailing averages use the days available at the start of the range"""
+        series = np.array([[1.0, 2.0, 3.0, 4.0], [0.0, 6.0, 0.0, 0.0]])
+        assert moving_average(series, 2).tolist() == [[1.0, 1.5, 2.5, 3.5], [0.0, 3.0, 3.0, 0.0]]
+        assert moving_average(series, 3).tolist() == [[1.0, 1.5, 2.0, 3.0], [0.0, 3.0, 2.0, 2.0]]
+        assert day_over_day(np.array([[5, 7, 4]])).tolist() == [[0, 2, -3]]
+
+    def test_banner_series_fill_gaps_with_zeros(self):
+        """Missing days count as zero views and clicks"""
+        result = self.analytics.query(self.start, self.start + timedelta(days=3), [1, 2, 3, 4], window=2)
+        banners = {banner['banner_id']: banner for banner in result['banners']}
+
+        first = banners[1]
+        assert (first['total_views'], first['total_clicks'], first['ctr']) == (30, 5, 16.67)
+        assert first['daily']['views'] == [10, 0, 20, 0]
+        assert first['daily']['ctr'] == [10.0, 0.0, 20.0, 0.0]
+        assert first['daily']['views_moving_avg'] == [10.0, 5.0, 10.0, 10.0]
+        assert first['daily']['views_day_over_day'] == [0, -10, 20, -20]
+        assert first['daily']['clicks_day_over_day'] == [0, -1, 4, -4]
+
+        # A banner with rows but no views has a zero CTR; one without rows is left out
+        assert banners[3]['ctr'] == 0.0 and banners[3]['daily']['ctr'] == [0.0] * 4
+        assert sorted(banners) == [1, 2, 3]
+        assert len(result['dates']) == 4
+
+    def test_position_summaries_and_totals(self):
+        """Banners are summed per position and overall"""
+        result = self.analytics.query(self.start, self.start + timedelta(days=3))
+        positions = {position['position_id']: position for position in result['positions']}
+
+        assert positions[10] == {'position_id': 10, 'banners': 2, 'total_views': 35, 'total_clicks': 5, 'ctr': 14.29}
+        assert positions[20] == {'position_id': 20, 'banners': 1, 'total_views': 0, 'total_clicks': 0, 'ctr': 0.0}
+        assert result['totals'] == {'views': 35, 'clicks': 5, 'ctr': 14.29}
+
+    def test_range_without_rows(self):
+        """A range with no stats returns empty lists and zero totals"""
+        result = self.analytics.query(datetime(2024, 1, 1).date(), datetime(2024, 1, 7).date())
+        assert (result['banners'], result['positions']) == ([], [])
+        assert result['totals'] == {'views': 0, 'clicks': 0, 'ctr': 0.0}
+
+
+@pytest.mark.unit
+class TestExpirySweeper:
+    """Test batched expiry UPDATEs and the invalidations they publish"""
+
+    def setup_method(self):
+        from sqlalchemy import create_engine
+        from app.models import Banner
+
+        self.engine = create_engine('sqlite://')
+        self.banners = Banner.__table__
+        self.banners.create(self.engine)
+        self.now = datetime(2025, 6, 1, 12, 0)
+        days = lambda n: self.now - timedelta(days=n)
+        rows = [
+            # Past their end date: expire
+            *({'id': i, 'end_date': days(1), 'position_id': 10 + i % 2} for i in range(1, 6)),
+            # Open-ended and started more than the default 7 days ago: expire
+            {'id': 6, 'start_date': days(8), 'position_id': 30},
+            {'id': 7, 'start_date': days(7) - timedelta(minutes=1), 'position_id': 30},
+            # Kept: future end, already inactive, open-ended but recent, no dates at all
+            {'id': 8, 'end_date': days(-1), 'position_id': 10},
+            {'id': 9, 'end_date': days(1), 'is_active': False, 'position_id': 10},
+            {'id': 10, 'start_date': days(6), 'position_id': 30},
+            {'id': 11, 'position_id': 30},
+        ]
+        with self.engine.begin() as conn:
+            conn.execute(self.banners.insert(), [
+                dict({'title': 'banner', 'type_id': 1, 'is_active': True, 'start_date': None, 'end_date': None},
+                     **row) for row in rows
+            ])
+
+        self.published = []
+        self.collect = lambda topic, keys: self.published.append((topic, sorted(keys)))
+        invalidation_bus.subscribe(TOPIC_BANNERS, self.collect)
+        invalidation_bus.subscribe(TOPIC_POSITIONS, self.collect)
+
+    def teardown_method(self):
+        invalidation_bus.unsubscribe(TOPIC_BANNERS, self.collect)
+        invalidation_bus.unsubscribe(TOPIC_POSITIONS, self.collect)
+
+    def active_ids(self):
+        from sqlalchemy import select
+        with self.engine.connect() as conn:
+            return set(conn.execute(select(self.banners.c.id).where(self.banners.c.is_active == True)).scalars())
+
+    def sweep(self, **kwargs):
+        sweeper = ExpirySweeper(batch_size=2, default_duration_days=7, engine=self.engine, **kwargs)
+        with count_queries(self.engine) as statements:
+            expired = sweeper.sweep(self.now)
+        return sweeper, expired, statements
+
+    def test_batches_use_update_returning(self):
+        """Each batch is a single UPDATE ... RETURNING limited to batch_size rows"""
+        sweeper, expired, statements = self.sweep()
+
+        assert expired == 7
+        assert self.active_ids() == {8, 10, 11}
+        assert len(statements) == 4
+        assert all(statement.startswith('UPDATE') and 'RETURNING' in statement for statement in statements)
+        assert sweeper.metrics()['last_expired'] == 7
+
+        banner_ids = sorted(i for topic, keys in self.published if topic == TOPIC_BANNERS for i in keys)
+        position_ids = set(i for topic, keys in self.published if topic == TOPIC_POSITIONS for i in keys)
+        assert banner_ids == [1, 2, 3, 4, 5, 6, 7]
+        assert position_ids == {10, 11, 30}
+        assert len(self.published) == 8
+
+    def test_fallback_without_returning(self, monkeypatch):
+        """Databases without RETURNING select each batch and update it in the same transaction"""
+        monkeypatch.setattr(self.engine.dialect, 'update_returning', False)
+        _, expired, statements = self.sweep()
+
+        assert expired == 7
+        assert self.active_ids() == {8, 10, 11}
+        assert [statement.split()[0] for statement in statements] == ['SELECT', 'UPDATE'] * 4
+        assert sorted(i for topic, keys in self.published if topic == TOPIC_BANNERS for i in keys) == list(range(1, 8))
+
+    def test_open_ended_banners_need_a_default_duration(self):
+        """Without DEFAULT_BANNER_DURATION_DAYS only banners past their end date expire"""
+        sweeper = ExpirySweeper(batch_size=10, engine=self.engine)
+        assert sweeper.sweep(self.now) == 5
+        assert self.active_ids() == {6, 7, 8, 10, 11}
+        assert sweeper.sweep(self.now) == 0
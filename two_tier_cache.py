@@ -0,0 +1,580 @@
+# -*- coding: utf-8 -*-
+"""
+Two-Tier Placement Cache - Naebak Project
+
+This module puts the per-process PlacementCache in front of a shared Redis tier.
+Reads are served from local memory when possible and fall back to Redis, so a
+response rendered by one gunicorn worker is reused by the others. Invalidations
+delete the tagged entries from Redis and are broadcast over Redis pub/sub, so
+every worker drops its local copies and the tiers stay coherent.
+
+Misses on the same key are coalesced: within a process through SingleFlight,
+and across workers through a short-lived Redis lock, so an expiry under load
+rebuilds each response once while other requests wait for it or are served the
+expired copy.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, Mapping, Optional
+
+from placement_cache import CachedResponse, PlacementCache
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIX = 'naebak:placements:'
+
+
+def _decode_tag(value) -> Hashable:
+    return tuple(value) if isinstance(value, list) else value
+
+
+class RedisTier:
+    """
+    Shared storage of serialized responses in Redis.
+
+    Each entry is a hash holding the body and its validators, and each tag is a
+    set of the entry keys carrying it, so invalidating a tag costs one SMEMBERS
+    and one DEL. Entries and tag sets expire with the TTL.
+
+    Invalidations also advance a shared generation counter and record it
+    against their tags, so a worker can tell whether a response it built was
+    invalidated meanwhile by any worker before writing it.
+
+    Attributes:
+        client: A redis-py client, or an InMemoryRedis stand-in.
+        prefix (str): The namespace for keys and the invalidation channel.
+        ttl (int): Seconds an entry is kept in Redis.
+    """
+
+    def __init__(self, client, prefix: str = DEFAULT_PREFIX, ttl: int = 300):
+        """
+        Initialize the tier.
+
+        Args:
+            client: A redis-py client, or an InMemoryRedis stand-in.
+            prefix (str): The namespace for keys and the invalidation channel.
+            ttl (int): Seconds an entry is kept in Redis.
+        """
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @property
+    def channel(self) -> str:
+        """The pub/sub channel for invalidation messages."""
+        return self.prefix + 'invalidate'
+
+    def entry_key(self, key: tuple) -> str:
+        """The Redis key of a cache key."""
+        return self.prefix + 'entry:' + hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+
+    def tag_key(self, tag: Hashable) -> str:
+        """The Redis key of a tag's member set."""
+        return self.prefix + 'tag:' + json.dumps(tag, separators=(',', ':'))
+
+    @property
+    def generation_key(self) -> str:
+        """The Redis key of the invalidation generation counter."""
+        return self.prefix + 'generation'
+
+    def tag_generation_key(self, tag: Hashable) -> str:
+        """The Redis key holding the generation a tag was last invalidated at."""
+        return self.tag_key(tag) + ':generation'
+
+    def lock_key(self, key: tuple) -> str:
+        """The Redis key of a cache key's rebuild lock."""
+        return self.entry_key(key) + ':lock'
+
+    def acquire(self, key: tuple, token: str, ttl: float) -> bool:
+        """
+        Takes the rebuild lock of a cache key.
+
+        Args:
+            key (tuple): The cache key.
+            token (str): Identifies the holder.
+            ttl (float): Seconds after which the lock frees itself.
+
+        Returns:
+            bool: True if the lock was taken.
+        """
+        return bool(self.client.set(self.lock_key(key), token, px=int(ttl * 1000), nx=True))
+
+    def release(self, key: tuple, token: str):
+        """
+        Frees the rebuild lock of a cache key if it is still held by token.
+
+        Args:
+            key (tuple): The cache key.
+            token (str): Identifies the holder.
+        """
+        # Not atomic, but the lock outlives any build that finishes in time
+        lock_key = self.lock_key(key)
+        if self.client.get(lock_key) == token.encode('utf-8'):
+            self.client.delete(lock_key)
+
+    def generation(self) -> int:
+        """
+        Returns the current invalidation generation.
+
+        Returns:
+            int: The generation, to be taken before building an entry.
+        """
+        return int(self.client.get(self.generation_key) or 0)
+
+    def invalidated_since(self, generation: int, tags: Iterable[Hashable]) -> bool:
+        """
+        Checks whether any of the tags was invalidated after a generation.
+
+        Args:
+            generation (int): A value returned by generation().
+            tags (Iterable[Hashable]): The tags of the built entry.
+
+        Returns:
+            bool: True if the entry should not be stored.
+        """
+        keys = [self.generation_key + ':cleared', *(self.tag_generation_key(tag) for tag in tags)]
+        return any(int(value) > generation for value in self.client.mget(keys) if value is not None)
+
+    def get(self, key: tuple) -> Optional[Dict[str, object]]:
+        """
+        Fetches an entry.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            Optional[Dict[str, object]]: The body, validators, banner IDs and tags,
+            or None if missing.
+        """
+        data = self.client.hgetall(self.entry_key(key))
+        if not data:
+            return None
+        meta = json.loads(data[b'meta'])
+        return {
+            'body': data[b'body'],
+            'etag': meta['etag'],
+            'last_modified': datetime.fromisoformat(meta['last_modified']) if meta['last_modified'] else None,
+            'banner_ids': tuple(meta['banner_ids']),
+            'tags': frozenset(_decode_tag(tag) for tag in meta['tags'])
+        }
+
+    def put(self, key: tuple, entry: CachedResponse):
+        """
+        Stores an entry and indexes it under its tags.
+
+        Args:
+            key (tuple): The cache key.
+            entry (CachedResponse): The entry.
+        """
+        entry_key = self.entry_key(key)
+        meta = json.dumps({
+            'etag': entry.etag,
+            'last_modified': entry.last_modified.isoformat() if entry.last_modified else None,
+            'banner_ids': list(entry.banner_ids),
+            'tags': [list(tag) if isinstance(tag, tuple) else tag for tag in entry.tags]
+        }, separators=(',', ':'))
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(entry_key, mapping={'body': entry.body, 'meta': meta})
+        pipe.expire(entry_key, self.ttl)
+        for tag in entry.tags:
+            tag_key = self.tag_key(tag)
+            pipe.sadd(tag_key, entry_key)
+            pipe.expire(tag_key, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, tags: Iterable[Hashable]) -> int:
+        """
+        Deletes the entries carrying any of the tags.
+
+        Args:
+            tags (Iterable[Hashable]): The tags.
+
+        Returns:
+            int: The number of keys deleted.
+        """
+        tags = list(tags)
+        generation = self.client.incr(self.generation_key)
+        pipe = self.client.pipeline(transaction=False)
+        for tag in tags:
+            # Expires with the entries; a build never takes as long as the TTL
+            pipe.set(self.tag_generation_key(tag), generation, ex=self.ttl)
+        pipe.execute()
+
+        removed = 0
+        for tag in tags:
+            tag_key = self.tag_key(tag)
+            members = self.client.smembers(tag_key)
+            removed += self.client.delete(tag_key, *members)
+        return removed
+
+    def clear(self) -> int:
+        """
+        Deletes every entry and tag set.
+
+        The generation counter is kept and advanced, so builds in progress are
+        not stored.
+
+        Returns:
+            int: The number of keys deleted.
+        """
+        generation_key = self.generation_key.encode('utf-8')
+        keys = [key for key in self.client.scan_iter(match=self.prefix + '*', count=500)
+                if key != generation_key]
+        removed = self.client.delete(*keys) if keys else 0
+        self.client.set(self.generation_key + ':cleared', self.client.incr(self.generation_key))
+        return removed
+
+
+class TwoTierCache:
+    """
+    Process-local LRU in front of an optional shared Redis tier.
+
+    It offers the same get/put/invalidate/clear interface as PlacementCache.
+    Without a remote tier it is a plain local cache. A local miss that hits
+    Redis is copied into local memory for at most local_ttl seconds, so a
+    worker that misses an invalidation message serves stale data for no longer
+    than that. Redis errors are logged and counted, and the cache keeps working
+    from local memory.
+
+    A rebuilt response is written to neither tier if any of its tags was
+    invalidated, in this worker or another, after the rebuild started. It
+    is still returned to the request that built it.
+
+    Attributes:
+        local (PlacementCache): The per-process tier.
+        remote (Optional[RedisTier]): The shared tier.
+        local_ttl (float): Seconds an entry copied from Redis stays local.
+        build_timeout (float): Seconds a request waits for another one's rebuild
+            before building the response itself; also the rebuild lock's lifetime.
+        instance_id (str): Identifies this process's own broadcasts.
+        flights (SingleFlight): The rebuilds in progress in this process.
+    """
+
+    def __init__(self, local: Optional[PlacementCache] = None, remote: Optional[RedisTier] = None,
+                 local_ttl: float = 30, build_timeout: float = 5):
+        """
+        Initialize the cache.
+
+        Args:
+            local (Optional[PlacementCache]): The per-process tier.
+            remote (Optional[RedisTier]): The shared tier.
+            local_ttl (float): Seconds an entry copied from Redis stays local.
+            build_timeout (float): Seconds a request waits for another one's rebuild.
+        """
+        self.local = local or PlacementCache()
+        self.remote = remote
+        self.local_ttl = local_ttl
+        self.build_timeout = build_timeout
+        self.instance_id = uuid.uuid4().hex
+        self.flights = SingleFlight()
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.remote_hits = 0
+        self.remote_errors = 0
+        self.messages_received = 0
+        self.builds = 0
+        self.stale_served = 0
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        """
+        Returns an entry from local memory, or from Redis on a local miss.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            Optional[CachedResponse]: The entry, or None if neither tier has it.
+        """
+        entry = self.local.get(key)
+        if entry is not None or self.remote is None:
+            return entry
+
+        generation = self.local.generation
+        try:
+            data = self.remote.get(key)
+        except Exception as e:
+            self._remote_failed('read', e)
+            return None
+        if data is None:
+            return None
+
+        self.remote_hits += 1
+        entry = CachedResponse(expires_at=self.local.clock() + min(self.local_ttl, self.local.ttl), **data)
+        self.local.store(key, entry, generation)
+        return entry
+
+    def put(self, key: tuple, body: bytes, tags: Iterable[Hashable] = (),
+            banner_ids: Iterable[int] = (), last_modified: Optional[datetime] = None,
+            ttl: Optional[float] = None, generation: Optional[tuple] = None) -> CachedResponse:
+        """
+        Stores a serialized response in both tiers.
+
+        Args:
+            key (tuple): The cache key.
+            body (bytes): The JSON body.
+            tags (Iterable[Hashable]): The tags to invalidate the entry by.
+            banner_ids (Iterable[int]): The banners in the response, in order.
+            last_modified (Optional[datetime]): When the response content last changed.
+            ttl (Optional[float]): Overrides the local TTL.
+            generation (Optional[tuple]): The generation() taken before the response
+                was built. If any of its tags was invalidated since, nothing is stored.
+
+        Returns:
+            CachedResponse: The entry, whether or not it was stored.
+        """
+        entry = self.local.entry(body, tags, banner_ids, last_modified, ttl)
+        local_generation, remote_generation = generation or (None, None)
+        if remote_generation is not None:
+            try:
+                if self.remote.invalidated_since(remote_generation, entry.tags):
+                    self.local.discarded += 1
+                    return entry
+            except Exception as e:
+                self._remote_failed('read', e)
+        if self.local.store(key, entry, local_generation) is None:
+            return entry
+        if self.remote is not None:
+            try:
+                self.remote.put(key, entry)
+            except Exception as e:
+                self._remote_failed('write', e)
+        return entry
+
+    def get_or_build(self, key: tuple, build: Callable[[], Optional[Mapping[str, Any]]]) -> Optional[CachedResponse]:
+        """
+        Returns an entry, building it once for all concurrent requests on a miss.
+
+        The first request to miss a key builds it. Others arriving meanwhile are
+        served the expired entry if it is still within its stale period, and
+        otherwise wait for the build. Across workers, only the holder of the
+        key's Redis lock builds; the others serve the stale entry or wait for
+        the built one to appear in Redis. If a build fails while a stale entry
+        exists, the stale entry is served.
+
+        Args:
+            key (tuple): The cache key.
+            build (Callable[[], Optional[Mapping[str, Any]]]): Returns the put()
+                arguments (body, tags, banner_ids, last_modified, ttl), or None
+                if the response should not be cached.
+
+        Returns:
+            Optional[CachedResponse]: The entry, or None if build returned None.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        stale = self.local.get_stale(key)
+        flight, leader = self.flights.begin(key)
+        if not leader:
+            if stale is not None:
+                self.stale_served += 1
+                return stale
+            return self.flights.wait(flight, lambda: self._build(key, build), self.build_timeout)
+
+        try:
+            entry = self._build_shared(key, build, stale)
+        except Exception as e:
+            self.flights.finish(key, flight, stale, None if stale is not None else e)
+            if stale is None:
+                raise
+            logger.warning(f"Placement rebuild failed, serving stale entry: {str(e)}")
+            self.stale_served += 1
+            return stale
+        self.flights.finish(key, flight, entry)
+        return entry
+
+    def generation(self) -> tuple:
+        """
+        Returns the invalidation generation of both tiers, to pass to put().
+
+        Returns:
+            tuple: The local generation and the shared one, or None for the
+            shared one when there is no remote tier or it cannot be read.
+        """
+        remote_generation = None
+        if self.remote is not None:
+            try:
+                remote_generation = self.remote.generation()
+            except Exception as e:
+                self._remote_failed('read', e)
+        return self.local.generation, remote_generation
+
+    def invalidate(self, tags: Iterable[Hashable]) -> int:
+        """
+        Drops tagged entries from both tiers and tells the other workers.
+
+        Args:
+            tags (Iterable[Hashable]): The tags.
+
+        Returns:
+            int: The number of local entries removed.
+        """
+        tags = list(tags)
+        removed = self.local.invalidate(tags)
+        if self.remote is not None and tags:
+            try:
+                self.remote.invalidate(tags)
+                self._broadcast({'tags': [list(tag) if isinstance(tag, tuple) else tag for tag in tags]})
+            except Exception as e:
+                self._remote_failed('invalidate', e)
+        return removed
+
+    def clear(self):
+        """Drops every entry from both tiers and tells the other workers."""
+        self.local.clear()
+        if self.remote is not None:
+            try:
+                self.remote.clear()
+                self._broadcast({'all': True})
+            except Exception as e:
+                self._remote_failed('clear', e)
+
+    def start(self):
+        """Starts listening for other workers' invalidation messages."""
+        if self.remote is None or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name='placement-cache-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the listener thread."""
+        self._stop.set()
+
+    def subscribe(self, callback: Callable[[list], None]):
+        """
+        Registers a callback for invalidations received from other workers.
+
+        Lets other per-process state that follows the same writes (e.g. the
+        activation timeline's live set) catch up without waiting for a resync.
+
+        Args:
+            callback (Callable[[list], None]): Called with the invalidated tags,
+                or an empty list when another worker cleared the cache.
+        """
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def handle_message(self, data: bytes):
+        """
+        Applies an invalidation message from another worker to local memory.
+
+        Args:
+            data (bytes): The JSON message.
+        """
+        message = json.loads(data)
+        if message.get('origin') == self.instance_id:
+            return
+        self.messages_received += 1
+        if message.get('all'):
+            tags = []
+            self.local.clear()
+        else:
+            tags = [_decode_tag(tag) for tag in message.get('tags', ())]
+            self.local.invalidate(tags)
+
+        for callback in list(self._listeners):
+            try:
+                callback(tags)
+            except Exception as e:
+                logger.error(f"Error in placement cache invalidation listener: {str(e)}")
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        Returns counters for both tiers.
+
+        Returns:
+            Dict[str, object]: Local cache metrics plus Redis hits, errors and messages.
+        """
+        return {
+            'local': self.local.metrics(),
+            'remote': {
+                'enabled': self.remote is not None,
+                'hits': self.remote_hits,
+                'errors': self.remote_errors,
+                'messages_received': self.messages_received
+            },
+            'rebuilds': dict(self.flights.metrics(), builds=self.builds, stale_served=self.stale_served)
+        }
+
+    def _build(self, key: tuple, build: Callable[[], Optional[Mapping[str, Any]]]) -> Optional[CachedResponse]:
+        self.builds += 1
+        generation = self.generation()
+        result = build()
+        return None if result is None else self.put(key, generation=generation, **result)
+
+    def _build_shared(self, key: tuple, build: Callable[[], Optional[Mapping[str, Any]]],
+                      stale: Optional[CachedResponse]) -> Optional[CachedResponse]:
+        if self.remote is None:
+            return self._build(key, build)
+
+        token = self.instance_id + ':' + uuid.uuid4().hex
+        try:
+            locked = self.remote.acquire(key, token, self.build_timeout)
+        except Exception as e:
+            self._remote_failed('lock', e)
+            return self._build(key, build)
+
+        if locked:
+            try:
+                return self._build(key, build)
+            finally:
+                try:
+                    self.remote.release(key, token)
+                except Exception as e:
+                    self._remote_failed('unlock', e)
+
+        # Another worker is rebuilding
+        if stale is not None:
+            self.stale_served += 1
+            return stale
+        deadline = time.monotonic() + self.build_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self.get(key)
+            if entry is not None:
+                return entry
+        self.flights.timeouts += 1
+        return self._build(key, build)
+
+    def _broadcast(self, message: dict):
+        message['origin'] = self.instance_id
+        self.remote.client.publish(self.remote.channel, json.dumps(message, separators=(',', ':')))
+
+    def _remote_failed(self, operation: str, error: Exception):
+        self.remote_errors += 1
+        logger.warning(f"Placement cache Redis {operation} failed: {str(error)}")
+
+    def _listen(self):
+        pubsub = None
+        while not self._stop.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self.remote.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self.remote.channel)
+                message = pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message.get('type') == 'message':
+                    self.handle_message(message['data'])
+            except Exception as e:
+                # A lost subscription means missed invalidations; drop local copies
+                self._remote_failed('subscribe', e)
+                self.local.clear()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+                    pubsub = None
+                self._stop.wait(1.0)
+        if pubsub is not None:
+            pubsub.close()